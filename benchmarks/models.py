@@ -0,0 +1,130 @@
+"""
+Synthetic surrogate models for the benchmarks. The models mimic the battery surrogates of the MeMoBuilder (one
+external input, one virtual state fed back from an output), so that no memodb files are needed. All models are
+generated from fixed seeds and are identical in every run.
+
+The same regression model is provided in two forms: as model description for the v2 engine
+(:mod:`memosim.simulation_v2`) and as metamodel with the interface of :class:`memotrainer.metamodels.MetaModel` for
+the v1 engine (:mod:`memosim.simulation_v1`). The v1 metamodels evaluate the regression model like the former
+memotrainer models did, i.e. with one NumPy or sklearn call per prediction.
+"""
+import warnings
+from types import SimpleNamespace
+
+import numpy as np
+
+import memosim.simulation_v2 as sim
+
+
+INPUT_NAMES = ['P_el_set', 'soc']
+"""
+Regression inputs of all models: the external input and the virtual state.
+"""
+
+RESPONSE_NAMES = ['P_el', 'SoC']
+"""
+Regression responses of all models, in the order of the model outputs.
+"""
+
+KERNELS = ['linear', 'polynomial', 'sigmoid', 'rbf']
+
+
+def model_structure():
+    return SimpleNamespace(
+        model_parameters=['capacity', 'init_SoC'],
+        model_inputs=['P_el_set'],
+        model_outputs=list(RESPONSE_NAMES),
+        virtual_states=[SimpleNamespace(name='soc', init_attribute='init_SoC', update_attribute='SoC')])
+
+
+def init_vals():
+    return {'capacity': 1.0, 'init_SoC': 0.5}
+
+
+def ols_description():
+    # contracting, so that long runs stay bounded
+    return SimpleNamespace(intercept=np.array([0.0, 0.1]), coefs=np.array([[1.0, 0.0], [0.01, 0.5]]))
+
+
+def krr_description(kernel, num_samples):
+    rnd = np.random.RandomState(num_samples)
+    # the dual coefficients are scaled, so that the responses stay in the range of the training inputs
+    return SimpleNamespace(kernel=kernel, gamma=0.5, degree=2, coef0=1.0,
+                           X_fit=rnd.uniform(-1, 1, (num_samples, len(INPUT_NAMES))),
+                           dual_coef=rnd.normal(scale=1.0 / num_samples, size=(num_samples, len(RESPONSE_NAMES))))
+
+
+def generic_description():
+    from sklearn.exceptions import ConvergenceWarning
+    from sklearn.neural_network import MLPRegressor
+    rnd = np.random.RandomState(0)
+    X = rnd.uniform(-1, 1, (200, len(INPUT_NAMES)))
+    y = np.column_stack([X[:, 0], 0.1 + 0.01 * X[:, 0] + 0.5 * X[:, 1]])
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', ConvergenceWarning)
+        estimator = MLPRegressor(hidden_layer_sizes=(16, 16), max_iter=200, random_state=0).fit(X, y)
+    return SimpleNamespace(sklearn_estimator=estimator)
+
+
+def create_description(model, num_samples=None):
+    """
+    :param model: str, 'ols', 'generic' or 'krr-<kernel>' (see :data:`KERNELS`).
+
+    :param num_samples: int, number of training samples (rows of X_fit) of kernel ridge regression models.
+
+    :return: the model description of the v2 engine.
+    """
+    if model == 'ols':
+        return ols_description()
+    if model == 'generic':
+        return generic_description()
+    if model.startswith('krr-') and model[4:] in KERNELS:
+        return krr_description(model[4:], num_samples)
+    raise Exception('Unknown benchmark model: %s' % model)
+
+
+def create_v2_simulator(description):
+    """
+    :return: a new :class:`~memosim.simulation_v2.RegressionModelSimulator` for the description.
+    """
+    if hasattr(description, 'sklearn_estimator'):
+        return sim.GenericModelSimulator(description)
+    if hasattr(description, 'coefs'):
+        return sim.OLSModel(description)
+    return sim.KernelRidgeRegressionSimulator(description)
+
+
+class ArrayMetaModel(object):
+    """
+    A metamodel with the interface of :class:`memotrainer.metamodels.MetaModel`, that evaluates a function of the
+    input matrix.
+
+    :param function: callable(X), maps a (samples x inputs) matrix to a (samples x responses) matrix.
+    """
+
+    def __init__(self, function):
+        self.input_names = list(INPUT_NAMES)
+        self.response_names = list(RESPONSE_NAMES)
+        self.function = function
+
+    def predict(self, X):
+        y = self.function(np.asarray(X, dtype=float))
+        return {name: y[:, idx] for idx, name in enumerate(self.response_names)}
+
+
+def create_v1_metamodel(description):
+    """
+    :return: an :class:`ArrayMetaModel` for the description, that computes the same responses as the v2 engine.
+    """
+    if hasattr(description, 'sklearn_estimator'):
+        estimator = description.sklearn_estimator
+        return ArrayMetaModel(lambda X: np.reshape(estimator.predict(X), (len(X), -1)))
+    if hasattr(description, 'coefs'):
+        return ArrayMetaModel(lambda X: description.intercept + X.dot(description.coefs.T))
+    kernel_function = getattr(sim.KernelRidgeRegressionSimulator, '%s_kernel' % description.kernel)
+
+    def krr(X):
+        K = kernel_function(X, description.X_fit, degree=description.degree, gamma=description.gamma,
+                            coef0=description.coef0)
+        return K.dot(description.dual_coef)
+    return ArrayMetaModel(krr)
@@ -0,0 +1,436 @@
+"""
+Benchmarks of the simulation engines with the synthetic models of :mod:`benchmarks.models`. Each case simulates a
+number of entities of one model with one engine and measures:
+
+* create: the time to create and initialize all entities,
+* step: the time of one simulation step of all entities, including setting their external inputs,
+* get_data: the time to read all outputs of all entities as mosaik get_data response,
+* memory: the peak of memory allocated (traced by :mod:`tracemalloc`) while creating the entities and running one
+  step.
+
+Each time is the minimum of several samples, which is least affected by other load on the machine. Fast operations
+are repeated within a sample, until the sample takes at least :data:`MIN_SAMPLE_TIME`, so that all samples are well
+above the resolution of the timer. The engines are:
+
+* v1: one :class:`memosim.simulation_v1.SurrogateModelSimulator` per entity,
+* v1-trusted: one :class:`memosim.simulation_v1.TrustedSurrogateModelSimulator` per entity,
+* v1-batched: one :class:`memosim.simulation_v1.SurrogateModelSimulator` per entity, stepped together by
+  :func:`memosim.simulation_v1.step_surrogates` like in the v1 mosaik adapter,
+* v1-lowered: the v1 surrogate lowered onto a population (see :mod:`memosim.lowering_v2`),
+* v2: one :class:`memosim.simulation_v2.RegressionModelSimulator` per entity,
+* population: one :class:`memosim.population_v2.PopulationSimulator` for all entities.
+
+The results are compared to a stored baseline, which should be recorded on the machine, that runs the comparison.
+Every run also measures a fixed calibration workload. With ``--scale``, times are scaled by the ratio of the
+calibration times, so that baselines of other machines remain roughly comparable. Run from the root of the
+repository::
+
+    python -m benchmarks.run                        # quick suite, compared to benchmarks/baseline.json
+    python -m benchmarks.run --suite full           # 1 to 100k entities, 100 to 50k samples
+    python -m benchmarks.run --save benchmarks/baseline.json
+
+The exit status is 1, if a case is slower or needs more memory than its baseline allows. Times are compared
+relative to the baseline only, regardless of their magnitude.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+import memosim.simulation_v2 as sim
+from memosim import lowering_v2
+from memosim.mosaik_v2 import GetDataPlan
+from memosim.population_v2 import PopulationSimulator
+from memosim.simulation_v1 import SurrogateModelSimulator, TrustedSurrogateModelSimulator, step_surrogates
+from benchmarks import models
+
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+SUITES = {
+    'quick': {'entities': [1, 100, 1000], 'samples': [100, 1000]},
+    'full': {'entities': [1, 100, 1000, 10000, 100000], 'samples': [100, 1000, 10000, 50000]},
+}
+
+MODELS = ['ols', 'generic'] + ['krr-%s' % kernel for kernel in models.KERNELS]
+
+TIME_METRICS = ['create', 'step', 'get_data']
+
+MIN_SAMPLE_TIME = 0.02
+"""
+Minimum duration (seconds) of one timing sample. Operations, that are faster, are repeated within a sample and their
+time is the duration of the sample divided by the number of repetitions.
+"""
+
+MEMORY_NOISE_FLOOR = 2 ** 16
+"""
+Absolute slack (bytes) of memory comparisons.
+"""
+
+
+def eids(num_entities):
+    return ['memo_%d' % i for i in range(num_entities)]
+
+
+class V1Engine(object):
+
+    simulator_class = SurrogateModelSimulator
+
+    def __init__(self, description):
+        self.metamodels = [models.create_v1_metamodel(description)]
+        self.entities = {}
+
+    def create(self, num_entities):
+        structure = models.model_structure()
+        for eid in eids(num_entities):
+            entity = self.simulator_class(structure, self.metamodels)
+            entity.init(**models.init_vals())
+            self.entities[eid] = entity
+
+    def step(self, inputs):
+        for entity, value in zip(self.entities.values(), inputs.tolist()):
+            entity['P_el_set'] = value
+        for entity in self.entities.values():
+            entity.step()
+
+    def get_data(self, outputs):
+        return {eid: {attr: self.entities[eid][attr] for attr in attrs} for eid, attrs in outputs.items()}
+
+
+class TrustedV1Engine(V1Engine):
+
+    simulator_class = TrustedSurrogateModelSimulator
+
+
+class BatchedV1Engine(V1Engine):
+
+    def step(self, inputs):
+        for entity, value in zip(self.entities.values(), inputs.tolist()):
+            entity['P_el_set'] = value
+        step_surrogates(list(self.entities.values()))
+
+
+class LoweredV1Engine(object):
+
+    def __init__(self, description):
+        self.metamodels = [models.create_v1_metamodel(description)]
+        self.lowered = None
+        self.entity_rows = {}
+        self.plan = None
+
+    def create(self, num_entities):
+        self.lowered = lowering_v2.lower_surrogate(models.model_structure(), self.metamodels)
+        rows = self.lowered.add_entities(num_entities, models.init_vals())
+        self.entity_rows.update(zip(eids(num_entities), rows))
+
+    def step(self, inputs):
+        self.lowered.population.external_inputs[:, 0] = inputs
+        self.lowered.population.step()
+
+    def get_data(self, outputs):
+        if self.plan is None or not self.plan.matches(outputs):
+            self.plan = GetDataPlan(outputs, self.entity_rows, self.lowered.output_indices)
+        return self.plan.fill(self.lowered.population)
+
+
+class V2Engine(object):
+
+    def __init__(self, description):
+        self.description = description
+        self.entities = {}
+
+    def create(self, num_entities):
+        structure = models.model_structure()
+        for eid in eids(num_entities):
+            simulator = models.create_v2_simulator(self.description)
+            sim.RegressionModelFactory.create_structure(simulator, structure)
+            sim.RegressionModelFactory.setup_initial_state(simulator, structure, models.init_vals())
+            self.entities[eid] = simulator
+
+    def step(self, inputs):
+        for simulator, value in zip(self.entities.values(), inputs.tolist()):
+            simulator.external_inputs[0] = value
+            simulator.step()
+
+    def get_data(self, outputs):
+        return {eid: {attr: self.entities[eid].output_accessors[attr].run() for attr in attrs}
+                for eid, attrs in outputs.items()}
+
+
+class PopulationEngine(object):
+
+    def __init__(self, description):
+        self.description = description
+        self.population = None
+        self.entity_rows = {}
+        self.plan = None
+
+    def create(self, num_entities):
+        simulator = models.create_v2_simulator(self.description)
+        self.population = PopulationSimulator(simulator, models.model_structure())
+        rows = self.population.add_entities(num_entities, models.init_vals())
+        self.entity_rows.update(zip(eids(num_entities), rows))
+
+    def step(self, inputs):
+        self.population.external_inputs[:, 0] = inputs
+        self.population.step()
+
+    def get_data(self, outputs):
+        if self.plan is None or not self.plan.matches(outputs):
+            self.plan = GetDataPlan(outputs, self.entity_rows, self.population.output_indices,
+                                    self.population.state.dtype)
+        return self.plan.fill(self.population)
+
+
+ENGINES = {'v1': V1Engine, 'v1-trusted': TrustedV1Engine, 'v1-batched': BatchedV1Engine,
+           'v1-lowered': LoweredV1Engine, 'v2': V2Engine, 'population': PopulationEngine}
+
+PER_ENTITY_ENGINES = ['v1', 'v1-trusted', 'v1-batched', 'v2']
+
+
+def case_name(engine, model, num_entities, num_samples=None):
+    name = '%s/%s/%d' % (engine, model, num_entities)
+    if num_samples is not None:
+        name += '/%d' % num_samples
+    return name
+
+
+def inner_iterations(duration, min_sample_time=MIN_SAMPLE_TIME):
+    """
+    :param duration: float, the estimated time (seconds) of one operation.
+
+    :return: int, the number of repetitions of the operation per sample, so that a sample takes at least
+        *min_sample_time*.
+    """
+    return max(1, int(np.ceil(min_sample_time / max(duration, 1e-9))))
+
+
+def time_samples(operation, number, repeats):
+    """
+    :param operation: callable(i), the measured operation, that is called with the index of the repetition.
+
+    :return: float, the minimum over *repeats* samples of the time (seconds) of one operation. Each sample calls the
+        operation *number* times with disabled garbage collection (like :mod:`timeit`).
+    """
+    best = float('inf')
+    for _ in range(repeats):
+        gc.collect()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            for i in range(number):
+                operation(i)
+            best = min(best, (time.perf_counter() - start) / number)
+        finally:
+            gc.enable()
+    return best
+
+
+def measure(engine_class, description, num_entities, repeats=5, min_sample_time=MIN_SAMPLE_TIME):
+    """
+    Measures one case.
+
+    :param engine_class: one of :data:`ENGINES`.
+
+    :param description: the model description (see :func:`benchmarks.models.create_description`).
+
+    :param num_entities: int, number of simulated entities.
+
+    :param repeats: int, number of timing samples per metric.
+
+    :param min_sample_time: float, minimum duration (seconds) of one timing sample.
+
+    :return: dict<str, float>, the metrics of the case (seconds and bytes).
+    """
+    schedule = np.random.RandomState(num_entities).uniform(-1, 1, (16, num_entities))
+    outputs = {eid: list(models.RESPONSE_NAMES) for eid in eids(num_entities)}
+
+    # creations are repeated with separate engines, because entities can be created only once per engine
+    start = time.perf_counter()
+    engine_class(description).create(num_entities)
+    number = inner_iterations(time.perf_counter() - start, min_sample_time)
+    metrics = {'create': float('inf')}
+    for _ in range(repeats):
+        engines = [engine_class(description) for _ in range(number)]
+        metrics['create'] = min(metrics['create'], time_samples(lambda i: engines[i].create(num_entities), number, 1))
+        del engines
+
+    engine = engine_class(description)
+    engine.create(num_entities)
+    # the first step and request allocate buffers and plans, they are not measured
+    operations = [('step', lambda i: engine.step(schedule[i % len(schedule)])),
+                  ('get_data', lambda i: engine.get_data(outputs))]
+    for name, operation in operations:
+        operation(0)
+        start = time.perf_counter()
+        operation(1)
+        number = inner_iterations(time.perf_counter() - start, min_sample_time)
+        metrics[name] = time_samples(operation, number, repeats)
+    del engine
+
+    # memory is measured in a separate run, because tracing slows down allocations
+    tracemalloc.start()
+    try:
+        engine = engine_class(description)
+        engine.create(num_entities)
+        engine.step(schedule[0])
+        engine.get_data(outputs)
+        metrics['memory'] = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return metrics
+
+
+def calibrate(repeats=5):
+    """
+    :return: float, the time (seconds) of a fixed mix of interpreter and NumPy work on this machine.
+    """
+    matrix = np.random.RandomState(0).uniform(size=(200, 200))
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        values = {}
+        for i in range(20000):
+            values[i % 100] = i * 0.5
+        for _ in range(20):
+            matrix.dot(matrix)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def cases(suite, engines=None, model_names=None, per_entity_limit=10000):
+    """
+    Generates the cases of a suite.
+
+    :param suite: dict, with the lists 'entities' and 'samples' (see :data:`SUITES`).
+
+    :param per_entity_limit: int, maximum number of entities of the engines, that simulate each entity separately.
+
+    :return: generator of (name, engine, model, number of entities, number of samples) tuples. The number of
+        samples is None for models without training samples.
+    """
+    for model in model_names or MODELS:
+        sample_counts = suite['samples'] if model.startswith('krr-') else [None]
+        for num_samples in sample_counts:
+            for engine in engines or ENGINES:
+                for num_entities in suite['entities']:
+                    if engine in PER_ENTITY_ENGINES and num_entities > per_entity_limit:
+                        continue
+                    yield case_name(engine, model, num_entities, num_samples), engine, model, num_entities, num_samples
+
+
+def run_suite(suite, engines=None, model_names=None, repeats=5, per_entity_limit=10000,
+              min_sample_time=MIN_SAMPLE_TIME, log=None):
+    """
+    Runs all cases of a suite.
+
+    :param log: callable(str), optional, receives a line per measured case.
+
+    :return: dict, the results: the calibration time, a description of the environment and the metrics of all cases.
+    """
+    results = {'calibration': calibrate(), 'environment': environment(), 'cases': {}}
+    descriptions = {}
+    for name, engine, model, num_entities, num_samples in cases(suite, engines, model_names, per_entity_limit):
+        if (model, num_samples) not in descriptions:
+            descriptions = {(model, num_samples): models.create_description(model, num_samples)}
+        metrics = measure(ENGINES[engine], descriptions[(model, num_samples)], num_entities, repeats,
+                          min_sample_time)
+        results['cases'][name] = metrics
+        if log is not None:
+            log(format_metrics(name, metrics))
+    return results
+
+
+def environment():
+    return {'python': platform.python_version(), 'numpy': np.__version__, 'machine': platform.machine(),
+            'compiled_kernels': sim.kernels.COMPILED}
+
+
+def format_metrics(name, metrics):
+    return '%-40s create %10.3f ms  step %10.3f ms  get_data %10.3f ms  memory %10.1f KiB' % (
+        name, 1e3 * metrics['create'], 1e3 * metrics['step'], 1e3 * metrics['get_data'], metrics['memory'] / 1024)
+
+
+def compare(results, baseline, time_tolerance=2.0, memory_tolerance=1.25, scale=False):
+    """
+    Compares the results of a run to a baseline. Cases, that are missing in the baseline, are not compared.
+
+    :param time_tolerance: float, maximum ratio of a time to its baseline.
+
+    :param memory_tolerance: float, maximum ratio of the memory to its baseline.
+
+    :param scale: bool, whether times are scaled by the ratio of the calibration times of results and baseline.
+
+    :return: list of (case, metric, baseline value, allowed value, measured value) tuples, the regressions.
+    """
+    factor = results['calibration'] / baseline['calibration'] if scale else 1.0
+    regressions = []
+    for name, metrics in sorted(results['cases'].items()):
+        reference = baseline['cases'].get(name)
+        if reference is None:
+            continue
+        for metric in TIME_METRICS:
+            allowed = reference[metric] * factor * time_tolerance
+            if metrics[metric] > allowed:
+                regressions.append((name, metric, reference[metric], allowed, metrics[metric]))
+        allowed = reference['memory'] * memory_tolerance + MEMORY_NOISE_FLOOR
+        if metrics['memory'] > allowed:
+            regressions.append((name, 'memory', reference['memory'], allowed, metrics['memory']))
+    return regressions
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Benchmarks of the memosim simulation engines.')
+    parser.add_argument('--suite', choices=sorted(SUITES), default='quick')
+    parser.add_argument('--engines', nargs='+', choices=sorted(ENGINES))
+    parser.add_argument('--models', nargs='+', choices=MODELS)
+    parser.add_argument('--repeats', type=int, default=5, help='number of timing samples per metric')
+    parser.add_argument('--min-sample-time', type=float, default=MIN_SAMPLE_TIME,
+                        help='minimum duration (seconds) of a timing sample')
+    parser.add_argument('--per-entity-limit', type=int, default=10000,
+                        help='maximum number of entities of the per-entity engines')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='baseline to compare the results to')
+    parser.add_argument('--save', metavar='PATH', help='save the results as new baseline instead of comparing')
+    parser.add_argument('--output', metavar='PATH', help='additionally save the results to a file')
+    parser.add_argument('--time-tolerance', type=float, default=2.0)
+    parser.add_argument('--memory-tolerance', type=float, default=1.25)
+    parser.add_argument('--scale', action='store_true', help='scale times by the calibration times')
+    args = parser.parse_args(args)
+
+    results = run_suite(SUITES[args.suite], args.engines, args.models, args.repeats, args.per_entity_limit,
+                        args.min_sample_time, log=print)
+    for path in [args.output, args.save]:
+        if path is not None:
+            with open(path, 'w') as file:
+                json.dump(results, file, indent=1, sort_keys=True)
+    if args.save is not None:
+        return 0
+    if not os.path.exists(args.baseline):
+        print('No baseline found at %s, nothing compared.' % args.baseline)
+        return 0
+
+    with open(args.baseline) as file:
+        baseline = json.load(file)
+    regressions = compare(results, baseline, args.time_tolerance, args.memory_tolerance, args.scale)
+    compared = len(set(results['cases']) & set(baseline['cases']))
+    if len(regressions) == 0:
+        print('OK: %d cases within the tolerances of the baseline.' % compared)
+        return 0
+    print('=' * 80)
+    print('PERFORMANCE REGRESSION: %d of %d compared cases exceed the baseline' % (
+        len(set(r[0] for r in regressions)), compared))
+    for name, metric, reference, allowed, value in regressions:
+        print('  %-40s %-8s baseline %12.6g  allowed %12.6g  measured %12.6g  (x%.2f)' % (
+            name, metric, reference, allowed, value, value / reference if reference else float('inf')))
+    print('=' * 80)
+    return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,2 +1,2 @@
-from memosim.simulation_v1 import MetaModelSimulator, SurrogateModelSimulator
+from memosim.simulation_v1 import MetaModelSimulator, SurrogateModelSimulator, TrustedSurrogateModelSimulator
 from memosim.mosaik import MosaikMeMoSimulator
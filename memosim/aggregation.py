@@ -0,0 +1,189 @@
+"""
+Aggregation of mosaik inputs. Mosaik delivers the inputs of a step as dict of dicts, that maps EIDs and attributes
+to the values of all connected sources. An :class:`InputRouter` maps these (EID, attribute, source) triples to
+flat array slots once and reduces the values of all entities with one vectorized segment reduction per attribute.
+
+A reducer is a function ``reducer(values, offsets, out)``, that reduces each segment
+``values[offsets[i]:offsets[i+1]]`` into ``out[i]``. Reducers are referenced by name (see :data:`REDUCERS` and
+:func:`register_reducer`) or passed as callables.
+
+All input values are converted to floats, so inputs must be numbers.
+"""
+import itertools
+
+import numpy as np
+
+from memosim import kernels_v2 as kernels
+
+
+def _reduceat(ufunc, values, offsets, out):
+    # reduceat can not handle empty segments, they are set to NaN
+    nonempty = np.diff(offsets) > 0
+    out[:] = np.nan
+    if np.any(nonempty):
+        out[nonempty] = ufunc.reduceat(values, offsets[:-1][nonempty])
+    return out
+
+
+def mean_reducer(values, offsets, out):
+    kernels.sum_aggregate(values, offsets, out)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        out /= np.diff(offsets)
+    return out
+
+
+def min_reducer(values, offsets, out):
+    return _reduceat(np.minimum, values, offsets, out)
+
+
+def max_reducer(values, offsets, out):
+    return _reduceat(np.maximum, values, offsets, out)
+
+
+def last_reducer(values, offsets, out):
+    nonempty = np.diff(offsets) > 0
+    out[:] = np.nan
+    out[nonempty] = values[offsets[1:][nonempty] - 1]
+    return out
+
+
+REDUCERS = {
+    'sum': kernels.sum_aggregate,
+    'mean': mean_reducer,
+    'min': min_reducer,
+    'max': max_reducer,
+    'last': last_reducer,
+}
+"""
+Maps names to reducers. Empty segments are reduced to 0 by 'sum' and to NaN by all other reducers.
+"""
+
+
+def register_reducer(name, reducer):
+    """
+    Registers a custom reducer, so that it can be referenced by *name* (e.g. in the init parameters of the mosaik
+    simulators).
+
+    :param name: str
+
+    :param reducer: callable(values, offsets, out)
+    """
+    REDUCERS[name] = reducer
+
+
+def get_reducer(reducer):
+    """
+    :param reducer: str or callable
+
+    :return: callable, the reducer.
+    """
+    if callable(reducer):
+        return reducer
+    if reducer not in REDUCERS:
+        raise Exception('Unknown reducer: %s' % reducer)
+    return REDUCERS[reducer]
+
+
+class RoutingTable():
+    """
+    Maps the (EID, attribute, source) triples of one input structure to array slots. The values of each attribute
+    are gathered into consecutive segments (one per entity), which are reduced at once.
+
+    :param keys: list of (EID, attribute, number of sources) tuples in the iteration order of the inputs.
+
+    :param entity_rows: dict<str, int>, maps EIDs to rows.
+
+    :param columns: dict<str, int>, maps input attributes to columns.
+    """
+
+    def __init__(self, keys, entity_rows, columns):
+        self.keys = keys
+        counts = np.array([count for eid, attr, count in keys], dtype=np.intp)
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1])).astype(np.intp)
+        self.groups = []  # one (attribute, flat value indices, offsets, rows, column) tuple per attribute
+        for attr in sorted(set(attr for eid, attr, count in keys), key=lambda attr: columns[attr]):
+            segments = [i for i, key in enumerate(keys) if key[1] == attr]
+            positions = np.concatenate([np.arange(starts[i], starts[i] + counts[i]) for i in segments])
+            offsets = np.concatenate(([0], np.cumsum(counts[segments]))).astype(np.intp)
+            rows = np.array([entity_rows[keys[i][0]] for i in segments], dtype=np.intp)
+            self.groups.append((attr, positions.astype(np.intp), offsets, rows, columns[attr]))
+
+
+class InputRouter():
+    """
+    Aggregates mosaik inputs into an (entities x inputs) array. The routing table is compiled for the first step
+    and reused as long as the EIDs, their attributes and the numbers of their sources do not change (the names of
+    the sources do not matter, because the reducers only depend on the values). All values are converted to floats.
+
+    :param entity_rows: dict<str, int>, maps EIDs to rows. The dict may grow, when entities are created.
+
+    :param input_names: list<str>, the input attributes, in the order of the columns.
+
+    :param reducers: dict<str, object>, optional reducers (names or callables) of the input attributes. Inputs
+        without a reducer are summed up.
+    """
+
+    def __init__(self, entity_rows, input_names, reducers=None):
+        self.entity_rows = entity_rows
+        self.input_names = list(input_names)
+        self.columns = {attr: idx for idx, attr in enumerate(self.input_names)}
+        self.reducers = {attr: REDUCERS['sum'] for attr in self.input_names}
+        self.table = None
+        self.signature = None  # the structure of the inputs, for which the routing table was compiled
+        self.num_values = 0
+        for attr, reducer in (reducers or {}).items():
+            self.set_reducer(attr, reducer)
+
+    def set_reducer(self, attr, reducer):
+        """
+        Sets the reducer of input attribute *attr*.
+
+        :param reducer: str or callable(values, offsets, out)
+        """
+        if attr not in self.columns:
+            raise Exception('Unknown input attribute: %s' % attr)
+        self.reducers[attr] = get_reducer(reducer)
+
+    def aggregate(self, inputs):
+        """
+        Aggregates the inputs of one step.
+
+        :param inputs: dict of dicts mapping EIDs to attributes and dicts of values (see
+            :meth:`mosaik_api.Simulator.step`).
+
+        :return: list of (attribute, rows, column, values) tuples, the aggregated values of each attribute.
+        """
+        attr_dicts = inputs.values()
+        data_dicts = list(itertools.chain.from_iterable(map(dict.values, attr_dicts)))
+        # the structure of the inputs: EIDs, numbers of attributes, attributes and numbers of sources
+        signature = (list(inputs), list(map(len, attr_dicts)), list(itertools.chain.from_iterable(attr_dicts)),
+                     list(map(len, data_dicts)))
+        if self.table is None or signature != self.signature:
+            eids, num_attrs, attrs, counts = signature
+            unknown = set(attrs) - set(self.columns)
+            if len(unknown) > 0:
+                raise Exception('Unknown input attributes: %s' % ', '.join(sorted(unknown)))
+            pair_eids = itertools.chain.from_iterable(itertools.repeat(eid, num) for eid, num in zip(eids, num_attrs))
+            self.table = RoutingTable(list(zip(pair_eids, attrs, counts)), self.entity_rows, self.columns)
+            self.signature = signature
+            self.num_values = sum(counts)
+
+        try:
+            values = np.fromiter(itertools.chain.from_iterable(map(dict.values, data_dicts)), dtype=float,
+                                 count=self.num_values)
+        except (TypeError, ValueError):
+            raise Exception('Input values must be numbers.')
+        results = []
+        for attr, positions, offsets, rows, column in self.table.groups:
+            out = np.empty(len(rows))
+            self.reducers[attr](values[positions], offsets, out)
+            results.append((attr, rows, column, out))
+        return results
+
+    def apply(self, inputs, array):
+        """
+        Aggregates the inputs of one step and writes them into *array* (entities x inputs). Entries of entities and
+        attributes without inputs are not changed.
+        """
+        for attr, rows, column, values in self.aggregate(inputs):
+            array[rows, column] = values
@@ -0,0 +1,200 @@
+"""
+Approximate simulators for kernel ridge regression models. Exact kernel ridge regression costs O(samples x inputs)
+per entity and step, because the kernel has to be evaluated against every row of ``X_fit``. The simulators in this
+module trade accuracy for speed and report the approximation error they have measured on ``X_fit``.
+"""
+import numpy as np
+
+import memosim.simulation_v2 as sim
+from memosim import kernels_v2 as kernels
+
+
+class ApproximateKernelRidgeRegressionSimulator(sim.RegressionModelSimulator):
+    """
+    Converts a kernel ridge regression into a low-rank primal model when it is loaded. The responses are computed as
+    *features(x)* . *weights*, where *features(x)* has *rank* columns:
+
+    * ``'nystroem'``: the kernel between *x* and *rank* landmark rows of ``X_fit`` (supports all kernels).
+    * ``'rff'``: random Fourier features of the rbf kernel.
+
+    Linear kernels are always converted into their exact primal form.
+
+    :param regression_model_description: KernelRidgeRegressionModelDescription
+
+    :param method: str, ``'nystroem'`` or ``'rff'``.
+
+    :param rank: int, number of features. If *tolerance* is set, this is the initial rank.
+
+    :param tolerance: float, optional target for the maximum absolute error on ``X_fit``. The rank is doubled until
+        the target is met or *max_rank* is reached.
+
+    :param max_rank: int, upper bound of the rank, defaults to the number of samples in ``X_fit``.
+
+    :param random_state: int, seed for the selection of landmarks and random features.
+    """
+
+    def __init__(self, regression_model_description, method='nystroem', rank=100, tolerance=None, max_rank=None,
+                 random_state=0):
+        sim.RegressionModelSimulator.__init__(self)
+        self.exact = sim.KernelRidgeRegressionSimulator(regression_model_description)
+        self.method = method
+        if self.exact.kernel == 'linear':
+            self.method = 'primal'
+        elif method == 'rff' and self.exact.kernel != 'rbf':
+            raise Exception('Random Fourier features are only available for rbf kernels.')
+        elif method not in ['nystroem', 'rff']:
+            raise Exception('Unknown approximation method: %s' % (method))
+
+        num_samples = len(self.exact.X_fit)
+        self.max_rank = num_samples if max_rank is None else max_rank
+        self.rank = min(rank, self.max_rank) if self.method == 'nystroem' else rank
+        self.tolerance = tolerance
+        self._random = np.random.RandomState(random_state)
+        self._permutation = self._random.permutation(num_samples)
+
+        # exact responses on X_fit serve as reference for the measured approximation error
+        self._reference = self.exact.compute_batch_responses(self.exact.X_fit)
+        self._fit()
+        while tolerance is not None and self.approximation_error['max_abs'] > tolerance and \
+                self.method != 'primal' and self.rank < self.max_rank:
+            self.rank = min(2 * self.rank, self.max_rank)
+            self._fit()
+        del self._reference
+
+    def _fit(self):
+        exact = self.exact
+        if self.method == 'primal':
+            self.rank = exact.X_fit.shape[1]
+            self.weights = exact.X_fit.T.dot(exact._dual_coef)
+        elif self.method == 'nystroem':
+            self.landmarks = exact.X_fit[np.sort(self._permutation[:self.rank])]
+            self._landmark_sq_norms = np.einsum('ij,ij->i', self.landmarks, self.landmarks)
+            K_LL = self._features(self.landmarks)
+            K_LX = self._features(exact.X_fit).T
+            self.weights = np.linalg.pinv(K_LL, rcond=1e-10, hermitian=True).dot(K_LX.dot(exact._dual_coef))
+        else:
+            num_inputs = exact.X_fit.shape[1]
+            self.frequencies = self._random.normal(scale=np.sqrt(2 * exact.gamma), size=(num_inputs, self.rank))
+            self.phases = self._random.uniform(0, 2 * np.pi, size=self.rank)
+            self.weights = self._features(exact.X_fit).T.dot(exact._dual_coef)
+        self.approximation_error = self._measure_error()
+
+    def _measure_error(self):
+        deviation = self.compute_batch_responses(self.exact.X_fit) - self._reference
+        scale = np.max(np.abs(self._reference))
+        return {
+            'max_abs': float(np.max(np.abs(deviation))),
+            'rmse': float(np.sqrt(np.mean(deviation ** 2))),
+            'max_rel': float(np.max(np.abs(deviation)) / scale) if scale > 0 else 0.0,
+            'rank': self.rank,
+        }
+
+    def _features(self, inputs):
+        exact = self.exact
+        if self.method == 'primal':
+            return inputs
+        if self.method == 'nystroem':
+            out = np.empty((len(inputs), len(self.landmarks)))
+            return kernels.kernel_matrix(inputs, self.landmarks, self._landmark_sq_norms, exact._kernel_code,
+                                         exact.gamma, exact.coef0, exact.degree, out)
+        Z = np.dot(inputs, self.frequencies)
+        Z += self.phases
+        np.cos(Z, Z)
+        Z *= np.sqrt(2.0 / self.rank)
+        return Z
+
+    def compute_responses(self, inputs):
+        return self.compute_batch_responses(np.reshape(inputs, (1, -1)))[0]
+
+    def compute_batch_responses(self, inputs):
+        inputs = np.ascontiguousarray(inputs, dtype=float)
+        return np.dot(self._features(inputs), self.weights)
+
+    @staticmethod
+    def accepts(regression_model_description):
+        # approximations must be requested explicitly
+        return False
+
+
+class TruncatedRBFKernelRidgeSimulator(sim.RegressionModelSimulator):
+    """
+    Evaluates a kernel ridge regression with rbf kernel only for the rows of ``X_fit`` within a cutoff radius around
+    the input. The rows of ``X_fit`` are organized in a KD-tree when the model is loaded, so that the cost per step
+    grows sub-linearly with the number of samples for localized kernels (large gamma).
+
+    The cutoff radius is derived from *tolerance*: every dropped kernel term is smaller than
+    *tolerance* / max(sum(abs(dual_coef))), so the truncation error of each response is guaranteed to be at most
+    :attr:`error_bound` <= *tolerance*.
+
+    Requires scipy.
+
+    :param regression_model_description: KernelRidgeRegressionModelDescription with rbf kernel.
+
+    :param tolerance: float, bound of the absolute truncation error of each response.
+    """
+
+    def __init__(self, regression_model_description, tolerance=1e-6):
+        from scipy.spatial import cKDTree
+
+        sim.RegressionModelSimulator.__init__(self)
+        self.exact = sim.KernelRidgeRegressionSimulator(regression_model_description)
+        if self.exact.kernel != 'rbf':
+            raise Exception('Truncated evaluation is only available for rbf kernels.')
+        self.method = 'truncated'
+        self.tolerance = tolerance
+        self._cKDTree = cKDTree
+        self.tree = cKDTree(self.exact.X_fit)
+
+        # kernel terms below the threshold are dropped: exp(-gamma * r^2) < threshold <=> r > radius
+        abs_dual_coef_sum = np.abs(self.exact._dual_coef).sum(axis=0)
+        threshold = tolerance / max(abs_dual_coef_sum.max(), np.finfo(float).tiny)
+        self.radius = np.sqrt(-np.log(threshold) / self.exact.gamma) if threshold < 1 else 0.0
+        self.error_bound = threshold * abs_dual_coef_sum
+
+        self.predictions = 0  # number of predicted rows
+        self.kernel_terms = 0  # number of evaluated kernel terms
+
+    def compute_responses(self, inputs):
+        exact = self.exact
+        neighbors = self.tree.query_ball_point(inputs, self.radius)
+        diff = exact.X_fit[neighbors] - inputs
+        K = np.exp(-exact.gamma * np.einsum('ij,ij->i', diff, diff))
+        self.predictions += 1
+        self.kernel_terms += len(neighbors)
+        return K.dot(exact._dual_coef[neighbors])
+
+    def compute_batch_responses(self, inputs):
+        exact = self.exact
+        inputs = np.ascontiguousarray(inputs, dtype=float)
+        pairs = self._cKDTree(inputs).sparse_distance_matrix(self.tree, self.radius, output_type='ndarray')
+        K = np.exp(-exact.gamma * pairs['v'] ** 2)
+        out = np.empty((len(inputs), exact._dual_coef.shape[1]))
+        for output in range(out.shape[1]):
+            out[:, output] = np.bincount(pairs['i'], weights=K * exact._dual_coef[pairs['j'], output],
+                                         minlength=len(inputs))
+        self.predictions += len(inputs)
+        self.kernel_terms += len(pairs)
+        return out
+
+    @staticmethod
+    def accepts(regression_model_description):
+        # approximations must be requested explicitly
+        return False
+
+
+def create_approximation(regression_model_description, method='nystroem', **options):
+    """
+    Creates an approximate simulator for a kernel ridge regression model.
+
+    :param regression_model_description: KernelRidgeRegressionModelDescription
+
+    :param method: str, ``'nystroem'`` or ``'rff'`` (see :class:`ApproximateKernelRidgeRegressionSimulator`) or
+        ``'truncated'`` (see :class:`TruncatedRBFKernelRidgeSimulator`).
+
+    :param options: further keyword arguments of the simulator.
+
+    :return: the approximate simulator.
+    """
+    if method == 'truncated':
+        return TruncatedRBFKernelRidgeSimulator(regression_model_description, **options)
+    return ApproximateKernelRidgeRegressionSimulator(regression_model_description, method=method, **options)
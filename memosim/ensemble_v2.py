@@ -0,0 +1,109 @@
+"""
+Ensemble (Monte-Carlo) simulations with the v2 simulation engine: the same surrogate is simulated for many sampled
+initial states and input schedules at once.
+"""
+import numpy as np
+
+import memosim.simulation_v2 as sim
+
+
+class EnsembleRunner():
+    """
+    Advances all members of an ensemble in lockstep. Each step is evaluated with one batched prediction for all
+    members (see :meth:`.RegressionModelSimulator.rollout`). The time axis is processed in chunks, so that only the
+    chunk in progress has to be held in memory, if the trajectories are not kept or streamed to disk.
+
+    :param regression_model_simulator: :class:`.RegressionModelSimulator`, the simulated regression model. Its
+        structure is created, unless it already has one (e.g. because it is also simulated by a population).
+
+    :param model_structure: ModelStructure of the simulated model.
+
+    :param chunk_size: int, number of steps, that are simulated at once.
+    """
+
+    def __init__(self, regression_model_simulator, model_structure, chunk_size=1024):
+        self.model = regression_model_simulator
+        self.model_structure = model_structure
+        self.chunk_size = chunk_size
+        if regression_model_simulator.input_plan is None:
+            sim.RegressionModelFactory.create_structure(regression_model_simulator, model_structure)
+
+    def initial_states(self, init_vals, num_members):
+        """
+        :param init_vals: dict<str, object>, maps output or init attribute names to initial values. Values may be
+            scalars or arrays with one value per member.
+
+        :param num_members: int, number of members.
+
+        :return: np.ndarray, (members x outputs) the initial states.
+        """
+        out = np.zeros((num_members, len(self.model_structure.model_outputs)))
+        return sim.RegressionModelFactory.initial_state(self.model_structure, init_vals, out=out)
+
+    def run(self, schedules, init_vals, trajectories=True, statistics=False, quantiles=(0.05, 0.5, 0.95)):
+        """
+        Simulates all members of the ensemble.
+
+        :param schedules: np.ndarray, (members x steps x external inputs) the input schedule of each member, or
+            (steps x external inputs) one schedule for all members. May also be a memory mapped array.
+
+        :param init_vals: dict<str, object>, maps output or init attribute names to initial values. Values may be
+            scalars or arrays with one value per member.
+
+        :param trajectories: defines what happens with the states of the members after each step:
+
+            * True: they are returned as (members x steps x outputs) array.
+            * False: they are discarded.
+            * str: they are streamed into a memory mapped .npy file with this path.
+            * np.ndarray: they are written into this (members x steps x outputs) array.
+
+        :param statistics: bool, whether the mean and quantiles over all members are computed for each step.
+
+        :param quantiles: float[*], the computed quantiles.
+
+        :return: dict<str, np.ndarray>, with the keys 'trajectories' (if kept), 'mean' (steps x outputs) and
+            'quantiles' (steps x quantiles x outputs) (if statistics are computed).
+        """
+        init_state = self.initial_states(init_vals, self._num_members(schedules, init_vals))
+        num_members, num_outputs = init_state.shape
+        if np.ndim(schedules) == 2:
+            schedules = np.broadcast_to(schedules, (num_members,) + np.shape(schedules))
+        num_steps = schedules.shape[1]
+
+        results = {}
+        if trajectories is True:
+            results['trajectories'] = np.empty((num_members, num_steps, num_outputs))
+        elif isinstance(trajectories, str):
+            results['trajectories'] = np.lib.format.open_memmap(trajectories, mode='w+', dtype=float,
+                                                                shape=(num_members, num_steps, num_outputs))
+        elif trajectories is not False and trajectories is not None:
+            results['trajectories'] = trajectories
+        if statistics:
+            results['mean'] = np.empty((num_steps, num_outputs))
+            results['quantiles'] = np.empty((num_steps, len(quantiles), num_outputs))
+
+        state = init_state
+        for start in range(0, num_steps, self.chunk_size):
+            stop = min(start + self.chunk_size, num_steps)
+            # rollouts expect the time axis first: (steps x members x inputs)
+            chunk = np.ascontiguousarray(np.swapaxes(schedules[:, start:stop], 0, 1), dtype=float)
+            outputs = self.model.rollout(chunk, state)
+            if 'trajectories' in results:
+                results['trajectories'][:, start:stop] = np.swapaxes(outputs, 0, 1)
+            if statistics:
+                results['mean'][start:stop] = np.mean(outputs, axis=1)
+                results['quantiles'][start:stop] = np.swapaxes(np.quantile(outputs, quantiles, axis=1), 0, 1)
+            state = outputs[-1]
+
+        if isinstance(results.get('trajectories'), np.memmap):
+            results['trajectories'].flush()
+        return results
+
+    @staticmethod
+    def _num_members(schedules, init_vals):
+        if np.ndim(schedules) == 3:
+            return np.shape(schedules)[0]
+        sizes = [np.size(value) for value in init_vals.values() if np.ndim(value) > 0]
+        if len(sizes) == 0:
+            raise Exception('The number of members can not be derived from schedules and init vals.')
+        return sizes[0]
@@ -0,0 +1,206 @@
+"""
+Instrumentation of simulation steps. An :class:`Instrumentation` measures the latency of the phases of a step (e.g.
+input aggregation, gathering of the regression inputs, evaluation of the regression model and get_data) with a
+monotonic clock, records them in :class:`LatencyHistograms <LatencyHistogram>` and counts the evaluations of each
+model type.
+
+Instrumentation is switchable at runtime. While it is disabled, :meth:`Instrumentation.measure` returns a shared no-op
+context manager and :meth:`Instrumentation.count` returns immediately, so that instrumented code runs with almost no
+overhead::
+
+    with instrumentation.measure('compute'):
+        responses = model.batch_responses(inputs)
+    instrumentation.count(model_type(model), len(inputs))
+"""
+import contextlib
+import json
+import math
+import os
+import time
+
+
+def model_type(regression_model_simulator):
+    """
+    :return: str, the name of the type of a regression model simulator, that is used to count its evaluations.
+        Generic models are distinguished by their backend (see :class:`~memosim.simulation_v2.GenericModelSimulator`).
+    """
+    name = type(regression_model_simulator).__name__
+    backend = getattr(regression_model_simulator, 'backend', None)
+    if backend is not None:
+        name = '%s[%s]' % (name, backend)
+    return name
+
+
+class LatencyHistogram():
+    """
+    A histogram of latencies with logarithmic bins. Percentiles are estimated from the bins, their relative error is
+    bounded by the width of a bin (about 5 % with the default resolution).
+
+    :param min_latency: float, lower bound (seconds) of the first bin. Smaller latencies are counted in the first bin.
+
+    :param max_latency: float, upper bound (seconds) of the last bin. Larger latencies are counted in the last bin.
+
+    :param bins_per_decade: int, resolution of the histogram.
+    """
+
+    def __init__(self, min_latency=1e-7, max_latency=1e3, bins_per_decade=50):
+        self.min_latency = min_latency
+        self.bins_per_decade = bins_per_decade
+        self._scale = bins_per_decade / math.log(10)
+        self.counts = [0] * int(math.ceil(math.log10(max_latency / min_latency) * bins_per_decade))
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    def add(self, latency):
+        self.count += 1
+        self.total += latency
+        if latency < self.min:
+            self.min = latency
+        if latency > self.max:
+            self.max = latency
+        if latency > self.min_latency:
+            idx = min(int(math.log(latency / self.min_latency) * self._scale), len(self.counts) - 1)
+        else:
+            idx = 0
+        self.counts[idx] += 1
+
+    def percentile(self, q):
+        """
+        :param q: float, percentile in [0, 100].
+
+        :return: float, the estimated latency (seconds) of the percentile, NaN if the histogram is empty.
+        """
+        if self.count == 0:
+            return math.nan
+        if q <= 0:
+            return self.min
+        if q >= 100:
+            return self.max
+        rank = q / 100.0 * self.count
+        cumulative = 0
+        for idx, count in enumerate(self.counts):
+            cumulative += count
+            if cumulative >= rank and count > 0:
+                # geometric center of the bin, which is bounded by the observed extremes
+                latency = self.min_latency * 10 ** ((idx + 0.5) / self.bins_per_decade)
+                return min(max(latency, self.min), self.max)
+        return self.max
+
+    def summary(self):
+        """
+        :return: dict<str, float>, count, total, mean, min, max and the percentiles p50, p95 and p99 (seconds).
+        """
+        if self.count == 0:
+            return {'count': 0, 'total': 0.0}
+        return {'count': self.count, 'total': self.total, 'mean': self.total / self.count, 'min': self.min,
+                'max': self.max, 'p50': self.percentile(50), 'p95': self.percentile(95), 'p99': self.percentile(99)}
+
+
+class _PhaseTimer():
+    # a reusable context manager, that adds the time spent in its block to a histogram
+
+    __slots__ = ('histogram', 'start')
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.histogram.add(time.perf_counter() - self.start)
+        return False
+
+
+_NULL_TIMER = contextlib.nullcontext()
+
+
+class Instrumentation():
+    """
+    Collects latency histograms per phase and counters.
+
+    :param enabled: bool, whether measurements are recorded.
+
+    :param dump_path: str, optional JSON file, to which :meth:`tick` periodically writes the :meth:`report`.
+
+    :param dump_interval: float, minimum number of seconds between two dumps.
+    """
+
+    def __init__(self, enabled=False, dump_path=None, dump_interval=60.0):
+        self.enabled = enabled
+        self.dump_path = dump_path
+        self.dump_interval = dump_interval
+        self.histograms = {}  # maps phases to latency histograms
+        self.counters = {}  # maps names to counts
+        self._timers = {}
+        self._last_dump = time.monotonic()
+
+    def measure(self, phase):
+        """
+        :return: a context manager, that records the time spent in its block as latency of *phase*.
+        """
+        if not self.enabled:
+            return _NULL_TIMER
+        timer = self._timers.get(phase)
+        if timer is None:
+            self.histograms[phase] = LatencyHistogram()
+            timer = self._timers[phase] = _PhaseTimer(self.histograms[phase])
+        return timer
+
+    def count(self, name, rows=1):
+        """
+        Counts one evaluation of the model type *name* for *rows* entities.
+        """
+        if not self.enabled:
+            return
+        calls, total_rows = self.counters.get(name, (0, 0))
+        self.counters[name] = (calls + 1, total_rows + rows)
+
+    def report(self):
+        """
+        :return: dict, the summaries of all phases (see :meth:`LatencyHistogram.summary`) and the number of calls and
+            rows of all counters.
+        """
+        return {
+            'enabled': self.enabled,
+            'phases': {phase: histogram.summary() for phase, histogram in self.histograms.items()},
+            'counters': {name: {'calls': calls, 'rows': rows} for name, (calls, rows) in self.counters.items()},
+        }
+
+    def reset(self):
+        self.histograms.clear()
+        self.counters.clear()
+        self._timers.clear()
+
+    def tick(self):
+        """
+        Writes the report to :attr:`dump_path`, if the dump interval has passed since the last dump. This should be
+        called once per step.
+        """
+        if not self.enabled or self.dump_path is None:
+            return
+        now = time.monotonic()
+        if now - self._last_dump >= self.dump_interval:
+            self._last_dump = now
+            self.dump()
+
+    def dump(self, path=None):
+        """
+        Writes the report to a JSON file. The file is replaced atomically.
+
+        :param path: str, the file, defaults to :attr:`dump_path`.
+        """
+        path = path or self.dump_path
+        if path is None:
+            raise Exception('No path for the instrumentation dump defined.')
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        report = self.report()
+        report['time'] = time.time()
+        temp_path = '%s.tmp-%d' % (path, os.getpid())
+        with open(temp_path, 'w') as file:
+            json.dump(report, file, indent=1, sort_keys=True)
+        os.replace(temp_path, path)
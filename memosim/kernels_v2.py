@@ -0,0 +1,255 @@
+"""
+Step kernels of the v2 simulation engine. Each kernel reads from arrays with one row per entity and writes its
+results into a preallocated output array, which is also returned.
+
+The kernels are implemented twice: compiled in :mod:`memosim_ext.kernels_v2` (typed memoryviews, GIL released) and
+with NumPy in this module. The compiled kernels are selected automatically, if the extension has been built
+(``python setup.py build_ext``). :data:`COMPILED` tells which implementation is in use.
+"""
+import numpy as np
+
+LINEAR = 0
+POLYNOMIAL = 1
+SIGMOID = 2
+RBF = 3
+
+KERNELS = {'linear': LINEAR, 'polynomial': POLYNOMIAL, 'sigmoid': SIGMOID, 'rbf': RBF}
+
+ROLLOUT_BLOCK_SIZE = 32
+ROLLOUT_MAX_BLOCKED_ENTITIES = 64
+
+
+def gather_inputs(external_inputs, state, external_positions, external_indices, feedback_positions,
+                  feedback_indices, out):
+    """
+    Gathers the regression inputs of all entities from their external inputs and their state.
+
+    :param external_inputs: np.ndarray, (entities x external inputs)
+
+    :param state: np.ndarray, (entities x outputs)
+
+    :param external_positions: np.ndarray, columns of *out* that receive external inputs.
+
+    :param external_indices: np.ndarray, the corresponding columns of *external_inputs*.
+
+    :param feedback_positions: np.ndarray, columns of *out* that receive feedback inputs.
+
+    :param feedback_indices: np.ndarray, the corresponding columns of *state*.
+
+    :param out: np.ndarray, (entities x regression inputs)
+    """
+    out[:, external_positions] = external_inputs[:, external_indices]
+    out[:, feedback_positions] = state[:, feedback_indices]
+    return out
+
+
+def ols_step(inputs, intercept, coefs, out):
+    """
+    Evaluates an OLS model: *out* = *intercept* + *inputs* . *coefs*:sup:`T`
+
+    :param inputs: np.ndarray, (entities x inputs)
+
+    :param intercept: np.ndarray, (outputs)
+
+    :param coefs: np.ndarray, (outputs x inputs)
+
+    :param out: np.ndarray, (entities x outputs)
+    """
+    np.dot(inputs, coefs.T, out=out)
+    out += intercept
+    return out
+
+
+def kernel_matrix(X, X_fit, X_fit_sq_norms, kernel, gamma, coef0, degree, out):
+    """
+    Evaluates a kernel function between each row of *X* and each row of *X_fit*.
+
+    :param X: np.ndarray, (entities x inputs)
+
+    :param X_fit: np.ndarray, (samples x inputs)
+
+    :param X_fit_sq_norms: np.ndarray, (samples) squared euclidean norms of the rows of *X_fit*. Only used by the
+        rbf kernel.
+
+    :param kernel: int, one of :data:`LINEAR`, :data:`POLYNOMIAL`, :data:`SIGMOID` or :data:`RBF`.
+
+    :param out: np.ndarray, (entities x samples)
+    """
+    np.dot(X, X_fit.T, out=out)
+    if kernel == POLYNOMIAL:
+        out *= gamma
+        out += coef0
+        out **= degree
+    elif kernel == SIGMOID:
+        out *= gamma
+        out += coef0
+        np.tanh(out, out)
+    elif kernel == RBF:
+        out *= -2
+        out += (X * X).sum(axis=1)[:, np.newaxis]
+        out += X_fit_sq_norms[np.newaxis, :]
+        np.maximum(out, 0, out=out)
+        out *= -gamma
+        np.exp(out, out)
+    return out
+
+
+def krr_responses(K, dual_coef, out):
+    """
+    Computes the responses of a kernel ridge regression: *out* = *K* . *dual_coef*
+
+    :param K: np.ndarray, (entities x samples) kernel matrix.
+
+    :param dual_coef: np.ndarray, (samples x outputs)
+
+    :param out: np.ndarray, (entities x outputs)
+    """
+    return np.dot(K, dual_coef, out=out)
+
+
+def ols_rollout(contributions, feedback_coefs, feedback_indices, init_state, out):
+    """
+    Runs the time loop of an OLS model with feedback:
+    *out*[t] = *contributions*[t] + *out*[t-1][:, *feedback_indices*] . *feedback_coefs*:sup:`T`
+
+    :param contributions: np.ndarray, (steps x entities x outputs) intercept plus the contribution of all inputs
+        without feedback.
+
+    :param feedback_coefs: np.ndarray, (outputs x feedback inputs) coefficients of the feedback inputs.
+
+    :param feedback_indices: np.ndarray, (feedback inputs) columns of the state, that are fed back.
+
+    :param init_state: np.ndarray, (entities x outputs) state before the first step.
+
+    :param out: np.ndarray, (steps x entities x outputs)
+    """
+    num_steps, num_entities, num_outputs = contributions.shape
+    # transition matrix of the recurrence: state[t] = contributions[t] + M . state[t-1]
+    M = np.zeros((num_outputs, num_outputs), dtype=out.dtype)
+    np.add.at(M.T, feedback_indices, feedback_coefs.T)
+    # only fed back columns of the state may be read, the others may be undefined (nan)
+    columns = np.unique(feedback_indices)
+
+    state = init_state
+    if num_entities > ROLLOUT_MAX_BLOCKED_ENTITIES:
+        M_columns = np.ascontiguousarray(M[:, columns])
+        for t in range(num_steps):
+            np.dot(state[:, columns], M_columns.T, out=out[t])
+            out[t] += contributions[t]
+            state = out[t]
+        return out
+
+    # for few entities, the time loop is unrolled into blocks of steps: each block is solved with one matrix product
+    # of the block lower triangular matrix of powers of M with all contributions of the block
+    block = ROLLOUT_BLOCK_SIZE
+    powers = [np.eye(num_outputs, dtype=out.dtype)]
+    for k in range(block):
+        powers.append(M.dot(powers[-1]))
+    W = np.zeros((block * num_outputs, block * num_outputs), dtype=out.dtype)
+    for k in range(block):
+        for j in range(k + 1):
+            W[k * num_outputs:(k + 1) * num_outputs, j * num_outputs:(j + 1) * num_outputs] = powers[k - j]
+    P = np.vstack(powers[1:])[:, columns]
+
+    for start in range(0, num_steps, block):
+        size = min(block, num_steps - start) * num_outputs
+        C = contributions[start:start + block].transpose(0, 2, 1).reshape(size, num_entities)
+        Y = W[:size, :size].dot(C) + P[:size].dot(state[:, columns].T)
+        out[start:start + block] = Y.reshape(-1, num_outputs, num_entities).transpose(0, 2, 1)
+        state = out[start + size // num_outputs - 1]
+    return out
+
+
+def sum_aggregate(values, offsets, out):
+    """
+    Sums up consecutive segments of *values*. Segment *i* comprises values[offsets[i]:offsets[i+1]].
+
+    :param values: np.ndarray, (values)
+
+    :param offsets: np.ndarray, (segments + 1)
+
+    :param out: np.ndarray, (segments)
+    """
+    # reduceat can not handle empty segments, they are left at zero
+    nonempty = np.diff(offsets) > 0
+    out[:] = 0
+    if np.any(nonempty):
+        out[nonempty] = np.add.reduceat(values, offsets[:-1][nonempty])
+    return out
+
+
+def extract_outputs(state, rows, cols, out):
+    """
+    Reads the values state[rows[i], cols[i]].
+
+    :param state: np.ndarray, (entities x outputs)
+
+    :param rows: np.ndarray, (values)
+
+    :param cols: np.ndarray, (values)
+
+    :param out: np.ndarray, (values)
+    """
+    out[:] = state[rows, cols]
+    return out
+
+
+def tree_ensemble(X, feature, threshold, left, right, value, roots, out):
+    """
+    Evaluates an ensemble of decision trees, that are flattened into node arrays. Each row of *X* descends all
+    trees, the values of the reached leaves are summed up. Leaves are marked by being their own left child.
+
+    :param X: np.ndarray, (entities x inputs)
+
+    :param feature: np.ndarray, (nodes) feature of the split of each node.
+
+    :param threshold: np.ndarray, (nodes) rows with X[feature] <= threshold descend to the left child.
+
+    :param left: np.ndarray, (nodes) left children.
+
+    :param right: np.ndarray, (nodes) right children.
+
+    :param value: np.ndarray, (nodes x outputs) values of the leaves.
+
+    :param roots: np.ndarray, (trees) root node of each tree.
+
+    :param out: np.ndarray, (entities x outputs)
+    """
+    num_rows, num_inputs = X.shape
+    # one (row, tree) pair per entry; pairs, that reached a leaf, are dropped from the active set
+    offsets = np.repeat(np.arange(num_rows) * num_inputs, len(roots))
+    nodes = np.tile(roots, num_rows)
+    active = np.flatnonzero(left[nodes] != nodes)
+    X_flat = np.ravel(X)
+    while len(active) > 0:
+        current = nodes[active]
+        go_left = X_flat[offsets[active] + feature[current]] <= threshold[current]
+        current = np.where(go_left, left[current], right[current])
+        nodes[active] = current
+        active = active[left[current] != current]
+    np.sum(np.reshape(value[nodes], (num_rows, len(roots), -1)), axis=1, out=out)
+    return out
+
+COMPILED_KERNEL_MATRIX_MAX_SIZE = 1024
+"""
+Kernel matrices with more elements are evaluated with NumPy, whose BLAS products and vectorized exp outperform the
+compiled loops. The compiled kernel only pays off for the small matrices of single entities.
+"""
+
+_numpy_kernel_matrix = kernel_matrix
+
+try:
+    # krr_responses is a plain matrix product, that BLAS computes faster than the compiled loop
+    from memosim_ext.kernels_v2 import gather_inputs, ols_step, ols_rollout, sum_aggregate, extract_outputs, \
+        tree_ensemble
+    from memosim_ext.kernels_v2 import kernel_matrix as _compiled_kernel_matrix
+    COMPILED = True
+
+    def kernel_matrix(X, X_fit, X_fit_sq_norms, kernel, gamma, coef0, degree, out):
+        if out.size <= COMPILED_KERNEL_MATRIX_MAX_SIZE:
+            return _compiled_kernel_matrix(X, X_fit, X_fit_sq_norms, kernel, gamma, coef0, degree, out)
+        return _numpy_kernel_matrix(X, X_fit, X_fit_sq_norms, kernel, gamma, coef0, degree, out)
+
+    kernel_matrix.__doc__ = _numpy_kernel_matrix.__doc__
+except ImportError:
+    COMPILED = False
@@ -0,0 +1,203 @@
+"""
+Lowering of v1 surrogates onto the array-backed v2 engine. A v1 surrogate (:mod:`memosim.simulation_v1`) consists of
+a model structure and a list of metamodels, each of which reads some attributes of the model state by name and
+predicts some of its outputs. :func:`lower_surrogate` maps all attributes to columns of the arrays of a
+:class:`~memosim.population_v2.PopulationSimulator` once, so that each metamodel is evaluated with one batched
+prediction for all entities per step instead of one prediction per entity.
+
+The attributes of the v1 state are mapped as follows:
+
+* inputs are the first external inputs of the population, in the order of the model structure,
+* parameters, that are read by metamodels, are additional external inputs, that are set when entities are created,
+* virtual states are feedback inputs of their update attributes (outputs), which are initialized from the init
+  attributes of the virtual states,
+* outputs are the state of the population. Metamodels, that read outputs directly, read them through additional
+  feedback inputs, i.e. like in v1 they read the values of the previous step.
+"""
+from types import SimpleNamespace
+
+import numpy as np
+
+import memosim.simulation_v2 as sim
+from memosim.population_v2 import PopulationSimulator
+
+
+class MetaModelRegressionSimulator(sim.RegressionModelSimulator):
+    """
+    A regression model simulator, that evaluates the metamodels of a v1 surrogate for a matrix of regression inputs.
+
+    :param metamodels: list of :class:`memotrainer.metamodels.MetaModel`
+
+    :param input_columns: dict<str, int>, maps the attributes, that are read by the metamodels, to columns of the
+        regression inputs.
+
+    :param output_names: list<str>, the model outputs in the order of the responses.
+    """
+
+    def __init__(self, metamodels, input_columns, output_names):
+        sim.RegressionModelSimulator.__init__(self)
+        output_indices = {name: idx for idx, name in enumerate(output_names)}
+        self.metamodels = metamodels
+        self.num_outputs = len(output_names)
+        # one (metamodel, input columns, (response name, output index) pairs) tuple per metamodel
+        self._plan = [(m, np.array([input_columns[name] for name in m.input_names], dtype=np.intp),
+                       [(name, output_indices[name]) for name in m.response_names]) for m in metamodels]
+
+    def compute_responses(self, inputs):
+        return self.compute_batch_responses(np.reshape(inputs, (1, -1)))[0]
+
+    def compute_batch_responses(self, inputs):
+        out = np.empty((len(inputs), self.num_outputs), dtype=self.dtype)
+        for metamodel, columns, responses in self._plan:
+            y = metamodel.predict(inputs[:, columns])
+            for name, idx in responses:
+                out[:, idx] = np.reshape(y[name], len(inputs))
+        return out
+
+    @staticmethod
+    def accepts(regression_model_description):
+        # only created by lower_surrogate()
+        return False
+
+
+class LoweredSurrogate(object):
+    """
+    A v1 surrogate, that is simulated by a :class:`~memosim.population_v2.PopulationSimulator` (see
+    :func:`lower_surrogate`).
+
+    Unlike :class:`~memosim.simulation_v1.SurrogateModelSimulator`, inputs keep their values between steps, all
+    parameters, that are read by metamodels, must be numbers and virtual states are NaN instead of None before the
+    first step of an entity. Outputs, that metamodels read directly, are NaN instead of None in the first step, or
+    the init value of a virtual state, that they update.
+
+    :param population: :class:`~memosim.population_v2.PopulationSimulator`
+
+    :param parameter_names: list<str>, all parameters of the model structure.
+
+    :param parameter_columns: dict<str, int>, maps parameters, that are read by metamodels, to external inputs.
+
+    :param vstate_columns: dict<str, int>, maps virtual states to their feedback columns of the regression inputs.
+    """
+
+    def __init__(self, population, parameter_names, parameter_columns, vstate_columns):
+        self.population = population
+        self.parameter_names = parameter_names
+        self.parameter_columns = parameter_columns
+        self.vstate_columns = vstate_columns
+        self.input_columns = {name: idx for idx, name in enumerate(population.model_structure.model_inputs)
+                              if name not in parameter_columns}
+        self.output_indices = population.output_indices
+        # the values of all parameters, one per row, including those, that are not read by metamodels
+        self.parameter_values = {name: [] for name in parameter_names}
+
+    def add_entities(self, num, init_vals):
+        """
+        Adds *num* entities to the population.
+
+        :param init_vals: dict<str, object>, maps all parameters to their values. Values may be scalars or arrays
+            with one value per new entity.
+
+        :return: range, the rows of the new entities.
+        """
+        for attribute in init_vals:
+            if attribute not in self.parameter_names:
+                raise Exception('Unknown parameter: %s' % (attribute))
+        for attribute in self.parameter_names:
+            if init_vals.get(attribute) is None:
+                raise Exception('Parameter %s has not been initialized.' % (attribute))
+        rows = self.population.add_entities(num, init_vals)
+        for name, column in self.parameter_columns.items():
+            self.population.external_inputs[rows.start:rows.stop, column] = init_vals[name]
+        for name, values in self.parameter_values.items():
+            value = init_vals[name]
+            values.extend(list(value) if np.ndim(value) > 0 else [value] * num)
+        return rows
+
+    def get_value(self, row, attr):
+        """
+        :return: the current value of an output, input, virtual state or parameter of the entity in *row*. Virtual
+            states have the values, from which the last step was computed.
+        """
+        if attr in self.output_indices:
+            return float(self.population.state[row, self.output_indices[attr]])
+        if attr in self.input_columns:
+            return float(self.population.external_inputs[row, self.input_columns[attr]])
+        # virtual states shadow parameters of the same name (see simulation_v1.ModelState.__getitem__)
+        if attr in self.vstate_columns:
+            return float(self.population.get_input(row, self.vstate_columns[attr]))
+        if attr in self.parameter_values:
+            return self.parameter_values[attr][row]
+        raise ValueError('Unknown attribute: %s' % (attr))
+
+
+def lower_structure(model_structure, metamodels):
+    """
+    Maps the attributes, that are read by the metamodels of a v1 surrogate, to regression inputs of the v2 engine.
+
+    :param model_structure: ModelStructure of the v1 surrogate.
+
+    :param metamodels: list of :class:`memotrainer.metamodels.MetaModel`
+
+    :return: (lowered model structure, input columns, parameter columns), the lowered structure has the parameters,
+        that are read by metamodels, as additional inputs. The input columns map all attributes, that are read by
+        metamodels, and all virtual states to columns of the regression inputs. Outputs, that are read by
+        metamodels, follow the virtual states. The parameter columns map these parameters to external inputs.
+    """
+    inputs = list(model_structure.model_inputs)
+    outputs = list(model_structure.model_outputs)
+    vstate_names = [vstate.name for vstate in model_structure.virtual_states]
+    responses = [name for m in metamodels for name in m.response_names]
+    if len(responses) != len(set(responses)):
+        raise Exception('Several metamodels predict the same response.')
+    if set(responses) != set(outputs):
+        raise Exception('The metamodel responses %s do not match the model outputs %s.' % (
+            sorted(responses), sorted(outputs)))
+
+    # virtual states shadow parameters of the same name (see simulation_v1.ModelState.__getitem__)
+    read = [name for m in metamodels for name in m.input_names]
+    parameters = [name for name in model_structure.model_parameters if name in read and name not in vstate_names]
+    external = inputs + parameters
+    input_columns = {name: idx for idx, name in enumerate(external)}
+    for idx, name in enumerate(vstate_names):
+        input_columns[name] = len(external) + idx
+    for name in read:
+        if name not in input_columns:
+            if name not in outputs:
+                raise Exception('Unknown metamodel input: %s' % (name))
+            input_columns[name] = len(input_columns)
+
+    structure = SimpleNamespace(
+        model_parameters=list(model_structure.model_parameters),
+        model_inputs=external,
+        model_outputs=outputs,
+        virtual_states=list(model_structure.virtual_states))
+    parameter_columns = {name: input_columns[name] for name in parameters}
+    return structure, input_columns, parameter_columns
+
+
+def lower_surrogate(model_structure, metamodels, skip_tolerance=None):
+    """
+    Lowers a v1 surrogate onto a :class:`~memosim.population_v2.PopulationSimulator`.
+
+    :param model_structure: ModelStructure of the v1 surrogate.
+
+    :param metamodels: :class:`memotrainer.metamodels.MetaModel` or a list of them.
+
+    :param skip_tolerance: float, optional, enables steady-state skipping (see
+        :class:`~memosim.population_v2.PopulationSimulator`).
+
+    :return: :class:`LoweredSurrogate`
+    """
+    if type(metamodels) not in [list, tuple]:
+        metamodels = [metamodels]
+    structure, input_columns, parameter_columns = lower_structure(model_structure, metamodels)
+    simulator = MetaModelRegressionSimulator(metamodels, input_columns, structure.model_outputs)
+    sim.RegressionModelFactory.create_structure(simulator, structure)
+    # outputs, that are read directly, are fed back like virtual states (see lower_structure)
+    read_outputs = sorted((column, name) for name, column in input_columns.items() if name in structure.model_outputs)
+    for column, name in read_outputs:
+        simulator.input_accessors.append(sim.FeedbackInputAccessor(simulator, structure.model_outputs.index(name)))
+    simulator.compile_input_plan()
+    population = PopulationSimulator(simulator, structure, skip_tolerance=skip_tolerance)
+    vstate_columns = {vstate.name: input_columns[vstate.name] for vstate in structure.virtual_states}
+    return LoweredSurrogate(population, list(model_structure.model_parameters), parameter_columns, vstate_columns)
@@ -0,0 +1,144 @@
+"""
+A process-wide cache for model descriptions, that have been loaded from surrogate model files. Simulators, that are
+started several times against the same files, share the parsed model descriptions instead of reading and
+deserializing the files again.
+"""
+import collections
+import os
+import sys
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import numpy as np
+
+
+def estimate_size(obj, _seen=None):
+    """
+    Estimates the memory footprint of an object graph in bytes. NumPy arrays, containers and the attributes of
+    objects are followed, so that model descriptions and the estimators within are covered. Memory-mapped arrays are
+    not counted, because they reside in the shared page cache.
+    """
+    if _seen is None:
+        _seen = set()
+    if id(obj) in _seen:
+        return 0
+    _seen.add(id(obj))
+    if isinstance(obj, np.memmap):
+        return 0
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(estimate_size(key, _seen) + estimate_size(value, _seen) for key, value in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(estimate_size(item, _seen) for item in obj)
+    elif hasattr(obj, '__dict__'):
+        size += estimate_size(vars(obj), _seen)
+    return size
+
+
+class ModelDescriptionCache():
+    """
+    Caches loaded model descriptions by file path, modification time and surrogate name. If a file is modified, the
+    next lookup loads it again. The least recently used entries are evicted, when the estimated size of all entries
+    exceeds *max_bytes* (the most recent entry is always kept).
+
+    Cached descriptions are shared by all users and must not be modified.
+
+    :param loader: callable(surrogate_model_file, surrogate_name), that loads a model description.
+
+    :param max_bytes: int, memory cap of the cache.
+    """
+
+    def __init__(self, loader, max_bytes=2 ** 30):
+        self.loader = loader
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()  # maps keys to (description, size)
+        self._loading = {}  # maps keys to futures of loads in progress
+        self._lock = threading.Lock()
+
+    @property
+    def size(self):
+        """
+        Estimated size of all cached descriptions in bytes.
+        """
+        with self._lock:
+            return sum(size for description, size in self._entries.values())
+
+    @staticmethod
+    def key(surrogate_model_file, surrogate_name):
+        path = os.path.abspath(surrogate_model_file)
+        return path, os.stat(path).st_mtime_ns, surrogate_name
+
+    def get(self, surrogate_model_file, surrogate_name):
+        """
+        :return: the cached model description, which is loaded, if it is not cached yet.
+        """
+        key = self.key(surrogate_model_file, surrogate_name)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+            future = self._loading.get(key)
+            owner = future is None
+            if owner:
+                # concurrent lookups of the same key wait for a single load
+                future = self._loading[key] = Future()
+                self.misses += 1
+        if not owner:
+            return future.result()
+
+        try:
+            description = self.loader(surrogate_model_file, surrogate_name)
+        except BaseException as e:
+            with self._lock:
+                del self._loading[key]
+            future.set_exception(e)
+            raise
+        self._insert(key, description)
+        future.set_result(description)
+        return description
+
+    def _insert(self, key, description):
+        size = estimate_size(description)
+        with self._lock:
+            del self._loading[key]
+            # entries of older versions of the same file are outdated
+            for outdated in [k for k in self._entries if k[0] == key[0] and k[2] == key[2]]:
+                del self._entries[outdated]
+            self._entries[key] = (description, size)
+            total = sum(size for description, size in self._entries.values())
+            while total > self.max_bytes and len(self._entries) > 1:
+                evicted_key, (evicted, evicted_size) = self._entries.popitem(last=False)
+                total -= evicted_size
+
+    def invalidate(self, surrogate_model_file=None, surrogate_name=None):
+        """
+        Removes entries from the cache. Without arguments, the whole cache is cleared.
+
+        :param surrogate_model_file: str, optional, removes only entries of this file.
+
+        :param surrogate_name: str, optional, removes only entries of this surrogate.
+        """
+        path = None if surrogate_model_file is None else os.path.abspath(surrogate_model_file)
+        with self._lock:
+            for key in list(self._entries):
+                if (path is None or key[0] == path) and (surrogate_name is None or key[2] == surrogate_name):
+                    del self._entries[key]
+
+    def preload(self, requests, max_workers=4):
+        """
+        Loads several model descriptions concurrently on a thread pool.
+
+        :param requests: list of (surrogate_model_file, surrogate_name) tuples.
+
+        :param max_workers: int, number of threads.
+
+        :return: list of the model descriptions.
+        """
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(self.get, file, name) for file, name in requests]
+            return [future.result() for future in futures]
@@ -12,7 +12,11 @@ from memodb import memomodel
 
 from memosim import SurrogateModelSimulator
 
-from memosim import SurrogateModelSimulator, MetaModelSimulator
+from memosim import SurrogateModelSimulator, MetaModelSimulator, TrustedSurrogateModelSimulator
+from memosim.simulation_v1 import shutdown_thread_pool, step_surrogates
+from memosim.aggregation import InputRouter
+from memosim import lowering_v2
+from memosim.mosaik_v2 import GetDataPlan
 
 
 class MosaikMeMoSimulator(mosaik_api.Simulator):
@@ -32,6 +36,12 @@ class MosaikMeMoSimulator(mosaik_api.Simulator):
         # TODO: prefix  mit original model angleichen?
         self.eid_prefix = 'memo_'  # prefix for eids
         self.entities = dict()  # maps EIDs to model
+        self.entity_rows = dict()  # maps EIDs to indices of the entities
+        self.entity_list = []  # all entities in the order of their creation
+        self.router = None  # aggregates the inputs of all entities
+        self.simulator_class = SurrogateModelSimulator  # simulates each entity
+        self.lowered = None  # simulates all entities on the v2 engine, if set
+        self.get_data_plan = None  # the plan of the last get_data request of lowered entities
         self.sid = None
         self.step_size = None  # step size of the simulation
 
@@ -42,9 +52,29 @@ class MosaikMeMoSimulator(mosaik_api.Simulator):
     #    return self.meta
 
     #def init(self, sid, step_size, model_name, model_structure_description, metamodels):
-    def init(self, sid, step_size, surrogate_model_file, surrogate_name):
+    def init(self, sid, step_size, surrogate_model_file, surrogate_name, aggregation=None, trusted=False,
+             engine='v1'):
+        """
+        :param aggregation: dict<str, str>, optional reducers of the input attributes, e.g. {'P_el_set': 'mean'}
+            (see :mod:`memosim.aggregation`). By default, the values of all sources of an input are summed up. Input
+            values must be numbers, they are converted to floats.
+
+        :param trusted: bool, whether the entities are simulated by
+            :class:`~memosim.simulation_v1.TrustedSurrogateModelSimulator`, which validates the surrogate once and
+            skips the checks of the strict :class:`~memosim.simulation_v1.SurrogateModelSimulator` in every step.
+            Inputs without values in a step keep their previous values.
+
+        :param engine: str, 'v1' simulates each entity separately. 'v2' lowers the surrogate onto the array-backed
+            v2 engine (see :mod:`memosim.lowering_v2`), which evaluates each metamodel once per step for all
+            entities. get_data returns outputs, inputs, parameters and virtual states like 'v1', except that inputs
+            without values in a step keep their previous values, parameters, that are read by metamodels, must be
+            numbers, virtual states are NaN instead of None before the first step and outputs, that metamodels read
+            directly, are NaN instead of None in the first step (see :class:`~memosim.lowering_v2.LoweredSurrogate`).
+        """
         self.sid = sid
         self.step_size = step_size
+        if trusted:
+            self.simulator_class = TrustedSurrogateModelSimulator
 
         # load surrogate model objects
         surrogate = self.load_surrogate(surrogate_model_file, surrogate_name)
@@ -63,6 +93,13 @@ class MosaikMeMoSimulator(mosaik_api.Simulator):
                 'attrs': attr_names  # attributes available within
             }
         }
+        if engine == 'v2':
+            self.lowered = lowering_v2.lower_surrogate(self.model_structure, self.metamodels)
+            self.router = InputRouter(self.entity_rows, self.model_structure.model_inputs, aggregation)
+        elif engine == 'v1':
+            self.router = InputRouter(self.entity_rows, attr_names, aggregation)
+        else:
+            raise Exception('Unknown engine: %s' % (engine))
         self.meta['extra_methods'] = [
             'get_output_attributes'
         ]
@@ -127,13 +164,27 @@ class MosaikMeMoSimulator(mosaik_api.Simulator):
     #
     # model = SurrogateModelSimulator(model_structure_description, [StupidMetaModelSimulator(['P_el_set', 'internal_soc'], ['P_el', 'SoC'])])
     def create(self, num, model, **init_vals):
+        if self.lowered is not None:
+            return self._create_lowered(num, model, init_vals)
         entities = []
         next_eid = len(self.entities)
         for i in range(next_eid, next_eid + num):
             eid = '%s%d' % (self.eid_prefix, i)
-            entity = SurrogateModelSimulator(self.model_structure, self.metamodels)
+            entity = self.simulator_class(self.model_structure, self.metamodels)
             entity.init(**init_vals)
             self.entities[eid] = entity
+            self.entity_rows[eid] = len(self.entity_list)
+            self.entity_list.append(entity)
+            entities.append({'eid': eid, 'type': model})
+        return entities
+
+    def _create_lowered(self, num, model, init_vals):
+        # lowered entities only own a row of the population's arrays
+        entities = []
+        for row in self.lowered.add_entities(num, init_vals):
+            eid = '%s%d' % (self.eid_prefix, len(self.entities))
+            self.entities[eid] = self.lowered
+            self.entity_rows[eid] = row
             entities.append({'eid': eid, 'type': model})
         return entities
 
@@ -185,14 +236,15 @@ class MosaikMeMoSimulator(mosaik_api.Simulator):
         :return: int
             time of the next simulation step (also in seconds since simulation start)
         """
-        for eid, inputdata in inputs.items():
-            model = self.entities[eid]
-            for attr, attr_data in inputdata.items():
-                # TODO the method how to aggregate input from several  
-                # simulators should be exchangeable!  
-                model[attr] = sum(attr_data.values())
-        for eid, model in self.entities.items():
-            model.step()
+        if self.lowered is not None:
+            self.router.apply(inputs, self.lowered.population.external_inputs)
+            self.lowered.population.step()
+            return (time + self.step_size)
+        for attr, rows, column, values in self.router.aggregate(inputs):
+            for row, value in zip(rows.tolist(), values.tolist()):
+                self.entity_list[row][attr] = value
+        # each metamodel is evaluated once for all entities
+        step_surrogates(self.entity_list)
         return (time + self.step_size)
 
     def get_data(self, outputs):
@@ -203,6 +255,8 @@ class MosaikMeMoSimulator(mosaik_api.Simulator):
 
         :return: The return value needs to be a dict of dicts mapping entity IDs and attribute names to their values.
         """
+        if self.lowered is not None:
+            return self._get_lowered_data(outputs)
         data = {}
         for eid, attrs in outputs.items():
             data[eid] = {}
@@ -210,6 +264,20 @@ class MosaikMeMoSimulator(mosaik_api.Simulator):
                 #print(self.entities[eid].state)
                 data[eid][attr] = self.entities[eid][attr]
         return data
+
+    def _get_lowered_data(self, outputs):
+        output_indices = self.lowered.output_indices
+        if all(attr in output_indices for attrs in outputs.values() for attr in attrs):
+            # requests of outputs only are compiled into a reusable plan
+            if self.get_data_plan is None or not self.get_data_plan.matches(outputs):
+                self.get_data_plan = GetDataPlan(outputs, self.entity_rows, output_indices)
+            return self.get_data_plan.fill(self.lowered.population)
+        return {eid: {attr: self.lowered.get_value(self.entity_rows[eid], attr) for attr in attrs}
+                for eid, attrs in outputs.items()}
+
+    def finalize(self):
+        # the thread pool, that evaluates combined metamodels concurrently, is not needed anymore
+        shutdown_thread_pool()
     
 
 if __name__ == '__main__':
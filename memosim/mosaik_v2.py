@@ -1,3 +1,6 @@
+import functools
+import os
+
 import numpy as np
 import mosaik_api
 
@@ -5,6 +8,14 @@ from memodb import h5db
 from memodb import memomodel
 
 import memosim.simulation_v2 as sim
+from memosim import approximation_v2
+from memosim import prediction_cache
+from memosim.aggregation import InputRouter
+from memosim.instrumentation import Instrumentation
+from memosim import shared_parameters
+from memosim.model_cache import ModelDescriptionCache
+from memosim.parallel_v2 import WorkerPool
+from memosim.population_v2 import PopulationSimulator
 
 
 
@@ -20,6 +31,45 @@ def load_model_description(surrogate_model_file, surrogate_name):
     return model_description[0]
 
 
+def load_shared_model_description(surrogate_model_file, surrogate_name, root=None):
+    """
+    Loads a model description, whose large parameter arrays are memory-mapped and shared by all processes (see
+    :mod:`memosim.shared_parameters`).
+
+    :param root: str, optional directory for the exported parameters, defaults to ``<surrogate_model_file>.shared``.
+    """
+    return shared_parameters.load_shared(surrogate_model_file, surrogate_name, load_model_description, root)
+
+
+model_description_cache = ModelDescriptionCache(load_model_description)
+"""
+Process-wide cache of the model descriptions, that have been loaded by simulators of this process.
+"""
+
+shared_model_description_cache = ModelDescriptionCache(load_shared_model_description)
+"""
+Process-wide cache of the model descriptions with memory-mapped parameters.
+"""
+
+shared_model_description_caches = {None: shared_model_description_cache}
+"""
+Process-wide caches of the model descriptions with memory-mapped parameters, one per export root.
+"""
+
+
+def get_shared_model_description_cache(root=None):
+    """
+    :param root: str, optional directory for the exported parameters.
+
+    :return: ModelDescriptionCache, the cache of the model descriptions, whose parameters are exported into *root*.
+    """
+    root = None if root is None else os.path.abspath(root)
+    if root not in shared_model_description_caches:
+        loader = functools.partial(load_shared_model_description, root=root)
+        shared_model_description_caches.setdefault(root, ModelDescriptionCache(loader))
+    return shared_model_description_caches[root]
+
+
 def create_simulator_meta_data(model_structure, model_name):
     param_names = model_structure.model_parameters
     attr_names = model_structure.model_outputs + model_structure.model_inputs
@@ -44,6 +94,40 @@ class EIDGenerator(object):
         return '%s%d' % (self.prefix, self.index)
 
 
+class GetDataPlan(object):
+    """
+    A compiled get_data request: the requested (EID, attribute) pairs are mapped to (row, column) pairs of the
+    population state, so that all values are read at once. Each call of :meth:`fill` returns a new response
+    dict-of-dicts, because mosaik may keep responses of in-process simulators, while the simulator steps ahead.
+
+    :param outputs: dict<str, list<str>>, the request (see :meth:`MosaikMeMoSimulator.get_data`).
+
+    :param entity_rows: dict<str, int>, maps EIDs to rows of the population.
+
+    :param output_indices: dict<str, int>, maps output names to columns of the population state.
+
+    :param dtype: dtype of the population state.
+    """
+
+    def __init__(self, outputs, entity_rows, output_indices, dtype=np.float64):
+        self.outputs = {eid: list(attrs) for eid, attrs in outputs.items()}
+        self._items = list(self.outputs.items())
+        self.rows = np.array([entity_rows[eid] for eid, attrs in outputs.items() for attr in attrs], dtype=np.intp)
+        self.cols = np.array([output_indices[attr] for attrs in outputs.values() for attr in attrs], dtype=np.intp)
+        self.values = np.empty(len(self.rows), dtype=dtype)
+
+    def matches(self, outputs):
+        return outputs == self.outputs
+
+    def fill(self, population):
+        """
+        :return: a new response with the current values of the population.
+        """
+        values = iter(population.get_values(self.rows, self.cols, out=self.values).tolist())
+        # zip() stops at the end of the attributes, before it takes the next value
+        return {eid: dict(zip(attrs, values)) for eid, attrs in self._items}
+
+
 class MosaikMeMoSimulator(mosaik_api.Simulator):
 
     SIM_CONFIG = {'python': 'memosim.mosaik_v2:MosaikMeMoSimulator'}
@@ -52,43 +136,111 @@ class MosaikMeMoSimulator(mosaik_api.Simulator):
         super().__init__({})
         # TODO: prefix  mit original model angleichen?
         self.eid_generator = EIDGenerator('memo_')
-        self.model_instances = {}  # maps EIDs to model
+        self.entity_rows = {}  # maps EIDs to rows of the population
+        self.get_data_plan = None  # the plan of the last get_data request
+        self.router = None  # aggregates the inputs of all entities
+        self.population = None  # simulates all entities
+        self.instrumentation = Instrumentation()  # measures the phases of steps, disabled by default
+        self.num_workers = None
+        self.pool = None  # optional worker processes that step the population
         self.sid = None # sim id
         self.step_size = None  # step size of the simulation
 
-    def init(self, sid, step_size, surrogate_model_file, surrogate_name):
+    def init(self, sid, step_size, surrogate_model_file, surrogate_name, krr_approximation=None, num_workers=None,
+             share_parameters=False, shared_parameters_root=None, aggregation=None, skip_tolerance=None, prediction_cache_options=None,
+             precision='float64', instrumentation_options=None):
+        """
+        see :meth:`mosaik_api.Simulator.init()`
+
+        :param krr_approximation: dict, optional keyword arguments of
+            :func:`~memosim.approximation_v2.create_approximation` (e.g. ``{'method': 'nystroem', 'rank': 200}`` or
+            ``{'method': 'truncated', 'tolerance': 1e-6}``). If set, the kernel ridge regression model of the
+            surrogate is replaced by an approximation.
+
+        :param num_workers: int, optional number of worker processes. If set, the entities are partitioned across
+            the workers, that step them in parallel (see :class:`~memosim.parallel_v2.WorkerPool`).
+
+        :param share_parameters: bool, whether the parameters of the regression model are memory-mapped from an
+            export, so that all simulator processes on a host share one copy (see :mod:`memosim.shared_parameters`).
+            Exports for older versions of the model file are removed, when the file is exported again.
+
+        :param shared_parameters_root: str, optional directory for the exports, defaults to
+            ``<surrogate_model_file>.shared``.
+
+        :param aggregation: dict<str, str>, optional reducers of the input attributes, e.g. {'P_el_set': 'mean'}
+            (see :mod:`memosim.aggregation`). By default, the values of all sources of an input are summed up.
+
+        :param skip_tolerance: float, optional, enables steady-state skipping of entities, whose inputs have not
+            changed by more than this tolerance (see :class:`~memosim.population_v2.PopulationSimulator`).
+
+        :param prediction_cache_options: dict, optional, enables a :class:`~memosim.prediction_cache.PredictionCache`
+            in front of the regression model. The options 'resolution' and 'max_entries' are passed to the cache; if
+            'persistent' is true, the cache is stored next to the model file by :meth:`finalize` and reused by later
+            runs. With *num_workers*, each worker fills a copy of the cache, which is merged back (entries and
+            counters) when the workers are stopped, i.e. when entities are added and by :meth:`finalize`.
+
+        :param precision: str, 'float64' or 'float32', the floating point precision of state, inputs and model
+            parameters (see :meth:`.RegressionModelSimulator.set_dtype`).
+
+        :param instrumentation_options: dict, optional, enables the instrumentation of steps from the start. The
+            options 'dump_path' and 'dump_interval' are passed to :meth:`set_instrumentation`.
+        """
         self.sid = sid
         self.step_size = step_size
+        self.num_workers = num_workers
         self.model_name = surrogate_name
 
         # load information about the metamodel from the model file
-        model_description = load_model_description(surrogate_model_file, surrogate_name)
+        if share_parameters:
+            cache = get_shared_model_description_cache(shared_parameters_root)
+        else:
+            cache = model_description_cache
+        model_description = cache.get(surrogate_model_file, surrogate_name)
         self.model_structure = model_description.model_structure
         self.regression_model = model_description.regression_model
 
+        # all entities share one regression model, that is evaluated once per step for the whole population
+        if krr_approximation is not None:
+            simulator = approximation_v2.create_approximation(self.regression_model, **krr_approximation)
+        else:
+            simulator = sim.RegressionModelFactory.create_instance(self.regression_model)
+        simulator.set_dtype(precision)
+        if prediction_cache_options is not None:
+            options = dict(prediction_cache_options)
+            if options.pop('persistent', False):
+                # predictions of approximations and of reduced precision are cached separately
+                variant = sorted((krr_approximation or {}).items())
+                if precision != 'float64':
+                    variant.append(('precision', precision))
+                variant = variant or None
+                options['path'] = prediction_cache.default_path(surrogate_model_file, surrogate_name, variant)
+            simulator.prediction_cache = prediction_cache.PredictionCache(**options)
+        self.population = PopulationSimulator(simulator, self.model_structure, skip_tolerance=skip_tolerance)
+        self.population.instrumentation = self.instrumentation
+        if instrumentation_options is not None:
+            self.set_instrumentation(True, **instrumentation_options)
+
         # create meta data dynamically:
         self.meta.update(create_simulator_meta_data(self.model_structure, surrogate_name))
+        self.meta['extra_methods'] = [
+            'get_instrumentation',
+            'set_instrumentation',
+        ]
 
-        # prepare DEFAULt aggregation functions for inputs
-        #self.aggregators = {attr: sim.Sum() for attr in self.model_structure.model_inputs}
-        self.aggregators = [sim.Sum() for attr in self.model_structure.model_inputs]
+        # inputs of all entities are aggregated into the external inputs of the population
+        self.router = InputRouter(self.entity_rows, self.model_structure.model_inputs, aggregation)
 
         return self.meta
 
     def create(self, num, model, **init_vals):
+        """
+        Creates *num* entities, that share the regression model of the simulator and only own a row of the
+        population's arrays. Init vals may be lists with one value per entity.
+        """
         entities = []
-        for i in range(num):
+        for row in self.population.add_entities(num, init_vals):
             eid = self.eid_generator.next()
-
-            # create the simulator
-            simulator = sim.RegressionModelFactory.create_instance(self.regression_model)
-            sim.RegressionModelFactory.create_structure(simulator, self.model_structure)
-
-            # initialize the simulator
-            sim.RegressionModelFactory.setup_initial_state(simulator, self.model_structure, init_vals)
-
-            self.model_instances[eid] = simulator
-
+            self.entity_rows[eid] = row
             entities.append({'eid': eid, 'type': model})
         return entities
 
@@ -106,18 +258,70 @@ class MosaikMeMoSimulator(mosaik_api.Simulator):
         :return: int
             time of the next simulation step (also in seconds since simulation start)
         """
-        for eid, attrs in inputs.items():
-            simulator = self.model_instances[eid]
-            input_container = simulator.external_inputs
-            for i, input_name in enumerate(self.model_structure.model_inputs):
-                #input_container[i] = self.aggregators[input_name](attrs[input_name])
-                input_container[i] = self.aggregators[i](attrs[input_name])
+        instrumentation = self.instrumentation
+        with instrumentation.measure('aggregate'):
+            self.router.apply(inputs, self.population.external_inputs)
 
-        for eid, simulator in self.model_instances.items():
-            simulator.step()
+        with instrumentation.measure('step'):
+            if self.num_workers:
+                self._step_pool()
+            else:
+                self.population.step()
+        instrumentation.tick()
 
         return (time + self.step_size)
 
+    def _step_pool(self):
+        # the pool is (re)started at the first step after entities have been created
+        if self.pool is not None and self.pool.num_entities != [self.population.num_entities]:
+            self.pool.stop()
+            self.pool = None
+        if self.pool is None:
+            self.pool = WorkerPool([self.population], self.num_workers)
+            self.pool.start()
+        self.pool.step()
+
+    def finalize(self):
+        if self.pool is not None:
+            self.pool.stop()
+            self.pool = None
+        cache = self.population.model.prediction_cache if self.population is not None else None
+        if cache is not None and cache.path is not None:
+            cache.save()
+        if self.instrumentation.enabled and self.instrumentation.dump_path is not None:
+            self.instrumentation.dump()
+
+    def set_instrumentation(self, enabled, dump_path=None, dump_interval=60.0):
+        """
+        Extra method, that enables or disables the instrumentation of steps. While enabled, the latencies of the
+        phases 'aggregate' (of the inputs), 'step' (of all entities), 'gather' (of the regression inputs), 'compute'
+        (evaluation of the regression model) and 'get_data' are recorded, as well as the evaluated rows per model
+        type. The phases 'gather' and 'compute' are executed by the worker processes, if *num_workers* is set, and are
+        not recorded then.
+
+        :param enabled: bool
+
+        :param dump_path: str, optional local JSON file, to which the report is written periodically and by
+            :meth:`finalize`.
+
+        :param dump_interval: float, minimum number of seconds between two periodic dumps.
+        """
+        self.instrumentation.enabled = enabled
+        self.instrumentation.dump_path = dump_path
+        self.instrumentation.dump_interval = dump_interval
+
+    def get_instrumentation(self, reset=False):
+        """
+        Extra method, that returns the report of the instrumentation (see
+        :meth:`~memosim.instrumentation.Instrumentation.report`). Latencies are given in seconds.
+
+        :param reset: bool, whether the measurements are discarded after reporting them.
+        """
+        report = self.instrumentation.report()
+        if reset:
+            self.instrumentation.reset()
+        return report
+
 
     def get_data(self, outputs):
         """
@@ -126,13 +330,11 @@ class MosaikMeMoSimulator(mosaik_api.Simulator):
         :param outputs: outputs is a dict mapping entity IDs to lists of attribute names whose values are requested.
 
         :return: The return value needs to be a dict of dicts mapping entity IDs and attribute names to their values.
+            Every call returns a new dict.
         """
-        data = {}
-        for eid, attrs in outputs.items():
-            data[eid] = {}
-            for attr in attrs:
-                data[eid][attr] = self.model_instances[eid].output_accessors[attr].run()
-        return data
-
-
-
+        with self.instrumentation.measure('get_data'):
+            if self.get_data_plan is None or not self.get_data_plan.matches(outputs):
+                # mosaik usually requests the same values every step, so the plan is compiled only when they change
+                self.get_data_plan = GetDataPlan(outputs, self.entity_rows, self.population.output_indices,
+                                                 self.population.state.dtype)
+            return self.get_data_plan.fill(self.population)
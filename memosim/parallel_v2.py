@@ -0,0 +1,215 @@
+"""
+Multi-core simulation of populations. The entities of one or more :class:`PopulationSimulators
+<.PopulationSimulator>` are partitioned across worker processes. External inputs and states are moved into
+shared memory, so that a step only requires a start signal and a barrier - no data is pickled per step.
+"""
+import multiprocessing
+import queue
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+def partition(costs, num_workers):
+    """
+    Partitions the entities of several populations into *num_workers* contiguous row ranges with balanced costs.
+
+    :param costs: list of (number of entities, cost per entity) tuples, one for each population.
+
+    :param num_workers: int, number of partitions.
+
+    :return: list with one list of (population index, start row, stop row) tuples per worker.
+    """
+    total = sum(num * cost for num, cost in costs)
+    if total <= 0:
+        # no measurable costs: balance the number of entities
+        costs = [(num, 1.0) for num, cost in costs]
+        total = sum(num for num, cost in costs)
+    target = max(total, 1) / num_workers
+    assignments = [[] for _ in range(num_workers)]
+    # each entity is assigned to the worker, whose share of the accumulated costs contains the entity's midpoint
+    offset = 0.0
+    for population_idx, (num, cost) in enumerate(costs):
+        midpoints = offset + (np.arange(num) + 0.5) * cost
+        workers = np.minimum((midpoints / target).astype(int), num_workers - 1)
+        for worker in np.unique(workers):
+            start, stop = np.searchsorted(workers, worker, 'left'), np.searchsorted(workers, worker, 'right')
+            assignments[worker].append((population_idx, int(start), int(stop)))
+        offset += num * cost
+    return assignments
+
+
+def measure_cost(population, num_samples=256, repeat=3):
+    """
+    Measures the time that the regression model of a population needs per entity and step. The state of the
+    population is not changed.
+
+    :return: float, seconds per entity.
+    """
+    num = min(num_samples, population.num_entities)
+    if num == 0:
+        return 0.0
+    inputs = population.input_plan.gather(population.external_inputs[:num], population.state[:num],
+                                          np.array(population.internal_inputs[:num]))
+    best = float('inf')
+    for _ in range(repeat):
+        begin = time.perf_counter()
+        population.model.compute_batch_responses(inputs)
+        best = min(best, time.perf_counter() - begin)
+    return best / num
+
+
+def _export_caches(populations, assignment):
+    # the prediction caches of the populations of a worker, which are merged into the caches of the main process
+    indices = sorted(set(population_idx for population_idx, start, stop in assignment))
+    return [(idx, populations[idx].model.prediction_cache.export()) for idx in indices
+            if populations[idx].model.prediction_cache is not None]
+
+
+def _work(populations, assignment, counters, barrier, stop_flag, results):
+    # counters: (populations x 2) evaluations and skips of the last step, which the main process adds up
+    try:
+        while True:
+            barrier.wait()
+            if stop_flag.value:
+                results.put(_export_caches(populations, assignment))
+                return
+            counters[:] = 0
+            for population_idx, start, stop in assignment:
+                population = populations[population_idx]
+                evaluations, skips = population.evaluations, population.skips
+                population.step(start, stop)
+                counters[population_idx] += (population.evaluations - evaluations, population.skips - skips)
+            barrier.wait()
+    except Exception:
+        # wakes up the main process, instead of letting it wait forever
+        barrier.abort()
+        raise
+
+
+class WorkerPool():
+    """
+    Steps the entities of several populations on *num_workers* processes. Entities are partitioned by their measured
+    cost per step, so that populations of different model types can be mixed.
+
+    While the pool is running, the arrays of the populations (see :meth:`.PopulationSimulator.array_names`), e.g.
+    :attr:`external_inputs` and :attr:`state`, live in shared memory and may be read and written by the main process
+    between steps. Entities must not be added while the pool is running. The counters of evaluated and skipped entity
+    steps are added to the populations of the main process after each step.
+
+    Worker processes are forked, so the pool is only available on platforms that support the fork start method.
+    Prediction caches of the populations (see :class:`~memosim.prediction_cache.PredictionCache`) are filled by the
+    workers and merged back into the caches of the main process by :meth:`stop`.
+
+    :param populations: list of :class:`.PopulationSimulator`
+
+    :param num_workers: int, number of worker processes.
+    """
+
+    def __init__(self, populations, num_workers):
+        if 'fork' not in multiprocessing.get_all_start_methods():
+            raise Exception('WorkerPool requires the fork start method, which is not available on this platform.')
+        self.populations = populations
+        self.num_workers = num_workers
+        self.num_entities = None
+        self.assignments = None
+        self._shared_memory = []
+        self._processes = []
+        self._barrier = None
+        self._stop_flag = None
+        self._results = None
+        self._cache_counters = None
+        self._counters = None  # (workers x populations x 2) evaluations and skips of the last step
+
+    @property
+    def running(self):
+        return len(self._processes) > 0
+
+    def start(self):
+        context = multiprocessing.get_context('fork')
+        self.num_entities = [population.num_entities for population in self.populations]
+        costs = [(population.num_entities, measure_cost(population)) for population in self.populations]
+        self.assignments = partition(costs, self.num_workers)
+
+        for population in self.populations:
+            for name in population.array_names():
+                setattr(population, name, self._share(getattr(population, name)))
+        self._counters = self._share(np.zeros((self.num_workers, len(self.populations), 2), dtype=np.int64))
+
+        # counters of the prediction caches at the fork, which are inherited by all workers
+        self._cache_counters = [None if population.model.prediction_cache is None else
+                                (population.model.prediction_cache.hits, population.model.prediction_cache.misses)
+                                for population in self.populations]
+        self._barrier = context.Barrier(self.num_workers + 1)
+        self._stop_flag = context.Value('b', False)
+        self._results = context.Queue()
+        for worker, assignment in enumerate(self.assignments):
+            process = context.Process(target=_work, args=(self.populations, assignment, self._counters[worker],
+                                                          self._barrier, self._stop_flag, self._results), daemon=True)
+            process.start()
+            self._processes.append(process)
+
+    def _merge_caches(self, caches):
+        for population_idx, exported in caches:
+            hits, misses = self._cache_counters[population_idx]
+            self.populations[population_idx].model.prediction_cache.merge(exported, hits, misses)
+
+    def _share(self, array):
+        memory = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+        self._shared_memory.append(memory)
+        shared = np.ndarray(array.shape, dtype=array.dtype, buffer=memory.buf)
+        shared[:] = array
+        return shared
+
+    def step(self):
+        """
+        Steps all entities of all populations and returns when all workers have finished.
+        """
+        try:
+            self._barrier.wait()  # start signal
+            self._barrier.wait()  # all workers are done
+        except Exception:
+            self.stop()
+            raise Exception('A worker of the pool has failed.')
+        for population, (evaluations, skips) in zip(self.populations, self._counters.sum(axis=0).tolist()):
+            population.evaluations += evaluations
+            population.skips += skips
+
+    def stop(self):
+        """
+        Stops the workers, merges their prediction caches and moves the arrays of the populations back into private
+        memory.
+        """
+        if self.running:
+            self._stop_flag.value = True
+            try:
+                self._barrier.wait(timeout=10)
+                stopped = len(self._processes)
+            except Exception:
+                stopped = 0  # failed workers do not report their caches
+            # the results are received before joining, because workers only exit after their results are sent
+            for _ in range(stopped):
+                try:
+                    self._merge_caches(self._results.get(timeout=10))
+                except queue.Empty:
+                    break
+            for process in self._processes:
+                process.join(timeout=10)
+                if process.is_alive():
+                    process.terminate()
+        self._processes = []
+
+        if len(self._shared_memory) == 0:
+            return
+        for population in self.populations:
+            for name in population.array_names():
+                setattr(population, name, np.array(getattr(population, name)))
+        self._counters = None
+        for memory in self._shared_memory:
+            try:
+                memory.close()
+            except BufferError:
+                pass  # the memory is released, when the last view is garbage collected
+            memory.unlink()
+        self._shared_memory = []
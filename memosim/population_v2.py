@@ -0,0 +1,232 @@
+"""
+This module comprises the :class:`PopulationSimulator`, an array-backed variant of the v2 simulation engine. All
+entities of a population share one model structure and one regression model. External inputs, state and outputs of
+all entities are stored as 2-D arrays (entities x columns), so that the regression model is evaluated only once per
+simulation step for the whole population.
+"""
+import numpy as np
+
+import memosim.simulation_v2 as sim
+from memosim import kernels_v2 as kernels
+from memosim.instrumentation import Instrumentation, model_type
+
+
+class PopulationSimulator():
+    """
+    Simulates a population of entities, that share one model structure and one regression model.
+
+    :param regression_model_simulator: :class:`.RegressionModelSimulator`, evaluates the regression model for all
+        entities of the population via :meth:`.RegressionModelSimulator.compute_batch_responses`. The arrays of the
+        population have the precision of the model (see :meth:`.RegressionModelSimulator.set_dtype`). Its structure
+        is created, unless it already has one.
+
+    :param model_structure: ModelStructure of the simulated model.
+
+    :param skip_tolerance: float, optional, enables steady-state skipping: entities, whose internal inputs deviate
+        by at most this tolerance from the inputs of their last evaluation and whose state has not been modified
+        since, keep their state instead of being evaluated again (see :meth:`step`).
+    """
+
+    def __init__(self, regression_model_simulator, model_structure, skip_tolerance=None):
+        self.model = regression_model_simulator
+        self.model_structure = model_structure
+        self.skip_tolerance = skip_tolerance
+        self.evaluations = 0  # number of evaluated entity steps
+        self.skips = 0  # number of skipped entity steps
+        # measures the phases 'gather' and 'compute' of each step, disabled by default
+        self.instrumentation = Instrumentation()
+        self._model_type = model_type(regression_model_simulator)
+        self.num_inputs = len(model_structure.model_inputs)
+        self.num_outputs = len(model_structure.model_outputs)
+
+        # the accessors of the shared model are compiled into an input plan, that gathers the inputs of all rows. A
+        # model, that already has a structure (e.g. because it is also simulated by an ensemble), keeps it.
+        if regression_model_simulator.input_plan is None:
+            sim.RegressionModelFactory.create_structure(regression_model_simulator, model_structure)
+        self.input_plan = regression_model_simulator.input_plan
+        if len(self.input_plan.dynamic_accessors) > 0:
+            raise Exception('Only external, feedback and constant inputs are supported by populations.')
+        self.output_indices = {attr: accessor.idx
+                               for attr, accessor in regression_model_simulator.output_accessors.items()}
+
+        self.num_entities = 0
+        self._reserve(0)
+
+    @property
+    def capacity(self):
+        """
+        Number of entities, for which the arrays of the population are allocated.
+        """
+        return len(self._state_buffer)
+
+    def _reserve(self, capacity):
+        # allocates buffers for *capacity* entities; external inputs and state are views of their first rows
+        dtype = self.model.dtype
+        external_inputs = np.zeros((capacity, self.num_inputs), dtype=dtype)
+        state = np.zeros((capacity, self.num_outputs), dtype=dtype)
+        if self.num_entities > 0:
+            external_inputs[:self.num_entities] = self.external_inputs
+            state[:self.num_entities] = self.state
+        self._external_inputs_buffer = external_inputs
+        self._state_buffer = state
+        self._internal_inputs_buffer = np.zeros((capacity, self.input_plan.num_inputs), dtype=dtype)
+        if self.num_entities > 0:
+            self._internal_inputs_buffer[:self.num_entities] = self._internal_inputs
+        if self.skip_tolerance is not None:
+            # inputs and outputs of the last evaluation of each entity
+            self._last_inputs_buffer = np.zeros((capacity, self.input_plan.num_inputs), dtype=dtype)
+            self._last_state_buffer = np.zeros((capacity, self.num_outputs), dtype=dtype)
+            self._evaluated_buffer = np.zeros(capacity, dtype=bool)
+            if self.num_entities > 0:
+                self._last_inputs_buffer[:self.num_entities] = self._last_inputs
+                self._last_state_buffer[:self.num_entities] = self._last_state
+                self._evaluated_buffer[:self.num_entities] = self._evaluated
+        self._resize(self.num_entities)
+
+    def _resize(self, num_entities):
+        self.num_entities = num_entities
+        self.external_inputs = self._external_inputs_buffer[:num_entities]
+        self.state = self._state_buffer[:num_entities]
+        self._internal_inputs = self._internal_inputs_buffer[:num_entities]
+        if self.skip_tolerance is not None:
+            self._last_inputs = self._last_inputs_buffer[:num_entities]
+            self._last_state = self._last_state_buffer[:num_entities]
+            self._evaluated = self._evaluated_buffer[:num_entities]
+
+    def add_entities(self, num, init_vals):
+        """
+        Adds *num* entities to the population and initializes their state. The arrays of the population grow
+        geometrically, so that adding entities one by one takes amortized constant time.
+
+        :param num: int, the number of entities to add.
+
+        :param init_vals: dict<str, object>, maps output or init attribute names to initial values. Values may be
+            scalars or arrays with one value per new entity.
+
+        :return: range, the rows of the new entities.
+        """
+        first = self.num_entities
+        stop = first + num
+        # the arrays may have been replaced since the last allocation, e.g. by a WorkerPool
+        replaced = (self.state.base is not self._state_buffer or
+                    self.external_inputs.base is not self._external_inputs_buffer or
+                    self._internal_inputs.base is not self._internal_inputs_buffer)
+        if stop > self.capacity or replaced:
+            self._reserve(max(stop, 2 * self.capacity))
+        self._resize(stop)
+        self.external_inputs[first:stop] = 0.0
+        self._internal_inputs[first:stop] = np.nan
+        if self.skip_tolerance is not None:
+            self._evaluated[first:stop] = False
+        sim.RegressionModelFactory.initial_state(self.model_structure, init_vals, out=self.state[first:stop])
+        return range(first, stop)
+
+    def step(self, start=0, stop=None):
+        """
+        Computes the next state of all entities with one evaluation of the regression model. Optionally, only the
+        entities in the rows *start* to *stop* are stepped.
+
+        With steady-state skipping, only the entities, whose inputs or state have changed, are evaluated. The
+        counters :attr:`evaluations` and :attr:`skips` count evaluated and skipped entity steps (including the steps
+        executed by a :class:`~memosim.parallel_v2.WorkerPool`).
+
+        If :attr:`instrumentation` is enabled, the latencies of the phases 'gather' (of the regression inputs) and
+        'compute' (evaluation of the regression model) and the evaluated rows per model type are recorded.
+        """
+        if stop is None:
+            stop = self.num_entities
+        if stop <= start:
+            return
+        instrumentation = self.instrumentation
+        with instrumentation.measure('gather'):
+            inputs = self.input_plan.gather(self.external_inputs[start:stop], self.state[start:stop],
+                                            self._internal_inputs[start:stop])
+        if self.skip_tolerance is None:
+            with instrumentation.measure('compute'):
+                self.state[start:stop] = self.model.batch_responses(inputs)
+            instrumentation.count(self._model_type, stop - start)
+            self.evaluations += stop - start
+            return
+
+        state = self.state[start:stop]
+        last_inputs = self._last_inputs[start:stop]
+        last_state = self._last_state[start:stop]
+        steady = self._evaluated[start:stop].copy()
+        steady &= np.all(np.abs(inputs - last_inputs) <= self.skip_tolerance, axis=1)
+        steady &= np.all((state == last_state) | (np.isnan(state) & np.isnan(last_state)), axis=1)
+        dirty = np.flatnonzero(~steady)
+        with instrumentation.measure('compute'):
+            if len(dirty) == len(steady):
+                state[:] = self.model.batch_responses(inputs)
+            elif len(dirty) > 0:
+                state[dirty] = self.model.batch_responses(inputs[dirty])
+        if len(dirty) > 0:
+            instrumentation.count(self._model_type, len(dirty))
+        last_inputs[dirty] = inputs[dirty]
+        last_state[dirty] = state[dirty]
+        self._evaluated[start + dirty] = True
+        self.evaluations += len(dirty)
+        self.skips += len(steady) - len(dirty)
+
+    def rollout(self, schedule, init_state=None):
+        """
+        Simulates a schedule of external inputs for all entities in one call, without changing the state of the
+        population (see :meth:`.RegressionModelSimulator.rollout`).
+
+        :param schedule: np.ndarray, (steps x entities x external inputs)
+
+        :param init_state: np.ndarray, (entities x outputs) state before the first step, defaults to the current
+            state of the population.
+
+        :return: np.ndarray, (steps x entities x outputs) the state after each step.
+        """
+        if init_state is None:
+            init_state = self.state
+        return self.model.rollout(schedule, init_state)
+
+    def get_value(self, row, attr):
+        """
+        :return: the current value of output *attr* of the entity in *row*.
+        """
+        return self.state[row, self.output_indices[attr]]
+
+    @property
+    def internal_inputs(self):
+        """
+        The regression inputs (see :class:`~memosim.simulation_v2.InputPlan`) of the last step of all entities
+        (entities x regression inputs). Rows of entities, that have not been stepped yet, are NaN.
+        """
+        return self._internal_inputs
+
+    def array_names(self):
+        """
+        :return: list<str>, the attributes, that hold arrays with one row per entity. A
+            :class:`~memosim.parallel_v2.WorkerPool` moves them into shared memory.
+        """
+        names = ['external_inputs', 'state', '_internal_inputs']
+        if self.skip_tolerance is not None:
+            names += ['_last_inputs', '_last_state', '_evaluated']
+        return names
+
+    def get_input(self, row, idx):
+        """
+        :return: the regression input *idx* (see :class:`~memosim.simulation_v2.InputPlan`) of the last step of the
+            entity in *row*, NaN before its first step.
+        """
+        return self._internal_inputs[row, idx]
+
+    def get_values(self, rows, cols, out=None):
+        """
+        Reads several output values at once.
+
+        :param rows: np.ndarray, rows of the requested values.
+
+        :param cols: np.ndarray, output columns of the requested values (see :attr:`output_indices`).
+
+        :param out: np.ndarray, optional array that receives the values.
+
+        :return: np.ndarray, the values state[rows[i], cols[i]].
+        """
+        if out is None:
+            out = np.empty(len(rows), dtype=self.state.dtype)
+        return kernels.extract_outputs(self.state, rows, cols, out)
@@ -0,0 +1,56 @@
+"""
+Validation of reduced-precision simulations: a reference rollout is simulated in double precision and in the
+reduced precision, and the deviations of the responses are reported.
+"""
+import numpy as np
+
+import memosim.simulation_v2 as sim
+
+
+def precision_deviation(regression_model_description, model_structure, schedule, init_vals, dtype=np.float32,
+                        create_simulator=sim.RegressionModelFactory.create_instance):
+    """
+    Simulates a schedule with double precision and with *dtype* and compares the responses.
+
+    :param regression_model_description: the description of the regression model.
+
+    :param model_structure: ModelStructure of the simulated model.
+
+    :param schedule: np.ndarray, (steps x external inputs) or (steps x entities x external inputs) the reference
+        schedule (see :meth:`.RegressionModelSimulator.rollout`).
+
+    :param init_vals: dict<str, object>, maps output or init attribute names to initial values.
+
+    :param dtype: the reduced precision.
+
+    :param create_simulator: callable(regression_model_description), creates the simulators, e.g. an approximation.
+
+    :return: dict<str, dict<str, float>>, maps each output to its maximum absolute deviation 'max_abs', mean
+        absolute deviation 'mean_abs' and maximum deviation relative to the largest absolute reference value
+        'max_rel'.
+    """
+    responses = []
+    for precision in [np.float64, dtype]:
+        simulator = create_simulator(regression_model_description)
+        simulator.set_dtype(precision)
+        sim.RegressionModelFactory.create_structure(simulator, model_structure)
+        if np.ndim(schedule) == 3:
+            init_state = np.zeros((np.shape(schedule)[1], len(model_structure.model_outputs)))
+        else:
+            init_state = np.zeros(len(model_structure.model_outputs))
+        sim.RegressionModelFactory.initial_state(model_structure, init_vals, out=init_state)
+        outputs = simulator.rollout(schedule, init_state)
+        responses.append(np.reshape(outputs.astype(np.float64), (-1, outputs.shape[-1])))
+
+    reference, reduced = responses
+    deviation = np.abs(reduced - reference)
+    report = {}
+    for idx, attr in enumerate(model_structure.model_outputs):
+        scale = np.max(np.abs(reference[:, idx])) if len(reference) > 0 else 0.0
+        max_abs = float(np.max(deviation[:, idx])) if len(deviation) > 0 else 0.0
+        report[attr] = {
+            'max_abs': max_abs,
+            'mean_abs': float(np.mean(deviation[:, idx])) if len(deviation) > 0 else 0.0,
+            'max_rel': max_abs / scale if scale > 0 else 0.0,
+        }
+    return report
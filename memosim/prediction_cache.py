@@ -0,0 +1,162 @@
+"""
+Memoization of regression model predictions. Surrogates, that are driven by discrete schedules, are evaluated for the
+same input vectors again and again. A :class:`PredictionCache` stores the responses for input vectors, that are
+quantized to a configurable resolution, so that recurring inputs are not evaluated again.
+"""
+import collections
+import hashlib
+import os
+
+import numpy as np
+
+
+def default_path(surrogate_model_file, surrogate_name, variant=None):
+    """
+    :param variant: object, optional, distinguishes different simulators of the same surrogate (e.g. the options of
+        an approximation).
+
+    :return: str, the path of the persistent cache of a surrogate. It depends on the modification time of the model
+        file, so that the predictions of modified files are not reused.
+    """
+    path = os.path.abspath(surrogate_model_file)
+    name = '%s-%d' % (surrogate_name, os.stat(path).st_mtime_ns)
+    if variant is not None:
+        name += '-' + hashlib.sha1(repr(variant).encode()).hexdigest()[:8]
+    return os.path.join(path + '.predictions', name + '.npz')
+
+
+class PredictionCache():
+    """
+    A bounded LRU cache of predictions, keyed by quantized input vectors. Inputs, that round to the same multiples of
+    *resolution*, share one prediction - the response of the first of them, that was evaluated. The resolution
+    therefore bounds the deviation of the inputs, for which a cached prediction is returned.
+
+    :param resolution: float, quantization of the inputs.
+
+    :param max_entries: int, maximum number of cached predictions. The least recently used ones are evicted.
+
+    :param path: str, optional .npz file, that persists the cache between runs (see :meth:`save`). Its entries are
+        loaded, if it exists and was saved with the same resolution.
+    """
+
+    def __init__(self, resolution=1e-9, max_entries=2 ** 16, path=None):
+        self.resolution = resolution
+        self.max_entries = max_entries
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()  # maps quantized inputs (bytes) to responses
+        if path is not None and os.path.exists(path):
+            self.load(path)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def quantize(self, inputs):
+        # adding 0.0 maps -0.0 to 0.0, so that both share a key
+        return np.round(np.asarray(inputs, dtype=float) / self.resolution) + 0.0
+
+    def responses(self, inputs, compute):
+        """
+        :param inputs: np.ndarray, (inputs) one input vector.
+
+        :param compute: callable(inputs), computes the responses, if they are not cached.
+
+        :return: np.ndarray, (outputs) the responses.
+        """
+        key = self.quantize(inputs).tobytes()
+        responses = self._entries.get(key)
+        if responses is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return np.array(responses)
+        self.misses += 1
+        responses = np.array(compute(inputs))
+        self._insert(key, responses)
+        return np.array(responses)
+
+    def batch_responses(self, inputs, compute):
+        """
+        :param inputs: np.ndarray, (rows x inputs) one input vector per row.
+
+        :param compute: callable(inputs), computes the responses for several rows, that are not cached.
+
+        :return: np.ndarray, (rows x outputs) the responses.
+        """
+        if len(inputs) == 0:
+            return compute(inputs)
+        # each distinct input vector is looked up only once
+        keys, index, inverse = np.unique(self.quantize(inputs), axis=0, return_index=True, return_inverse=True)
+        inverse = np.reshape(inverse, -1)
+        found = [self._entries.get(key.tobytes()) for key in keys]
+        missing = [i for i, responses in enumerate(found) if responses is None]
+        for i, responses in enumerate(found):
+            if responses is not None:
+                self._entries.move_to_end(keys[i].tobytes())
+        if len(missing) > 0:
+            computed = compute(np.ascontiguousarray(inputs[index[missing]]))
+            for i, responses in zip(missing, computed):
+                found[i] = np.array(responses)
+                self._insert(keys[i].tobytes(), found[i])
+        # rows, whose input vector occurs more than once, are evaluated only once
+        self.misses += len(missing)
+        self.hits += len(inputs) - len(missing)
+        return np.array(found)[inverse]
+
+    def _insert(self, key, responses):
+        self._entries[key] = responses
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+    def export(self):
+        """
+        :return: dict, the entries (as list of (key, responses) pairs, least recently used first) and counters of the
+            cache, that can be pickled and added to another cache with :meth:`merge`.
+        """
+        return {'entries': list(self._entries.items()), 'hits': self.hits, 'misses': self.misses}
+
+    def merge(self, exported, hits=0, misses=0):
+        """
+        Adds the entries of another cache (see :meth:`export`), e.g. of a worker process. Existing entries are kept.
+
+        :param exported: dict, the result of :meth:`export`.
+
+        :param hits: int, the number of hits of the other cache, that have already been counted by this cache, e.g.
+            the hits before the worker was forked.
+
+        :param misses: int, like *hits*.
+        """
+        for key, responses in exported['entries']:
+            if key not in self._entries:
+                self._insert(key, responses)
+        self.hits += exported['hits'] - hits
+        self.misses += exported['misses'] - misses
+
+    def load(self, path):
+        """
+        Adds the entries of a saved cache, if it was saved with the same resolution.
+        """
+        with np.load(path) as data:
+            if data['resolution'] != self.resolution:
+                return
+            for key, responses in zip(data['keys'], data['responses']):
+                self._insert(key.tobytes(), responses)
+
+    def save(self, path=None):
+        """
+        Saves all entries to an .npz file. The file is replaced atomically.
+
+        :param path: str, the file, defaults to :attr:`path`.
+        """
+        path = path or self.path
+        if path is None:
+            raise Exception('No path for the prediction cache defined.')
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        keys = np.array([np.frombuffer(key) for key in self._entries])
+        responses = np.array(list(self._entries.values()))
+        temp_path = '%s.tmp-%d.npz' % (path, os.getpid())
+        np.savez(temp_path, resolution=self.resolution, keys=keys, responses=responses)
+        os.replace(temp_path, path)
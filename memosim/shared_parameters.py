@@ -0,0 +1,126 @@
+"""
+Memory-mapped model parameters, that are shared by all processes on a host.
+
+A loaded model description is exported once into a directory: large NumPy arrays (e.g. ``X_fit``, ``dual_coef``,
+``coefs`` or the arrays of sklearn estimators) are stored as .npy files and the rest of the description is pickled
+with references to these files. Loading the exported description only unpickles the small remainder and memory-maps
+the arrays read-only, so that all processes share one copy of the parameters in the page cache.
+"""
+import os
+import pickle
+import shutil
+
+import numpy as np
+
+MIN_SHARED_BYTES = 2 ** 16
+"""
+Arrays smaller than this are pickled with the description instead of being memory-mapped.
+"""
+
+
+class _ParameterPickler(pickle.Pickler):
+
+    def __init__(self, file, directory, min_bytes):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.directory = directory
+        self.min_bytes = min_bytes
+        self.arrays = {}  # maps ids of exported arrays to their file names
+
+    def persistent_id(self, obj):
+        if type(obj) is not np.ndarray or obj.nbytes < self.min_bytes or obj.dtype.hasobject:
+            return None
+        if id(obj) not in self.arrays:
+            name = 'array%d.npy' % (len(self.arrays))
+            np.save(os.path.join(self.directory, name), obj)
+            self.arrays[id(obj)] = name
+        return self.arrays[id(obj)]
+
+
+class _ParameterUnpickler(pickle.Unpickler):
+
+    def __init__(self, file, directory):
+        super().__init__(file)
+        self.directory = directory
+
+    def persistent_load(self, name):
+        return np.load(os.path.join(self.directory, name), mmap_mode='r')
+
+
+def export_description(model_description, directory, min_bytes=MIN_SHARED_BYTES):
+    """
+    Exports a model description into *directory*. The directory is created atomically, so concurrent exports of the
+    same description do not interfere.
+
+    :param model_description: the model description (any picklable object).
+
+    :param directory: str, the export directory, which must not exist yet.
+
+    :param min_bytes: int, minimum size of memory-mapped arrays.
+    """
+    temp_directory = '%s.tmp-%d' % (directory, os.getpid())
+    os.makedirs(temp_directory)
+    try:
+        with open(os.path.join(temp_directory, 'description.pickle'), 'wb') as file:
+            _ParameterPickler(file, temp_directory, min_bytes).dump(model_description)
+        os.rename(temp_directory, directory)
+    except OSError:
+        shutil.rmtree(temp_directory, ignore_errors=True)
+        if not os.path.isdir(directory):
+            raise
+
+
+def import_description(directory):
+    """
+    :param directory: str, a directory created by :func:`export_description`.
+
+    :return: the model description, whose large arrays are read-only memory maps.
+    """
+    with open(os.path.join(directory, 'description.pickle'), 'rb') as file:
+        return _ParameterUnpickler(file, directory).load()
+
+
+def export_directory(surrogate_model_file, surrogate_name, root=None):
+    """
+    :param root: str, optional directory for exports, defaults to ``<surrogate_model_file>.shared``.
+
+    :return: str, the export directory of a surrogate. It depends on the modification time of the model file, so
+        that modified files are exported again.
+    """
+    path = os.path.abspath(surrogate_model_file)
+    if root is None:
+        root = path + '.shared'
+    return os.path.join(root, '%s-%d' % (surrogate_name, os.stat(path).st_mtime_ns))
+
+
+def load_shared(surrogate_model_file, surrogate_name, loader, root=None):
+    """
+    Loads a model description with memory-mapped parameters. If the surrogate has not been exported yet, it is
+    loaded with *loader* and exported first.
+
+    :param loader: callable(surrogate_model_file, surrogate_name), that loads a model description from its file.
+
+    :param root: str, optional directory for exports (see :func:`export_directory`).
+
+    :return: the model description.
+    """
+    directory = export_directory(surrogate_model_file, surrogate_name, root)
+    if not os.path.isdir(directory):
+        export_description(loader(surrogate_model_file, surrogate_name), directory)
+        remove_stale_exports(directory)
+    return import_description(directory)
+
+
+def remove_stale_exports(directory):
+    """
+    Removes the exports of a surrogate for other modification times of its model file. Processes, that still use
+    the memory maps of a removed export, keep reading them, until they are closed.
+
+    :param directory: str, the current export directory (see :func:`export_directory`).
+    """
+    root, current = os.path.split(directory)
+    surrogate_name = current.rsplit('-', 1)[0]
+    for name in os.listdir(root):
+        prefix, _, mtime = name.rpartition('-')
+        # temporary directories of exports in progress end with '.tmp-<pid>' and are left alone
+        if prefix == surrogate_name and mtime.isdigit() and name != current:
+            shutil.rmtree(os.path.join(root, name), ignore_errors=True)
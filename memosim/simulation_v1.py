@@ -67,7 +67,10 @@ The :class:`SimpleSimulationMetaModel` is a :class:`SimulationMetaModel` that us
 """
 
 
+import atexit
+import concurrent.futures
 import copy
+import os
 #
 # class SurrogateSimulationModel():
 #     """
@@ -229,10 +232,85 @@ class SimpleMetaModelSimulator(MetaModelSimulator):
         responses = {name: y[name][0] for name in response_names}
         return responses
 
+    def step_batch(self, states):
+        """
+        Computes new values for one or more output variables of several states with one prediction.
+
+        :param states: list of dict<str, object>,
+            dictionaries that map property names to values.
+
+        :return: list of dict<str, object>,
+            returns one dictionary per state that maps output names to their predicted values.
+        """
+        input_names = self.meta_model.input_names
+        response_names = self.meta_model.response_names
+        X = [[state[var] for var in input_names] for state in states]
+        y = self.meta_model.predict(X)
+        columns = [(name, y[name]) for name in response_names]
+        return [{name: values[idx] for name, values in columns} for idx in range(len(states))]
+
+
+_thread_pool = None
+
+
+def get_thread_pool():
+    """
+    :return: concurrent.futures.ThreadPoolExecutor, the process-wide thread pool, that evaluates independent
+        metamodels concurrently. It has one thread per CPU and is created on first use (again after
+        :func:`shutdown_thread_pool`).
+    """
+    global _thread_pool
+    if _thread_pool is None:
+        _thread_pool = concurrent.futures.ThreadPoolExecutor(max_workers=os.cpu_count() or 1,
+                                                             thread_name_prefix='memosim')
+    return _thread_pool
+
+
+@atexit.register
+def shutdown_thread_pool():
+    """
+    Shuts down the process-wide thread pool (see :func:`get_thread_pool`) after its pending evaluations. This is
+    called at exit and by :meth:`memosim.mosaik.MosaikMeMoSimulator.finalize`.
+    """
+    global _thread_pool
+    if _thread_pool is not None:
+        _thread_pool.shutdown(wait=True)
+        _thread_pool = None
+
 
 class CombinedMetaModelSimulator(MetaModelSimulator):
-    def __init__(self, metamodels):
+    """
+    This MetaModelSimulator combines the responses of several metamodels.
+
+    Each response must be predicted by exactly one metamodel, otherwise an exception is raised at construction. A
+    metamodel, that reads a response of another metamodel, reads its value of the previous step, because the
+    responses of a step are stored only after all metamodels have been evaluated. Therefore, all metamodels of a
+    step are independent: :meth:`step_batch` evaluates them concurrently on the :func:`process-wide thread pool
+    <get_thread_pool>` (NumPy and sklearn release the GIL during most computations).
+
+    :param metamodels: list of :class:`memotrainer.metamodels.MetaModel`
+
+    :param concurrent: bool, whether :meth:`step_batch` evaluates the metamodels concurrently, if there are several
+        metamodels and CPUs.
+
+    :param min_concurrent_states: int, minimum number of states of a batch, that is evaluated concurrently. Smaller
+        batches are evaluated sequentially, because the overhead of the thread pool outweighs the gain.
+    """
+
+    def __init__(self, metamodels, concurrent=True, min_concurrent_states=64):
         self.metamodel_simulators = [SimpleMetaModelSimulator(m) for m in metamodels]
+        # concurrency does not pay off for a single metamodel or a single CPU
+        self.concurrent = concurrent and len(metamodels) > 1 and (os.cpu_count() or 1) > 1
+        self.min_concurrent_states = min_concurrent_states
+
+        # maps each response to the index of the metamodel, that predicts it
+        self.response_owners = {}
+        for idx, m in enumerate(metamodels):
+            for name in m.response_names:
+                if name in self.response_owners:
+                    raise Exception('Response %s is predicted by metamodels %d and %d.' % (
+                        name, self.response_owners[name], idx))
+                self.response_owners[name] = idx
 
     def step(self, state):
         """
@@ -244,13 +322,36 @@ class CombinedMetaModelSimulator(MetaModelSimulator):
         :return: dict<str, object>,
             returns a dictionary that maps output names to their predicted values.
         """
-        # compute output for each metamodel
+        # compute output for each metamodel, responses are disjoint
         responses = {}
         for m in self.metamodel_simulators:
             m_out = m.step(state)
             responses.update(m_out)
         return responses
 
+    def step_batch(self, states):
+        """
+        Computes new values for one or more output variables of several states. Each metamodel is evaluated with one
+        prediction for all states.
+
+        :param states: list of dict<str, object>,
+            dictionaries that map property names to values.
+
+        :return: list of dict<str, object>,
+            returns one dictionary per state that maps output names to their predicted values.
+        """
+        if self.concurrent and len(states) >= self.min_concurrent_states:
+            pool = get_thread_pool()
+            futures = [pool.submit(m.step_batch, states) for m in self.metamodel_simulators]
+            results = [future.result() for future in futures]
+        else:
+            results = [m.step_batch(states) for m in self.metamodel_simulators]
+        responses = results[0]
+        for result in results[1:]:
+            for state_responses, m_out in zip(responses, result):
+                state_responses.update(m_out)
+        return responses
+
 
 class SurrogateModelSimulator(object):
 
@@ -269,18 +370,33 @@ class SurrogateModelSimulator(object):
         self.state.set_mode('pre-step')
 
     def step(self):
-        if not self.state.mode == 'pre-step': # leider noetig da sonst die virtuellen states nicht aktualisiert werden.
-            self.state.set_mode('pre-step')
-        # make sure all inputs have been updated by the user
-        self.state.set_mode('step')
+        state = self.begin_step()
 
         # compute output for each metamodel
         #new_state = {}
         #for m in self.meta_models:
         #    m_out = m.step(self.state)
         #    new_state.update(m_out)
-        new_state = self.metamodel_simulator.step(self.state)
+        new_state = self.metamodel_simulator.step(state)
+
+        self.end_step(new_state)
 
+    def begin_step(self):
+        """
+        First part of :meth:`step`: validates the inputs and updates the virtual states.
+
+        :return: the state, from which the metamodels compute the responses of the step.
+        """
+        if not self.state.mode == 'pre-step': # leider noetig da sonst die virtuellen states nicht aktualisiert werden.
+            self.state.set_mode('pre-step')
+        # make sure all inputs have been updated by the user
+        self.state.set_mode('step')
+        return self.state
+
+    def end_step(self, new_state):
+        """
+        Second part of :meth:`step`: stores the responses of the metamodels.
+        """
         # update state
         self.state.set_mode('post-step')
         for attribute, new_val in new_state.items():
@@ -296,6 +412,130 @@ class SurrogateModelSimulator(object):
         self.state[attr_name] = value
 
 
+class TrustedSurrogateModelSimulator(SurrogateModelSimulator):
+    """
+    A :class:`SurrogateModelSimulator`, that validates the model structure and its metamodels once and then steps
+    without the mode state machine of :class:`ModelState`. All attributes are kept in one flat dictionary and each
+    step executes a precompiled sequence of operations: update the virtual states, evaluate the metamodels and store
+    their responses. The checks, that the strict simulator repeats in every step, are made at construction (all
+    metamodel inputs are known attributes, the responses are exactly the model outputs), by :meth:`init` (all
+    parameters are initialized) and by the first :meth:`step` (all inputs are set).
+
+    Unlike the strict simulator, inputs keep their values between steps, so they only need to be set when they
+    change. Use :class:`SurrogateModelSimulator` to debug models, that violate the checks during a simulation.
+
+    :param model_structure_description: ModelStructure of the simulated model.
+
+    :param metamodel: :class:`memotrainer.metamodels.MetaModel` or a list of them.
+    """
+
+    def __init__(self, model_structure_description, metamodel):
+        structure = model_structure_description
+        if type(metamodel) in [list, tuple]:
+            self.metamodel_simulator = CombinedMetaModelSimulator(metamodel)
+            metamodels = metamodel
+        else:
+            self.metamodel_simulator = SimpleMetaModelSimulator(metamodel)
+            metamodels = [metamodel]
+
+        self.parameter_names = list(structure.model_parameters)
+        self.input_names = set(structure.model_inputs)
+        self.output_names = list(structure.model_outputs)
+        internal_names = [vstate.name for vstate in structure.virtual_states]
+        groups = [self.parameter_names, structure.model_inputs, self.output_names]
+        names = [name for group in groups for name in group]
+        if len(names) != len(set(names)):
+            raise Exception('Parameters, inputs and outputs must have distinct names.')
+        # virtual states may shadow parameters (see ModelState.__getitem__), but no inputs or outputs
+        for name in internal_names:
+            if name in self.input_names or name in self.output_names:
+                raise Exception('Virtual state %s shadows an input or output.' % (name))
+        for vstate in structure.virtual_states:
+            if vstate.init_attribute not in self.parameter_names:
+                raise Exception('Unknown init attribute of virtual state %s: %s' % (vstate.name, vstate.init_attribute))
+            if vstate.update_attribute not in self.output_names:
+                raise Exception('Unknown update attribute of virtual state %s: %s' % (vstate.name,
+                                                                                   vstate.update_attribute))
+
+        # CombinedMetaModelSimulator has already rejected responses, that are predicted by several metamodels
+        known = set(names).union(internal_names)
+        responses = []
+        for m in metamodels:
+            for name in m.input_names:
+                if name not in known:
+                    raise Exception('Unknown metamodel input: %s' % (name))
+            responses.extend(m.response_names)
+        if set(responses) != set(self.output_names):
+            raise Exception('The metamodel responses %s do not match the model outputs %s.' % (
+                sorted(responses), sorted(self.output_names)))
+
+        # compiled virtual state updates: (name, source) pairs for the first and for all later steps
+        self._init_sources = [(vstate.name, vstate.init_attribute) for vstate in structure.virtual_states]
+        self._update_sources = [(vstate.name, vstate.update_attribute) for vstate in structure.virtual_states]
+        self._sources = self._init_sources
+        self.values = {name: None for name in names + internal_names}
+        self._initialized = False
+        self._validated_inputs = False
+
+    def init(self, **init_values):
+        for attribute, init_val in init_values.items():
+            if attribute not in self.parameter_names:
+                raise Exception('Unknown parameter: %s' % (attribute))
+            self.values[attribute] = init_val
+        for attribute in self.parameter_names:
+            if self.values[attribute] is None:
+                raise Exception('Parameter %s has not been initialized.' % (attribute))
+        self._initialized = True
+
+    def step(self):
+        values = self.begin_step()
+        values.update(self.metamodel_simulator.step(values))
+
+    def begin_step(self):
+        values = self.values
+        if not self._validated_inputs:
+            if not self._initialized:
+                raise Exception('The simulator has not been initialized.')
+            for attribute in self.input_names:
+                if values[attribute] is None:
+                    raise Exception('input %s is none' % (attribute))
+            self._validated_inputs = True
+        for name, source in self._sources:
+            values[name] = values[source]
+        self._sources = self._update_sources
+        return values
+
+    def end_step(self, new_state):
+        self.values.update(new_state)
+
+    def __getitem__(self, attr_name):
+        try:
+            return self.values[attr_name]
+        except KeyError:
+            raise ValueError('Unknown attribute: %s' % (attr_name))
+
+    def __setitem__(self, attr_name, value):
+        if attr_name not in self.input_names:
+            raise Exception('Unknown parameter: %s' % (attr_name))
+        self.values[attr_name] = value
+
+
+def step_surrogates(simulators):
+    """
+    Steps several surrogate model simulators like calling their :meth:`~SurrogateModelSimulator.step` methods, but
+    evaluates each metamodel only once for all of them (see :meth:`CombinedMetaModelSimulator.step_batch`). All
+    simulators must share the same metamodels, e.g. the entities of one mosaik simulator.
+
+    :param simulators: list of :class:`SurrogateModelSimulator` or :class:`TrustedSurrogateModelSimulator`
+    """
+    if len(simulators) == 0:
+        return
+    states = [simulator.begin_step() for simulator in simulators]
+    responses = simulators[0].metamodel_simulator.step_batch(states)
+    for simulator, new_state in zip(simulators, responses):
+        simulator.end_step(new_state)
+
+
 class ModelState(object):
 
     def __init__(self, model_structure):
@@ -1,6 +1,9 @@
 import numpy as np
 from memodb import memomodel
 
+from memosim import kernels_v2 as kernels
+from memosim import translators_v2 as translators
+
 class Sum():
     def __call__(self, attr_inputs):
         sum = 0
@@ -44,48 +47,311 @@ class FeedbackInputAccessor():
         return self.simulator.state[self.idx]
 
 
+def _as_index(indices):
+    # contiguous index ranges are replaced by slices, which avoids copies and fancy indexing
+    if len(indices) == 0 or list(indices) == list(range(indices[0], indices[0] + len(indices))):
+        start = indices[0] if len(indices) > 0 else 0
+        return slice(start, start + len(indices))
+    return np.array(indices, dtype=np.intp)
+
+
+class InputPlan():
+    """
+    A static index plan, that gathers the regression inputs of a simulator from its external inputs and its state.
+
+    The plan is compiled once from a list of input accessors. :class:`ExternalInputAccessor`,
+    :class:`FeedbackInputAccessor` and :class:`ConstantInputAccessor` are translated into index arrays, so that all of
+    their values are gathered with a few vectorized operations. Any other accessor is evaluated by calling its
+    :meth:`run` method.
+
+    :param input_accessors: list of input accessors, one for each regression input.
+    """
+
+    def __init__(self, input_accessors):
+        self.num_inputs = len(input_accessors)
+        external, feedback, constant = ([], []), ([], []), ([], [])
+        self.dynamic_accessors = []
+        for pos, accessor in enumerate(input_accessors):
+            # exact type checks: subclasses may override run()
+            if type(accessor) is ExternalInputAccessor:
+                external[0].append(pos)
+                external[1].append(accessor.idx)
+            elif type(accessor) is FeedbackInputAccessor:
+                feedback[0].append(pos)
+                feedback[1].append(accessor.idx)
+            elif type(accessor) is ConstantInputAccessor:
+                constant[0].append(pos)
+                constant[1].append(accessor.value)
+            else:
+                self.dynamic_accessors.append((pos, accessor))
+
+        self.external_positions = _as_index(external[0])
+        self.external_indices = _as_index(external[1])
+        self.num_feedback_inputs = len(feedback[0])
+        self.feedback_positions = _as_index(feedback[0])
+        self.feedback_indices = _as_index(feedback[1])
+        self.constant_positions = np.array(constant[0], dtype=np.intp)
+        self.constant_values = np.array(constant[1], dtype=float)
+        # index arrays for the compiled gather kernel
+        self._kernel_indices = tuple(np.array(indices, dtype=np.intp) for indices in external + feedback)
+
+    def gather(self, external_inputs, state, out):
+        """
+        Gathers the regression inputs. All arrays may either be vectors of a single entity or matrices with one row
+        per entity.
+
+        :param external_inputs: np.ndarray, the external inputs.
+
+        :param state: np.ndarray, the current state, that provides the feedback inputs. If None, the feedback
+            inputs are not gathered.
+
+        :param out: np.ndarray, receives the regression inputs.
+
+        :return: np.ndarray, *out*
+        """
+        if kernels.COMPILED and state is not None and out.ndim == 2 and \
+                external_inputs.dtype == state.dtype == out.dtype:
+            kernels.gather_inputs(external_inputs, state, *self._kernel_indices, out)
+        else:
+            out[..., self.external_positions] = external_inputs[..., self.external_indices]
+            if state is not None:
+                out[..., self.feedback_positions] = state[..., self.feedback_indices]
+        if len(self.constant_positions) > 0:
+            out[..., self.constant_positions] = self.constant_values
+        for pos, accessor in self.dynamic_accessors:
+            out[..., pos] = accessor.run()
+        return out
+
+
 class RegressionModelSimulator():
     def __init__(self):
         self.input_accessors = []
         self.output_accessors = []
+        self.input_plan = None
+        # floating point precision of state, inputs and model parameters (see :meth:`set_dtype`)
+        self.dtype = np.dtype(np.float64)
         self.state = None
         self.external_inputs = None
         self._internal_inputs = None
+        # steady-state skipping (see :meth:`step`)
+        self.skip_tolerance = None
+        self.evaluations = 0
+        self.skips = 0
+        self._last_inputs = None
+        self._last_state = None
+        # optional :class:`~memosim.prediction_cache.PredictionCache` in front of the regression model
+        self.prediction_cache = None
 
     def init(self, num_external_inputs, num_outputs, input_accessors, output_accessors):
-        self.state = np.zeros(num_outputs)
-        self.external_inputs = np.zeros(num_external_inputs)
+        self.state = np.zeros(num_outputs, dtype=self.dtype)
+        self.external_inputs = np.zeros(num_external_inputs, dtype=self.dtype)
         self.input_accessors = self.input_accessors + input_accessors
         self.output_accessors = output_accessors
+        self.compile_input_plan()
+
+    def compile_input_plan(self):
+        """
+        Compiles the input accessors into an :class:`InputPlan`. Must be called again, if the input accessors are
+        modified after :meth:`init`.
+        """
+        self.input_plan = InputPlan(self.input_accessors)
         self._num_input_accessors = len(self.input_accessors)
-        self._internal_inputs = np.zeros(self._num_input_accessors)
+        self._internal_inputs = np.zeros(self._num_input_accessors, dtype=self.dtype)
+
+    def set_dtype(self, dtype):
+        """
+        Selects the floating point precision of state, inputs and model parameters. Single precision (np.float32)
+        halves the memory traffic of large models and populations at the cost of accuracy (see
+        :func:`memosim.precision_v2.precision_deviation`).
+
+        Parameters are converted from their current values, so converting back to np.float64 does not restore their
+        original precision.
+
+        :param dtype: np.float64 or np.float32
+        """
+        self.dtype = np.dtype(dtype)
+        self._convert_parameters()
+        if self.state is not None:
+            self.state = self.state.astype(self.dtype)
+            self.external_inputs = self.external_inputs.astype(self.dtype)
+            self._internal_inputs = self._internal_inputs.astype(self.dtype)
+        self._last_inputs = None
+
+    def _convert_parameters(self):
+        # converts the model parameters to :attr:`dtype`, models without conversion keep computing in float64
+        pass
 
     def step(self):
+        """
+        Computes the next state. If :attr:`skip_tolerance` is set, the regression model is only evaluated, if the
+        internal inputs deviate by more than the tolerance from the inputs of the last evaluation or if the state has
+        been modified since. Otherwise, the state is kept. The counters :attr:`evaluations` and :attr:`skips` count
+        evaluated and skipped steps.
+        """
         # construct all internal inputs from external inputs and from feedback from the last output
-        for i in range(self._num_input_accessors):
-            self._internal_inputs[i] = self.input_accessors[i].run()
-        self.state = self.compute_responses(self._internal_inputs)
+        self.input_plan.gather(self.external_inputs, self.state, self._internal_inputs)
+        if self.skip_tolerance is not None and self._is_steady():
+            self.skips += 1
+            return
+        if self.prediction_cache is None:
+            self.state = self.compute_responses(self._internal_inputs)
+        else:
+            self.state = self.prediction_cache.responses(self._internal_inputs, self.compute_responses)
+        self.evaluations += 1
+        if self.skip_tolerance is not None:
+            self._last_inputs = np.array(self._internal_inputs)
+            self._last_state = np.array(self.state)
+
+    def _is_steady(self):
+        if self._last_inputs is None:
+            return False
+        return (np.all(np.abs(self._internal_inputs - self._last_inputs) <= self.skip_tolerance) and
+                np.array_equal(self.state, self._last_state, equal_nan=True))
+
+    def rollout(self, schedule, init_state):
+        """
+        Simulates a whole schedule of external inputs in one call. This is equivalent to writing each row of the
+        schedule into :attr:`external_inputs` and calling :meth:`step`, but the state of the simulator is not changed.
+        The schedule may also comprise several entities, which are simulated side by side.
+
+        :param schedule: np.ndarray, (steps x external inputs) or (steps x entities x external inputs).
+
+        :param init_state: np.ndarray, (outputs) or (entities x outputs) state before the first step.
+
+        :return: np.ndarray, (steps x outputs) or (steps x entities x outputs) the state after each step.
+        """
+        plan = self.input_plan
+        if len(plan.dynamic_accessors) > 0:
+            raise Exception('Only external, feedback and constant inputs are supported by rollouts.')
+        schedule = np.asarray(schedule, dtype=self.dtype)
+        init_state = np.asarray(init_state, dtype=self.dtype)
+        single_entity = schedule.ndim == 2
+        if single_entity:
+            schedule = schedule[:, np.newaxis, :]
+        init_state = np.reshape(init_state, (schedule.shape[1], -1))
+        num_steps, num_entities = schedule.shape[:2]
+
+        # external and constant inputs of all steps are gathered at once
+        inputs = np.zeros((num_steps * num_entities, plan.num_inputs), dtype=self.dtype)
+        plan.gather(np.reshape(schedule, (num_steps * num_entities, -1)), None, inputs)
+        inputs = np.reshape(inputs, (num_steps, num_entities, -1))
+
+        if plan.num_feedback_inputs == 0:
+            # without feedback, all steps are independent
+            # the responses are copied, because simulators may reuse their output buffers
+            outputs = np.array(self.compute_batch_responses(np.reshape(inputs, (num_steps * num_entities, -1))))
+            outputs = np.reshape(outputs, (num_steps, num_entities, -1))
+        else:
+            outputs = self._rollout_feedback(inputs, init_state)
+        return outputs[:, 0, :] if single_entity else outputs
+
+    def _rollout_feedback(self, inputs, init_state):
+        plan = self.input_plan
+        outputs = np.empty(inputs.shape[:2] + init_state.shape[1:], dtype=self.dtype)
+        state = init_state
+        for t in range(len(inputs)):
+            inputs[t][:, plan.feedback_positions] = state[:, plan.feedback_indices]
+            outputs[t] = self.compute_batch_responses(inputs[t])
+            state = outputs[t]
+        return outputs
 
     def compute_responses(self, inputs):
         raise Exception('must be implemented by subclasses')
 
+    def batch_responses(self, inputs):
+        """
+        Computes the responses for several input vectors like :meth:`compute_batch_responses`, but serves recurring
+        inputs from the :attr:`prediction_cache`, if one is set.
+        """
+        if self.prediction_cache is None:
+            return self.compute_batch_responses(inputs)
+        return self.prediction_cache.batch_responses(inputs, self.compute_batch_responses)
+
+    def compute_batch_responses(self, inputs):
+        """
+        Computes the responses of several entities at once. Subclasses should override this method with a vectorized
+        implementation, the default evaluates :meth:`compute_responses` row by row.
+
+        :param inputs: np.ndarray, (entities x inputs) matrix of regression inputs.
+
+        :return: np.ndarray, (entities x outputs) matrix of responses.
+        """
+        responses = [self.compute_responses(row) for row in inputs]
+        return np.reshape(responses, (len(inputs), -1))
+
     def accepts(self, regression_model_description):
         raise Exception('must be implemented by subclasses')
 
 
 class GenericModelSimulator(RegressionModelSimulator):
 
-    def __init__(self, regression_model_description):
+    def __init__(self, regression_model_description, native=True):
+        """
+        :param regression_model_description: GenericModelDescription, that holds a fitted sklearn estimator.
+
+        :param native: bool, whether the estimator is translated into a NumPy evaluator (see
+            :mod:`memosim.translators_v2`), if its type is supported. The chosen path is reported by
+            :attr:`backend`.
+        """
         self.estimator = regression_model_description.sklearn_estimator
+        self.evaluator = translators.translate(self.estimator) if native else None
+        self.backend = 'predict' if self.evaluator is None else self.evaluator.name
         RegressionModelSimulator.__init__(self)
-
+        self._evaluator_dtype = self.dtype
+        # reusable (inputs, outputs) buffers of the evaluator for single input vectors and for batches, single input
+        # vectors have their own buffers, because the state of a single entity may be a view of them, while the model
+        # also serves a population
+        self._single_buffers = None
+        self._batch_buffers = None
+
+    def _convert_parameters(self):
+        # evaluators without reduced precision support keep computing in float64
+        if self.evaluator is not None and hasattr(self.evaluator, 'set_dtype'):
+            self.evaluator.set_dtype(self.dtype)
+            self._evaluator_dtype = self.dtype
+            self._single_buffers = None
+            self._batch_buffers = None
+
+    def _reserve(self, buffers, inputs):
+        # returns buffers with room for the inputs, the buffers grow with the largest batch
+        if buffers is None or len(buffers[0]) < len(inputs) or buffers[0].shape[1] != inputs.shape[1]:
+            num_rows = len(inputs) if buffers is None else max(len(inputs), len(buffers[0]))
+            buffers = (np.empty((num_rows, inputs.shape[1]), dtype=self._evaluator_dtype),
+                       np.empty((num_rows, self.evaluator.num_outputs), dtype=self._evaluator_dtype))
+        return buffers
+
+    def _evaluate(self, inputs, buffers):
+        input_buffer, output_buffer = buffers[0][:len(inputs)], buffers[1][:len(inputs)]
+        # the inputs are only copied, if the evaluator cannot read them as they are
+        if inputs.dtype != self._evaluator_dtype or not inputs.flags.c_contiguous:
+            np.copyto(input_buffer, inputs)
+            inputs = input_buffer
+        return self.evaluator.evaluate(inputs, output_buffer)
 
     def compute_responses(self, inputs):
+        """
+        With a native evaluator, the returned array is overwritten by the next call of this method.
+        """
+        if self.evaluator is not None:
+            inputs = np.reshape(inputs, (1, -1))
+            self._single_buffers = self._reserve(self._single_buffers, inputs)
+            return self._evaluate(inputs, self._single_buffers)[0].astype(self.dtype, copy=False)
         #print('inputs:', inputs)
         data = self.estimator.predict([inputs])
         #print('responses', data)
         return data[0]
 
+    def compute_batch_responses(self, inputs):
+        """
+        With a native evaluator, the returned array is overwritten by the next call of this method.
+        """
+        if self.evaluator is not None:
+            inputs = np.asarray(inputs)
+            self._batch_buffers = self._reserve(self._batch_buffers, inputs)
+            return self._evaluate(inputs, self._batch_buffers)
+        data = self.estimator.predict(inputs)
+        return np.reshape(data, (len(inputs), -1))
+
     @staticmethod
     def accepts(regression_model_description):
         return True
@@ -98,14 +364,36 @@ class OLSModel(RegressionModelSimulator):
         """
         :param regression_model_description: OLSModelDescription
         """
-        self.intercept = regression_model_description.intercept
-        self.coefs = regression_model_description.coefs
+        self.intercept = np.ascontiguousarray(np.atleast_1d(regression_model_description.intercept), dtype=float)
+        self.coefs = np.ascontiguousarray(np.atleast_2d(regression_model_description.coefs), dtype=float)
         RegressionModelSimulator.__init__(self)
 
+    def _convert_parameters(self):
+        self.intercept = self.intercept.astype(self.dtype)
+        self.coefs = self.coefs.astype(self.dtype)
+
     def compute_responses(self, inputs):
         data = self.intercept + self.coefs.dot(inputs)
         return data
 
+    def compute_batch_responses(self, inputs):
+        inputs = np.ascontiguousarray(inputs, dtype=self.coefs.dtype)
+        out = np.empty((len(inputs), len(self.coefs)), dtype=self.coefs.dtype)
+        return kernels.ols_step(inputs, self.intercept, self.coefs, out)
+
+    def _rollout_feedback(self, inputs, init_state):
+        # the model is linear: the contributions of all inputs except the feedback are computed with one GEMM, only
+        # the recurrence over the feedback remains in the time loop
+        plan = self.input_plan
+        num_steps, num_entities = inputs.shape[:2]
+        contributions = self.compute_batch_responses(np.reshape(inputs, (num_steps * num_entities, -1)))
+        contributions = np.reshape(contributions, (num_steps, num_entities, -1))
+        feedback_coefs = np.ascontiguousarray(self.coefs[:, plan.feedback_positions])
+        feedback_indices = np.arange(self.coefs.shape[0], dtype=np.intp)[plan.feedback_indices]
+        init_state = np.ascontiguousarray(init_state, dtype=self.coefs.dtype)
+        out = np.empty_like(contributions)
+        return kernels.ols_rollout(contributions, feedback_coefs, feedback_indices, init_state, out)
+
     @staticmethod
     def accepts(regression_model_description):
         # auskommentiert, damit alle modelle mit dem generischen Simulator behandet werden
@@ -113,9 +401,15 @@ class OLSModel(RegressionModelSimulator):
         return False
 
 class KernelRidgeRegressionSimulator(RegressionModelSimulator):
+
+    max_kernel_block = 2 ** 20
+    """
+    Maximum number of elements of the kernel buffer. Larger batches are evaluated in blocks of rows.
+    """
+
     def __init__(self, regression_model_description):
         """
-        :param regression_model_description: OLSModelDescription
+        :param regression_model_description: KernelRidgeRegressionModelDescription
         """
         #self.intercept = regression_model_description.intercept
         #self.coefs = regression_model_description.coefs
@@ -125,7 +419,8 @@ class KernelRidgeRegressionSimulator(RegressionModelSimulator):
             'sigmoid': KernelRidgeRegressionSimulator.sigmoid_kernel,
             'rbf': KernelRidgeRegressionSimulator.rbf_kernel
         }
-        self.kernel_function = kernel_functions[regression_model_description.kernel]
+        self.kernel = regression_model_description.kernel
+        self.kernel_function = kernel_functions[self.kernel]
         self.gamma = regression_model_description.gamma
         self.degree = regression_model_description.degree
         self.coef0 = regression_model_description.coef0
@@ -133,11 +428,45 @@ class KernelRidgeRegressionSimulator(RegressionModelSimulator):
         self.dual_coef = regression_model_description.dual_coef
         if self.gamma is None or np.isnan(self.gamma):
             self.gamma = 1.0
+        if self.coef0 is None:
+            self.coef0 = 1
+        if self.degree is None:
+            self.degree = 3
         RegressionModelSimulator.__init__(self)
+        self._precompute()
+
+    def _precompute(self):
+        # per-model invariants: X_fit is kept row-major, so that X . X_fit^T is a single GEMM on the transposed view.
+        # dual_coef is stored as (samples x outputs) matrix, so that all outputs share one kernel evaluation.
+        self.X_fit = np.ascontiguousarray(self.X_fit, dtype=self.dtype)
+        self._kernel_code = kernels.KERNELS[self.kernel]
+        self._X_fit_sq_norms = np.einsum('ij,ij->i', self.X_fit, self.X_fit)
+        self._dual_coef = np.ascontiguousarray(np.reshape(self.dual_coef, (len(self.X_fit), -1)), dtype=self.dtype)
+        self._kernel_buffer = np.empty((1, len(self.X_fit)), dtype=self.dtype)
+
+    def _convert_parameters(self):
+        self._precompute()
+
+    def _evaluate(self, inputs, out):
+        # evaluates the kernel for a block of rows into the reusable kernel buffer
+        if len(self._kernel_buffer) < len(inputs):
+            self._kernel_buffer = np.empty((len(inputs), len(self.X_fit)), dtype=self.dtype)
+        K = self._kernel_buffer[:len(inputs)]
+        kernels.kernel_matrix(inputs, self.X_fit, self._X_fit_sq_norms, self._kernel_code, self.gamma, self.coef0,
+                              self.degree, K)
+        return kernels.krr_responses(K, self._dual_coef, out)
 
     def compute_responses(self, inputs):
-        K = self.kernel_function(inputs, self.X_fit, degree=self.degree, gamma=self.gamma, coef0=self.coef0)
-        return np.dot(K, self.dual_coef)
+        inputs = np.ascontiguousarray(np.reshape(inputs, (1, -1)), dtype=self.dtype)
+        return self._evaluate(inputs, np.empty((1, self._dual_coef.shape[1]), dtype=self.dtype))[0]
+
+    def compute_batch_responses(self, inputs):
+        inputs = np.ascontiguousarray(inputs, dtype=self.dtype)
+        out = np.empty((len(inputs), self._dual_coef.shape[1]), dtype=self.dtype)
+        block = max(1, self.max_kernel_block // max(1, len(self.X_fit)))
+        for start in range(0, len(inputs), block):
+            self._evaluate(inputs[start:start + block], out[start:start + block])
+        return out
 
     @staticmethod
     def linear_kernel(X, Y, degree=3, gamma=None, coef0=1):
@@ -170,7 +499,8 @@ class KernelRidgeRegressionSimulator(RegressionModelSimulator):
         #    gamma = 1.0 / X.shape[1]
 
         #print(Y)
-        X = np.array([X])
+        single_sample = np.ndim(X) == 1
+        X = np.atleast_2d(X)
         # row-wise squared euclidean norms of X and Y
         XX = (X * X).sum(axis=1)[:, np.newaxis]
         YY = (Y * Y).sum(axis=1)[np.newaxis, :]
@@ -182,7 +512,9 @@ class KernelRidgeRegressionSimulator(RegressionModelSimulator):
         np.maximum(K, 0, out=K)
         K *= -gamma
         np.exp(K, K)
-        return np.reshape(K, (-1,))
+        if single_sample:
+            return np.reshape(K, (-1,))
+        return K
 
     @staticmethod
     def accepts(regression_model_description):
@@ -231,16 +563,34 @@ class RegressionModelFactory(object):
 
     @staticmethod
     def setup_initial_state(regression_model_simulator, model_structure, init_vals):
+        RegressionModelFactory.initial_state(model_structure, init_vals, out=regression_model_simulator.state)
 
+    @staticmethod
+    def initial_state(model_structure, init_vals, out=None):
+        """
+        Constructs the initial state vector (one value per model output) from the given init vals. If *out* is a
+        matrix, one initial state per row is constructed and the init vals may also be arrays with one value per row.
+
+        :param model_structure: ModelStructure of the simulated model.
+
+        :param init_vals: dict<str, object>, maps output or init attribute names to initial values.
+
+        :param out: np.ndarray, optional array that receives the initial state(s).
+
+        :return: np.ndarray, the initial state(s).
+        """
+        if out is None:
+            out = np.zeros(len(model_structure.model_outputs))
         output2init = {vstate.update_attribute: vstate.init_attribute for vstate in model_structure.virtual_states}
-        for idx in range(len(regression_model_simulator.state)):
+        for idx in range(out.shape[-1]):
             attr_name = model_structure.model_outputs[idx]
             if attr_name in init_vals:
-                regression_model_simulator.state[idx] = init_vals[attr_name]
+                out[..., idx] = init_vals[attr_name]
             elif attr_name in output2init:
-                regression_model_simulator.state[idx] = init_vals[output2init[attr_name]]
+                out[..., idx] = init_vals[output2init[attr_name]]
             else:
-                regression_model_simulator.state[idx] = None
+                out[..., idx] = np.nan
+        return out
 
         # construct initial state from init vals
         # ======================================
@@ -0,0 +1,415 @@
+"""
+Translators of fitted scikit-learn estimators into NumPy evaluators. ``estimator.predict`` validates and converts its
+input on every call, which costs far more than the math for the few rows of a simulation step. A translator inspects
+the fitted attributes of an estimator once and builds an equivalent evaluator, that works on preallocated arrays.
+
+Estimators are recognized by their class name, so that scikit-learn is not required by this module. Estimators, that
+are not supported (or that use unsupported options), are not translated and must be evaluated with ``predict``.
+
+An evaluator provides the attributes *name* and *num_outputs* and the method ``evaluate(inputs, out)``, that computes
+the (rows x outputs) responses for the (rows x inputs) float64 array *inputs*. Evaluators with a method
+``set_dtype(dtype)`` may also be converted to single precision; their inputs and outputs then have this dtype.
+"""
+import numpy as np
+
+from memosim import kernels_v2 as kernels
+
+
+class LinearEvaluator():
+    """
+    Evaluates ``inputs . coefs^T + intercept``.
+
+    :param coefs: np.ndarray, (outputs x inputs) or (inputs)
+
+    :param intercept: float or np.ndarray, (outputs)
+    """
+    name = 'linear'
+
+    def __init__(self, coefs, intercept):
+        self.coefs = np.ascontiguousarray(np.atleast_2d(coefs), dtype=float)
+        self.num_outputs = len(self.coefs)
+        self.intercept = np.ascontiguousarray(np.broadcast_to(intercept, (self.num_outputs,)), dtype=float)
+
+    def fold_input(self, factor, offset):
+        # inputs . coefs^T with inputs := inputs * factor + offset
+        self.intercept = self.intercept + np.dot(self.coefs, offset)
+        self.coefs = np.ascontiguousarray(self.coefs * factor[np.newaxis, :])
+
+    def fold_output(self, factor, offset):
+        self.coefs = np.ascontiguousarray(self.coefs * factor[:, np.newaxis])
+        self.intercept = self.intercept * factor + offset
+
+    def set_dtype(self, dtype):
+        self.coefs = self.coefs.astype(dtype)
+        self.intercept = self.intercept.astype(dtype)
+
+    def evaluate(self, inputs, out):
+        return kernels.ols_step(inputs, self.intercept, self.coefs, out)
+
+
+class KernelEvaluator():
+    """
+    Evaluates ``kernel(inputs * input_scale, X_fit) . dual_coef + intercept`` with one of the kernels of
+    :mod:`memosim.kernels_v2`.
+
+    :param X_fit: np.ndarray, (samples x inputs) the (scaled) training samples or support vectors.
+
+    :param dual_coef: np.ndarray, (samples x outputs) or (samples)
+
+    :param kernel: str, one of 'linear', 'polynomial', 'sigmoid' or 'rbf'.
+
+    :param input_scale: np.ndarray, (inputs) optional factors, with which the inputs are scaled.
+    """
+    name = 'kernel'
+
+    max_kernel_block = 2 ** 20
+    """
+    Maximum number of elements of the kernel buffer. Larger batches are evaluated in blocks of rows.
+    """
+
+    def __init__(self, X_fit, dual_coef, kernel, gamma=1.0, coef0=1.0, degree=3, intercept=0.0, input_scale=None):
+        self.X_fit = np.ascontiguousarray(X_fit, dtype=float)
+        self.dual_coef = np.ascontiguousarray(np.reshape(dual_coef, (len(self.X_fit), -1)), dtype=float)
+        self.num_outputs = self.dual_coef.shape[1]
+        self.intercept = np.broadcast_to(np.asarray(intercept, dtype=float), (self.num_outputs,))
+        self.kernel = kernels.KERNELS[kernel]
+        self.gamma = float(gamma)
+        self.coef0 = float(coef0)
+        self.degree = float(degree)
+        self.input_scale = None if input_scale is None else np.asarray(input_scale, dtype=float)
+        self._X_fit_sq_norms = np.einsum('ij,ij->i', self.X_fit, self.X_fit)
+        self._allocate(1)
+
+    def _allocate(self, num_rows):
+        self._kernel_buffer = np.empty((num_rows, len(self.X_fit)), dtype=self.X_fit.dtype)
+        self._input_buffer = np.empty((num_rows, self.X_fit.shape[1]), dtype=self.X_fit.dtype)
+
+    def set_dtype(self, dtype):
+        self.X_fit = self.X_fit.astype(dtype)
+        self.dual_coef = self.dual_coef.astype(dtype)
+        self.intercept = self.intercept.astype(dtype)
+        self._X_fit_sq_norms = self._X_fit_sq_norms.astype(dtype)
+        if self.input_scale is not None:
+            self.input_scale = self.input_scale.astype(dtype)
+        self._allocate(len(self._kernel_buffer))
+
+    def evaluate(self, inputs, out):
+        block = max(1, self.max_kernel_block // max(1, len(self.X_fit)))
+        for start in range(0, len(inputs), block):
+            self._evaluate(inputs[start:start + block], out[start:start + block])
+        return out
+
+    def _evaluate(self, inputs, out):
+        if len(self._kernel_buffer) < len(inputs):
+            self._allocate(len(inputs))
+        if self.input_scale is not None:
+            inputs = np.multiply(inputs, self.input_scale, out=self._input_buffer[:len(inputs)])
+        K = self._kernel_buffer[:len(inputs)]
+        kernels.kernel_matrix(inputs, self.X_fit, self._X_fit_sq_norms, self.kernel, self.gamma, self.coef0,
+                              self.degree, K)
+        kernels.krr_responses(K, self.dual_coef, out)
+        out += self.intercept
+        return out
+
+
+def _identity(x):
+    return x
+
+
+def _relu(x):
+    return np.maximum(x, 0, out=x)
+
+
+def _logistic(x):
+    # 1 / (1 + exp(-x))
+    np.negative(x, out=x)
+    np.exp(x, out=x)
+    x += 1
+    return np.reciprocal(x, out=x)
+
+
+def _tanh(x):
+    return np.tanh(x, out=x)
+
+
+ACTIVATIONS = {'identity': _identity, 'relu': _relu, 'logistic': _logistic, 'tanh': _tanh}
+"""
+In-place activation functions of multi-layer perceptrons.
+"""
+
+
+class MLPEvaluator():
+    """
+    Evaluates a multi-layer perceptron. The activations of the hidden layers are kept in buffers, that are sized for
+    the largest batch seen so far, and all layers are computed in place.
+
+    :param weights: list of np.ndarray, (inputs x units) weight matrix of each layer.
+
+    :param biases: list of np.ndarray, (units) bias vector of each layer.
+
+    :param activation: str, activation of the hidden layers (see :data:`ACTIVATIONS`).
+
+    :param out_activation: str, activation of the output layer.
+    """
+    name = 'mlp'
+
+    def __init__(self, weights, biases, activation, out_activation='identity'):
+        self.weights = [np.ascontiguousarray(w, dtype=float) for w in weights]
+        self.biases = [np.ascontiguousarray(b, dtype=float) for b in biases]
+        self.activation = ACTIVATIONS[activation]
+        self.out_activation = ACTIVATIONS[out_activation]
+        self.num_outputs = self.weights[-1].shape[1]
+        self._allocate(1)
+
+    def _allocate(self, num_rows):
+        self._buffers = [np.empty((num_rows, w.shape[1]), dtype=w.dtype) for w in self.weights[:-1]]
+
+    def set_dtype(self, dtype):
+        self.weights = [w.astype(dtype) for w in self.weights]
+        self.biases = [b.astype(dtype) for b in self.biases]
+        self._allocate(len(self._buffers[0]) if len(self._buffers) > 0 else 1)
+
+    def fold_input(self, factor, offset):
+        # (inputs * factor + offset) . W + b = inputs . (factor * W) + (offset . W + b)
+        self.biases[0] = self.biases[0] + np.dot(offset, self.weights[0])
+        self.weights[0] = np.ascontiguousarray(self.weights[0] * factor[:, np.newaxis])
+
+    def fold_output(self, factor, offset):
+        if self.out_activation is not _identity:
+            raise Exception('Output scaling can only be folded into linear output layers.')
+        self.weights[-1] = np.ascontiguousarray(self.weights[-1] * factor[np.newaxis, :])
+        self.biases[-1] = self.biases[-1] * factor + offset
+
+    def evaluate(self, inputs, out):
+        if len(self._buffers) > 0 and len(self._buffers[0]) < len(inputs):
+            self._allocate(len(inputs))
+        x = inputs
+        for weights, bias, buffer in zip(self.weights, self.biases, self._buffers):
+            x = np.dot(x, weights, out=buffer[:len(inputs)])
+            x += bias
+            self.activation(x)
+        np.dot(x, self.weights[-1], out=out)
+        out += self.biases[-1]
+        return self.out_activation(out)
+
+
+class TreeEnsembleEvaluator():
+    """
+    Evaluates a weighted sum of regression trees, e.g. random forests or gradient boosting ensembles. All trees are
+    flattened into contiguous node arrays, that are traversed for all rows at once (see
+    :func:`memosim.kernels_v2.tree_ensemble`).
+
+    :param trees: list of sklearn Tree objects (the attribute ``tree_`` of fitted decision trees).
+
+    :param weights: list of float, the weight of each tree.
+
+    :param bias: float or np.ndarray, (outputs) constant, that is added to the sum.
+    """
+    name = 'tree_ensemble'
+
+    def __init__(self, trees, weights, bias=0.0):
+        features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+        offset = 0
+        for tree, weight in zip(trees, weights):
+            nodes = np.arange(tree.node_count) + offset
+            leaf = tree.children_left < 0
+            # leaves are marked by being their own children
+            lefts.append(np.where(leaf, nodes, tree.children_left + offset))
+            rights.append(np.where(leaf, nodes, tree.children_right + offset))
+            features.append(np.where(leaf, 0, tree.feature))
+            thresholds.append(np.where(leaf, 0.0, tree.threshold))
+            values.append(np.reshape(tree.value, (tree.node_count, -1)) * weight)
+            roots.append(offset)
+            offset += tree.node_count
+        self.feature = np.ascontiguousarray(np.concatenate(features), dtype=np.intp)
+        self.threshold = np.ascontiguousarray(np.concatenate(thresholds), dtype=float)
+        self.left = np.ascontiguousarray(np.concatenate(lefts), dtype=np.intp)
+        self.right = np.ascontiguousarray(np.concatenate(rights), dtype=np.intp)
+        self.value = np.ascontiguousarray(np.concatenate(values), dtype=float)
+        self.roots = np.array(roots, dtype=np.intp)
+        self.num_outputs = self.value.shape[1]
+        self.bias = np.broadcast_to(np.asarray(bias, dtype=float), (self.num_outputs,))
+
+    def evaluate(self, inputs, out):
+        # sklearn compares the features in single precision
+        inputs = np.ascontiguousarray(inputs.astype(np.float32), dtype=float)
+        kernels.tree_ensemble(inputs, self.feature, self.threshold, self.left, self.right, self.value, self.roots,
+                              out)
+        out += self.bias
+        return out
+
+
+LINEAR_ESTIMATORS = {'LinearRegression', 'Ridge', 'RidgeCV', 'Lasso', 'LassoCV', 'ElasticNet', 'ElasticNetCV',
+                     'Lars', 'LassoLars', 'BayesianRidge', 'ARDRegression', 'HuberRegressor', 'LinearSVR'}
+
+SKLEARN_KERNELS = {'linear': 'linear', 'poly': 'polynomial', 'polynomial': 'polynomial', 'sigmoid': 'sigmoid',
+                   'rbf': 'rbf'}
+"""
+Maps the names of scikit-learn kernels to the kernels of :mod:`memosim.kernels_v2`.
+"""
+
+
+def translate_linear(estimator):
+    return LinearEvaluator(estimator.coef_, estimator.intercept_)
+
+
+def translate_kernel_ridge(estimator):
+    if not isinstance(estimator.kernel, str) or estimator.kernel not in SKLEARN_KERNELS or estimator.kernel_params:
+        return None
+    X_fit = estimator.X_fit_
+    # scikit-learn's pairwise kernels default to gamma = 1 / number of features
+    gamma = estimator.gamma if estimator.gamma is not None else 1.0 / X_fit.shape[1]
+    return KernelEvaluator(X_fit, estimator.dual_coef_, SKLEARN_KERNELS[estimator.kernel], gamma=gamma,
+                           coef0=estimator.coef0, degree=estimator.degree)
+
+
+def translate_svr(estimator):
+    if not isinstance(estimator.kernel, str) or estimator.kernel not in SKLEARN_KERNELS:
+        return None
+    return KernelEvaluator(estimator.support_vectors_, np.ravel(estimator.dual_coef_),
+                           SKLEARN_KERNELS[estimator.kernel], gamma=estimator._gamma, coef0=estimator.coef0,
+                           degree=estimator.degree, intercept=estimator.intercept_)
+
+
+def _gp_rbf_terms(kernel):
+    # decomposes kernels of the form [constant *] RBF [+ white noise] into (constant, length scale)
+    name = type(kernel).__name__
+    if name == 'Sum':
+        for noise, term in [(kernel.k1, kernel.k2), (kernel.k2, kernel.k1)]:
+            if type(noise).__name__ == 'WhiteKernel':
+                # white noise does not contribute to the covariance of distinct sample sets
+                return _gp_rbf_terms(term)
+        return None
+    if name == 'Product':
+        for constant, term in [(kernel.k1, kernel.k2), (kernel.k2, kernel.k1)]:
+            if type(constant).__name__ == 'ConstantKernel':
+                terms = _gp_rbf_terms(term)
+                return None if terms is None else (terms[0] * constant.constant_value, terms[1])
+        return None
+    if name == 'RBF':
+        return 1.0, kernel.length_scale
+    return None
+
+
+def translate_gaussian_process(estimator):
+    terms = _gp_rbf_terms(estimator.kernel_)
+    if terms is None:
+        return None
+    constant, length_scale = terms
+    input_scale = 1.0 / np.atleast_1d(np.asarray(length_scale, dtype=float))
+    # the predictive mean is y_mean + y_std * constant * rbf(X / l, X_train / l) . alpha
+    y_std = np.atleast_1d(getattr(estimator, '_y_train_std', 1.0))
+    y_mean = np.atleast_1d(getattr(estimator, '_y_train_mean', 0.0))
+    dual_coef = np.reshape(estimator.alpha_, (len(estimator.X_train_), -1)) * (constant * y_std)
+    return KernelEvaluator(estimator.X_train_ * input_scale, dual_coef, 'rbf', gamma=0.5, intercept=y_mean,
+                           input_scale=input_scale)
+
+
+def translate_mlp(estimator):
+    if estimator.out_activation_ not in ACTIVATIONS:
+        return None
+    return MLPEvaluator(estimator.coefs_, estimator.intercepts_, estimator.activation, estimator.out_activation_)
+
+
+def translate_tree(estimator):
+    return TreeEnsembleEvaluator([estimator.tree_], [1.0])
+
+
+def translate_forest(estimator):
+    trees = [tree.tree_ for tree in estimator.estimators_]
+    return TreeEnsembleEvaluator(trees, [1.0 / len(trees)] * len(trees))
+
+
+def translate_gradient_boosting(estimator):
+    # the initial prediction is a constant, unless a custom init estimator is used
+    if isinstance(estimator.init_, str) and estimator.init_ == 'zero':
+        bias = 0.0
+    elif type(estimator.init_).__name__ == 'DummyRegressor':
+        bias = np.ravel(estimator.init_.constant_)
+    else:
+        return None
+    trees = [tree.tree_ for tree in np.ravel(estimator.estimators_)]
+    return TreeEnsembleEvaluator(trees, [estimator.learning_rate] * len(trees), bias)
+
+
+def _scaler_affine(scaler):
+    # returns (factor, offset) of the transformation x * factor + offset, or None for other transformers
+    name = type(scaler).__name__
+    if name == 'StandardScaler':
+        # mean_ is set even if with_mean is False, but only applied if it is True (with_std likewise)
+        use_std = scaler.with_std and scaler.scale_ is not None
+        use_mean = scaler.with_mean and scaler.mean_ is not None
+        factor = 1.0 / scaler.scale_ if use_std else np.ones(scaler.n_features_in_)
+        mean = scaler.mean_ if use_mean else np.zeros(scaler.n_features_in_)
+        return factor, -mean * factor
+    if name == 'MinMaxScaler' and not scaler.clip:
+        return scaler.scale_, scaler.min_
+    if name == 'MaxAbsScaler':
+        return 1.0 / scaler.scale_, np.zeros(len(scaler.scale_))
+    return None
+
+
+def translate_pipeline(estimator):
+    # pipelines of affine scalers and a translatable regressor, the scalers are folded into the regressor
+    evaluator = translate(estimator.steps[-1][1])
+    if evaluator is None or not hasattr(evaluator, 'fold_input'):
+        return None
+    for name, scaler in reversed(estimator.steps[:-1]):
+        affine = _scaler_affine(scaler)
+        if affine is None:
+            return None
+        evaluator.fold_input(np.asarray(affine[0], dtype=float), np.asarray(affine[1], dtype=float))
+    return evaluator
+
+
+def translate_transformed_target(estimator):
+    # the inverse transformation of the targets is folded into the output layer of the regressor
+    affine = None if estimator.transformer_ is None else _scaler_affine(estimator.transformer_)
+    evaluator = translate(estimator.regressor_)
+    if affine is None or evaluator is None or not hasattr(evaluator, 'fold_output'):
+        return None
+    factor, offset = np.asarray(affine[0], dtype=float), np.asarray(affine[1], dtype=float)
+    try:
+        evaluator.fold_output(1.0 / factor, -offset / factor)
+    except Exception:
+        return None
+    return evaluator
+
+
+TRANSLATORS = {name: translate_linear for name in LINEAR_ESTIMATORS}
+TRANSLATORS.update({
+    'KernelRidge': translate_kernel_ridge,
+    'SVR': translate_svr,
+    'GaussianProcessRegressor': translate_gaussian_process,
+    'MLPRegressor': translate_mlp,
+    'DecisionTreeRegressor': translate_tree,
+    'ExtraTreeRegressor': translate_tree,
+    'RandomForestRegressor': translate_forest,
+    'ExtraTreesRegressor': translate_forest,
+    'GradientBoostingRegressor': translate_gradient_boosting,
+    'Pipeline': translate_pipeline,
+    'TransformedTargetRegressor': translate_transformed_target,
+})
+"""
+Maps class names of estimators to translators. A translator returns an evaluator or None, if the estimator uses
+options, that are not supported.
+"""
+
+
+def register_translator(class_name, translator):
+    """
+    Registers a translator for estimators of the class *class_name*.
+
+    :param translator: callable(estimator), returns an evaluator or None.
+    """
+    TRANSLATORS[class_name] = translator
+
+
+def translate(estimator):
+    """
+    :return: an evaluator for the fitted *estimator* or None, if it can not be translated.
+    """
+    translator = TRANSLATORS.get(type(estimator).__name__)
+    if translator is None:
+        return None
+    return translator(estimator)
@@ -0,0 +1,143 @@
+# cython: boundscheck=False, wraparound=False, cdivision=True
+"""
+Compiled step kernels for the v2 simulation engine. All kernels operate on typed memoryviews of C-contiguous arrays,
+write their results into preallocated output arrays and release the GIL while they run. See
+:mod:`memosim.kernels_v2` for the pure-Python implementation and the documentation of the kernels.
+"""
+cimport cython
+from cython cimport floating
+from libc.math cimport exp, tanh, pow
+
+LINEAR = 0
+POLYNOMIAL = 1
+SIGMOID = 2
+RBF = 3
+
+
+def gather_inputs(const floating[:, ::1] external_inputs, const floating[:, ::1] state,
+                  const Py_ssize_t[::1] external_positions, const Py_ssize_t[::1] external_indices,
+                  const Py_ssize_t[::1] feedback_positions, const Py_ssize_t[::1] feedback_indices,
+                  floating[:, ::1] out):
+    cdef Py_ssize_t row, i
+    with nogil:
+        for row in range(out.shape[0]):
+            for i in range(external_positions.shape[0]):
+                out[row, external_positions[i]] = external_inputs[row, external_indices[i]]
+            for i in range(feedback_positions.shape[0]):
+                out[row, feedback_positions[i]] = state[row, feedback_indices[i]]
+    return out.base
+
+
+def ols_step(const floating[:, ::1] inputs, const floating[::1] intercept, const floating[:, ::1] coefs,
+             floating[:, ::1] out):
+    cdef Py_ssize_t row, o, i
+    cdef double acc
+    with nogil:
+        for row in range(inputs.shape[0]):
+            for o in range(coefs.shape[0]):
+                acc = intercept[o]
+                for i in range(coefs.shape[1]):
+                    acc = acc + coefs[o, i] * inputs[row, i]
+                out[row, o] = acc
+    return out.base
+
+
+def kernel_matrix(const floating[:, ::1] X, const floating[:, ::1] X_fit, const floating[::1] X_fit_sq_norms,
+                  int kernel, double gamma, double coef0, double degree, floating[:, ::1] out):
+    cdef Py_ssize_t row, j, i
+    cdef double dot, x_sq_norm, dist
+    with nogil:
+        for row in range(X.shape[0]):
+            x_sq_norm = 0
+            for i in range(X.shape[1]):
+                x_sq_norm = x_sq_norm + X[row, i] * X[row, i]
+            for j in range(X_fit.shape[0]):
+                dot = 0
+                for i in range(X.shape[1]):
+                    dot = dot + X[row, i] * X_fit[j, i]
+                if kernel == 0:
+                    out[row, j] = dot
+                elif kernel == 1:
+                    out[row, j] = pow(gamma * dot + coef0, degree)
+                elif kernel == 2:
+                    out[row, j] = tanh(gamma * dot + coef0)
+                else:
+                    dist = x_sq_norm - 2 * dot + X_fit_sq_norms[j]
+                    if dist < 0:
+                        dist = 0
+                    out[row, j] = exp(-gamma * dist)
+    return out.base
+
+
+def krr_responses(const floating[:, ::1] K, const floating[:, ::1] dual_coef, floating[:, ::1] out):
+    cdef Py_ssize_t row, o, j
+    cdef double acc
+    with nogil:
+        for row in range(K.shape[0]):
+            for o in range(dual_coef.shape[1]):
+                acc = 0
+                for j in range(K.shape[1]):
+                    acc = acc + K[row, j] * dual_coef[j, o]
+                out[row, o] = acc
+    return out.base
+
+
+def ols_rollout(const floating[:, :, ::1] contributions, const floating[:, ::1] feedback_coefs,
+                const Py_ssize_t[::1] feedback_indices, const floating[:, ::1] init_state,
+                floating[:, :, ::1] out):
+    cdef Py_ssize_t t, row, o, i
+    cdef double acc, previous
+    with nogil:
+        for t in range(contributions.shape[0]):
+            for row in range(contributions.shape[1]):
+                for o in range(contributions.shape[2]):
+                    acc = contributions[t, row, o]
+                    for i in range(feedback_indices.shape[0]):
+                        if t == 0:
+                            previous = init_state[row, feedback_indices[i]]
+                        else:
+                            previous = out[t - 1, row, feedback_indices[i]]
+                        acc = acc + feedback_coefs[o, i] * previous
+                    out[t, row, o] = acc
+    return out.base
+
+
+def sum_aggregate(const floating[::1] values, const Py_ssize_t[::1] offsets, floating[::1] out):
+    cdef Py_ssize_t segment, i
+    cdef double acc
+    with nogil:
+        for segment in range(offsets.shape[0] - 1):
+            acc = 0
+            for i in range(offsets[segment], offsets[segment + 1]):
+                acc = acc + values[i]
+            out[segment] = acc
+    return out.base
+
+
+def extract_outputs(const floating[:, ::1] state, const Py_ssize_t[::1] rows, const Py_ssize_t[::1] cols,
+                    floating[::1] out):
+    cdef Py_ssize_t i
+    with nogil:
+        for i in range(rows.shape[0]):
+            out[i] = state[rows[i], cols[i]]
+    return out.base
+
+
+def tree_ensemble(const floating[:, ::1] X, const Py_ssize_t[::1] feature, const double[::1] threshold,
+                  const Py_ssize_t[::1] left, const Py_ssize_t[::1] right, const floating[:, ::1] value,
+                  const Py_ssize_t[::1] roots, floating[:, ::1] out):
+    cdef Py_ssize_t row, tree, node, o
+    with nogil:
+        for row in range(X.shape[0]):
+            for o in range(out.shape[1]):
+                out[row, o] = 0
+            for tree in range(roots.shape[0]):
+                node = roots[tree]
+                while left[node] != node:
+                    if X[row, feature[node]] <= threshold[node]:
+                        node = left[node]
+                    else:
+                        node = right[node]
+                for o in range(out.shape[1]):
+                    out[row, o] = out[row, o] + value[node, o]
+    return out.base
@@ -1,7 +1,7 @@
 import mosaik_api
 
-import h5db
-import memomodel
+from memodb import h5db
+from memodb import memomodel
 
 cimport numpy as np
 import numpy as np
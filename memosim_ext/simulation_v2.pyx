@@ -2,7 +2,7 @@ import numpy as np
 cimport numpy as np
 cimport cython
 
-import memomodel
+from memodb import memomodel
 
 DTYPE = np.float64
 
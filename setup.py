@@ -9,6 +9,8 @@ extensions = [
         Extension('memosim_ext.simulation_v2',
             ['memosim_ext/simulation_v2.pyx'],
             include_dirs=[numpy.get_include()]),
+        Extension('memosim_ext.kernels_v2',
+            ['memosim_ext/kernels_v2.pyx']),
 ]
 
 setup(
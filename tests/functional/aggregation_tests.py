@@ -0,0 +1,53 @@
+import unittest
+
+import numpy as np
+
+from memosim import aggregation
+from memosim.aggregation import InputRouter
+
+
+class Test(unittest.TestCase):
+
+    def test_reducers(self):
+        values = np.array([1.0, 4.0, 2.0, 3.0, 5.0])
+        offsets = np.array([0, 3, 3, 5], dtype=np.intp)
+        expected = {'sum': [7.0, 0.0, 8.0], 'mean': [7.0 / 3, np.nan, 4.0], 'min': [1.0, np.nan, 3.0],
+                    'max': [4.0, np.nan, 5.0], 'last': [2.0, np.nan, 5.0]}
+        for name, result in expected.items():
+            out = np.empty(3)
+            aggregation.get_reducer(name)(values, offsets, out)
+            np.testing.assert_allclose(result, out, err_msg=name)
+
+    def test_router(self):
+        entity_rows = {'memo_0': 0, 'memo_1': 1, 'memo_2': 2}
+        router = InputRouter(entity_rows, ['P_el_set', 'Q_el_set'], {'Q_el_set': 'max'})
+        router.set_reducer('P_el_set', lambda values, offsets, out: aggregation.mean_reducer(values, offsets, out))
+        array = np.full((3, 2), -1.0)
+        inputs = {'memo_2': {'Q_el_set': {'a': 1.0, 'b': 3.0}, 'P_el_set': {'a': 2.0}},
+                  'memo_0': {'P_el_set': {'a': 1.0, 'b': 2.0}}}
+        router.apply(inputs, array)
+        np.testing.assert_allclose([[1.5, -1.0], [-1.0, -1.0], [2.0, 3.0]], array)
+
+        # the routing table is reused, as long as the structure of the inputs is the same
+        table = router.table
+        inputs['memo_0']['P_el_set']['b'] = 4.0
+        router.apply(inputs, array)
+        self.assertIs(table, router.table)
+        self.assertEqual(2.5, array[0, 0])
+        router.apply({'memo_2': {'Q_el_set': {'c': 5.0, 'd': 3.0}, 'P_el_set': {'c': 2.0}},
+                      'memo_0': {'P_el_set': {'c': 1.0, 'd': 7.0}}}, array)
+        self.assertIs(table, router.table)
+        np.testing.assert_allclose([[4.0, -1.0], [-1.0, -1.0], [2.0, 5.0]], array)
+
+        router.apply({'memo_1': {'P_el_set': {'c': 7.0}}}, array)
+        self.assertIsNot(table, router.table)
+        self.assertEqual(7.0, array[1, 0])
+
+        with self.assertRaises(Exception):
+            router.apply({'memo_1': {'SoC': {'c': 7.0}}}, array)
+        with self.assertRaisesRegex(Exception, 'must be numbers'):
+            router.apply({'memo_1': {'P_el_set': {'c': 'on'}}}, array)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+import unittest
+from types import SimpleNamespace
+
+import numpy as np
+
+import memosim.simulation_v2 as sim
+from memosim.approximation_v2 import ApproximateKernelRidgeRegressionSimulator, TruncatedRBFKernelRidgeSimulator
+
+
+def krr_description(kernel, num_samples=200, gamma=0.5):
+    rnd = np.random.RandomState(0)
+    return SimpleNamespace(kernel=kernel, gamma=gamma, degree=2, coef0=1.0,
+                           X_fit=rnd.uniform(-1, 1, (num_samples, 2)), dual_coef=rnd.normal(size=(num_samples, 2)))
+
+
+class Test(unittest.TestCase):
+
+    def test_linear_kernel_is_exact(self):
+        description = krr_description('linear')
+        approximation = ApproximateKernelRidgeRegressionSimulator(description, rank=5)
+        self.assertEqual('primal', approximation.method)
+        self.assertLess(approximation.approximation_error['max_abs'], 1e-9)
+
+    def test_nystroem_full_rank_is_exact(self):
+        description = krr_description('polynomial', num_samples=50)
+        approximation = ApproximateKernelRidgeRegressionSimulator(description, rank=50)
+        exact = sim.KernelRidgeRegressionSimulator(description)
+        inputs = np.random.RandomState(1).uniform(-1, 1, (5, 2))
+        np.testing.assert_allclose(exact.compute_batch_responses(inputs),
+                                   approximation.compute_batch_responses(inputs), rtol=1e-6, atol=1e-6)
+
+    def test_tolerance_increases_rank(self):
+        description = krr_description('rbf')
+        approximation = ApproximateKernelRidgeRegressionSimulator(description, rank=4, tolerance=1e-3)
+        self.assertGreater(approximation.rank, 4)
+        self.assertLessEqual(approximation.approximation_error['max_abs'], 1e-3)
+        self.assertEqual(approximation.rank, approximation.approximation_error['rank'])
+
+    def test_random_fourier_features(self):
+        description = krr_description('rbf', gamma=0.1)
+        coarse = ApproximateKernelRidgeRegressionSimulator(description, method='rff', rank=10)
+        fine = ApproximateKernelRidgeRegressionSimulator(description, method='rff', rank=2000)
+        self.assertLess(fine.approximation_error['rmse'], coarse.approximation_error['rmse'])
+        with self.assertRaises(Exception):
+            ApproximateKernelRidgeRegressionSimulator(krr_description('sigmoid'), method='rff')
+
+    def test_truncated_rbf_error_bound(self):
+        description = krr_description('rbf', num_samples=2000, gamma=50.0)
+        exact = sim.KernelRidgeRegressionSimulator(description)
+        truncated = TruncatedRBFKernelRidgeSimulator(description, tolerance=1e-4)
+        self.assertTrue(np.all(truncated.error_bound <= 1e-4))
+
+        inputs = np.random.RandomState(1).uniform(-1, 1, (20, 2))
+        deviation = np.abs(truncated.compute_batch_responses(inputs) - exact.compute_batch_responses(inputs))
+        self.assertTrue(np.all(deviation <= truncated.error_bound))
+        self.assertLess(truncated.kernel_terms, 20 * 2000 / 4)
+
+        single = truncated.compute_responses(inputs[3])
+        np.testing.assert_allclose(truncated.compute_batch_responses(inputs[3:4])[0], single)
+
+
+if __name__ == "__main__":
+    unittest.main()
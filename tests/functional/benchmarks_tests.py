@@ -0,0 +1,50 @@
+import copy
+import unittest
+
+import numpy as np
+
+from benchmarks import models, run
+
+
+class Test(unittest.TestCase):
+
+    def test_engines_agree(self):
+        outputs = {eid: list(models.RESPONSE_NAMES) for eid in run.eids(3)}
+        schedule = np.random.RandomState(0).uniform(-1, 1, (4, 3))
+        for model in run.MODELS:
+            description = models.create_description(model, num_samples=20)
+            responses = []
+            for engine_class in run.ENGINES.values():
+                engine = engine_class(description)
+                engine.create(3)
+                for inputs in schedule:
+                    engine.step(inputs)
+                data = engine.get_data(outputs)
+                responses.append([[data[eid][attr] for attr in attrs] for eid, attrs in outputs.items()])
+            for other in responses[1:]:
+                np.testing.assert_allclose(responses[0], other, rtol=1e-7, atol=1e-12, err_msg=model)
+
+    def test_compare(self):
+        suite = {'entities': [1, 2], 'samples': [20]}
+        results = run.run_suite(suite, model_names=['ols', 'krr-rbf'], repeats=2, min_sample_time=1e-3)
+        self.assertEqual(sorted(name for name, *case in run.cases(suite, model_names=['ols', 'krr-rbf'])),
+                         sorted(results['cases']))
+        self.assertEqual([], run.compare(results, results))
+
+        slower = copy.deepcopy(results)
+        slower['cases']['v1/ols/2']['step'] = 10.0
+        slower['cases']['population/krr-rbf/1/20']['memory'] += 2 ** 20
+        regressions = run.compare(slower, results)
+        self.assertEqual([('population/krr-rbf/1/20', 'memory'), ('v1/ols/2', 'step')],
+                         [regression[:2] for regression in regressions])
+
+        # times are compared relative to the baseline, however short they are
+        for name, metrics in slower['cases'].items():
+            for metric in run.TIME_METRICS:
+                metrics[metric] = 3 * results['cases'][name][metric]
+        regressions = [regression for regression in run.compare(slower, results) if regression[1] != 'memory']
+        self.assertEqual(len(run.TIME_METRICS) * len(results['cases']), len(regressions))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+import memosim.simulation_v2 as sim
+from memosim.ensemble_v2 import EnsembleRunner
+from memosim.population_v2 import PopulationSimulator
+
+from tests.functional.population_v2_tests import battery_structure, ols_description
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        rnd = np.random.RandomState(0)
+        self.schedules = rnd.uniform(-1, 1, (5, 11, 1))
+        self.init_soc = rnd.uniform(0, 1, 5)
+        self.runner = EnsembleRunner(sim.OLSModel(ols_description()), battery_structure(), chunk_size=4)
+
+    def test_members_match_single_rollouts(self):
+        results = self.runner.run(self.schedules, {'init_SoC': self.init_soc})
+        for member in range(5):
+            init_state = [np.nan, self.init_soc[member]]
+            expected = self.runner.model.rollout(self.schedules[member], init_state)
+            np.testing.assert_allclose(expected, results['trajectories'][member])
+
+    def test_structured_simulator(self):
+        model = sim.OLSModel(ols_description())
+        sim.RegressionModelFactory.create_structure(model, battery_structure())
+        num_inputs = len(model.input_accessors)
+        runner = EnsembleRunner(model, battery_structure())
+        self.assertEqual(num_inputs, len(model.input_accessors))
+        results = runner.run(self.schedules, {'init_SoC': self.init_soc})
+        expected = self.runner.run(self.schedules, {'init_SoC': self.init_soc})
+        np.testing.assert_allclose(expected['trajectories'], results['trajectories'])
+
+    def test_model_shared_with_population(self):
+        expected = self.runner.run(self.schedules, {'init_SoC': self.init_soc})['trajectories']
+        for ensemble_first in [True, False]:
+            model = sim.OLSModel(ols_description())
+            if ensemble_first:
+                runner = EnsembleRunner(model, battery_structure())
+                population = PopulationSimulator(model, battery_structure())
+            else:
+                population = PopulationSimulator(model, battery_structure())
+                runner = EnsembleRunner(model, battery_structure())
+            self.assertEqual(2, len(model.input_accessors))
+            results = runner.run(self.schedules, {'init_SoC': self.init_soc})
+            np.testing.assert_allclose(expected, results['trajectories'])
+            population.add_entities(5, {'init_SoC': self.init_soc})
+            for t in range(self.schedules.shape[1]):
+                population.external_inputs[:] = self.schedules[:, t]
+                population.step()
+            np.testing.assert_allclose(expected[:, -1], population.state)
+
+    def test_statistics_without_trajectories(self):
+        expected = self.runner.run(self.schedules, {'init_SoC': self.init_soc})['trajectories']
+        results = self.runner.run(self.schedules, {'init_SoC': self.init_soc}, trajectories=False,
+                                  statistics=True, quantiles=(0.5,))
+        self.assertNotIn('trajectories', results)
+        np.testing.assert_allclose(expected.mean(axis=0), results['mean'])
+        np.testing.assert_allclose(np.median(expected, axis=0), results['quantiles'][:, 0, :])
+
+    def test_shared_schedule_on_disk(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'trajectories.npy')
+            self.runner.run(self.schedules[0], {'init_SoC': self.init_soc}, trajectories=path)
+            stored = np.load(path)
+        self.assertEqual((5, 11, 2), stored.shape)
+        expected = self.runner.model.rollout(self.schedules[0], [np.nan, self.init_soc[3]])
+        np.testing.assert_allclose(expected, stored[3])
+
+
+if __name__ == "__main__":
+    unittest.main()
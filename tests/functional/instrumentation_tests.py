@@ -0,0 +1,68 @@
+import json
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+import memosim.simulation_v2 as sim
+from memosim.instrumentation import Instrumentation, LatencyHistogram
+from memosim.population_v2 import PopulationSimulator
+from tests.functional.population_v2_tests import battery_structure, ols_description
+
+
+class Test(unittest.TestCase):
+
+    def test_histogram(self):
+        histogram = LatencyHistogram()
+        latencies = np.random.RandomState(0).lognormal(np.log(1e-3), 1.0, 10000)
+        for latency in latencies:
+            histogram.add(latency)
+        for q in [50, 95, 99]:
+            self.assertAlmostEqual(1.0, histogram.percentile(q) / np.percentile(latencies, q), delta=0.05)
+        summary = histogram.summary()
+        self.assertEqual(10000, summary['count'])
+        self.assertEqual(latencies.max(), summary['max'])
+        self.assertAlmostEqual(latencies.mean(), summary['mean'])
+
+        histogram.add(1e-9)
+        histogram.add(1e6)
+        self.assertEqual(1e-9, histogram.percentile(0))
+        self.assertEqual(1e6, histogram.percentile(100))
+        self.assertEqual({'count': 0, 'total': 0.0}, LatencyHistogram().summary())
+
+    def test_population(self):
+        population = PopulationSimulator(sim.OLSModel(ols_description()), battery_structure())
+        population.add_entities(4, {'init_SoC': 0.5})
+        population.step()
+        self.assertEqual({'enabled': False, 'phases': {}, 'counters': {}}, population.instrumentation.report())
+
+        population.instrumentation.enabled = True
+        for _ in range(3):
+            population.step()
+        population.step(1, 3)
+        report = population.instrumentation.report()
+        self.assertEqual(4, report['phases']['gather']['count'])
+        self.assertEqual(4, report['phases']['compute']['count'])
+        self.assertEqual({'OLSModel': {'calls': 4, 'rows': 14}}, report['counters'])
+
+        population.instrumentation.reset()
+        self.assertEqual({}, population.instrumentation.report()['phases'])
+
+    def test_dump(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'instrumentation', 'report.json')
+            instrumentation = Instrumentation(enabled=True, dump_path=path, dump_interval=3600)
+            with instrumentation.measure('step'):
+                pass
+            instrumentation.tick()
+            self.assertFalse(os.path.exists(path))
+            instrumentation.dump_interval = 0
+            instrumentation.tick()
+            with open(path) as file:
+                report = json.load(file)
+            self.assertEqual(1, report['phases']['step']['count'])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+import unittest
+
+import numpy as np
+
+import memosim.simulation_v2 as sim
+from memosim import kernels_v2
+
+try:
+    from memosim_ext import kernels_v2 as compiled_kernels
+except ImportError:
+    compiled_kernels = None
+
+
+class PythonKernelsTest(unittest.TestCase):
+    """
+    Parity of the kernels with :mod:`memosim.simulation_v2`.
+    """
+
+    kernels = kernels_v2
+
+    def setUp(self):
+        if self.kernels is None:
+            self.skipTest('memosim_ext has not been built')
+        self.rnd = np.random.RandomState(0)
+
+    def test_gather_inputs(self):
+        simulator = sim.RegressionModelSimulator()
+        accessors = [sim.ExternalInputAccessor(simulator, 1), sim.FeedbackInputAccessor(simulator, 2),
+                     sim.ExternalInputAccessor(simulator, 0)]
+        simulator.init(2, 3, accessors, {})
+        simulator.external_inputs[:] = self.rnd.normal(size=2)
+        simulator.state[:] = self.rnd.normal(size=3)
+
+        out = np.zeros((1, 3))
+        self.kernels.gather_inputs(simulator.external_inputs[np.newaxis, :], simulator.state[np.newaxis, :],
+                                   np.array([0, 2], dtype=np.intp), np.array([1, 0], dtype=np.intp),
+                                   np.array([1], dtype=np.intp), np.array([2], dtype=np.intp), out)
+        np.testing.assert_array_equal([accessor.run() for accessor in accessors], out[0])
+
+    def test_ols_step(self):
+        description = type('OLSModelDescription', (), {'intercept': self.rnd.normal(size=2),
+                                                       'coefs': self.rnd.normal(size=(2, 3))})
+        model = sim.OLSModel(description)
+        inputs = self.rnd.normal(size=(4, 3))
+        out = self.kernels.ols_step(inputs, model.intercept, model.coefs, np.empty((4, 2)))
+        for row in range(4):
+            np.testing.assert_allclose(model.compute_responses(inputs[row]), out[row])
+
+    def test_kernel_matrix(self):
+        X_fit = self.rnd.uniform(-1, 1, (30, 3))
+        X_fit_sq_norms = (X_fit * X_fit).sum(axis=1)
+        dual_coef = self.rnd.normal(size=(30, 2))
+        inputs = self.rnd.uniform(-1, 1, (5, 3))
+        for name, kernel in kernels_v2.KERNELS.items():
+            function = getattr(sim.KernelRidgeRegressionSimulator, name + '_kernel')
+            K = self.kernels.kernel_matrix(inputs, X_fit, X_fit_sq_norms, kernel, 0.5, 1.0, 3.0, np.empty((5, 30)))
+            responses = self.kernels.krr_responses(K, dual_coef, np.empty((5, 2)))
+            for row in range(5):
+                expected = function(inputs[row], X_fit, degree=3.0, gamma=0.5, coef0=1.0)
+                np.testing.assert_allclose(expected, K[row], rtol=1e-10)
+                np.testing.assert_allclose(np.dot(expected, dual_coef), responses[row], rtol=1e-10)
+
+    def test_sum_aggregate(self):
+        attr_inputs = [{'a': 1.5, 'b': -2.0}, {}, {'c': 4.0}, {'a': 0.25, 'b': 0.5, 'c': 1.0}]
+        values = np.array([val for inputs in attr_inputs for val in inputs.values()])
+        offsets = np.cumsum([0] + [len(inputs) for inputs in attr_inputs]).astype(np.intp)
+        out = self.kernels.sum_aggregate(values, offsets, np.empty(len(attr_inputs)))
+        np.testing.assert_array_equal([sim.Sum()(inputs) for inputs in attr_inputs], out)
+
+    def test_extract_outputs(self):
+        state = self.rnd.normal(size=(4, 3))
+        rows = np.array([3, 0, 0], dtype=np.intp)
+        cols = np.array([1, 2, 0], dtype=np.intp)
+        out = self.kernels.extract_outputs(state, rows, cols, np.empty(3))
+        np.testing.assert_array_equal([state[3, 1], state[0, 2], state[0, 0]], out)
+
+    def test_tree_ensemble(self):
+        # tree 0: x0 <= 0.5 ? (x1 <= 0 ? 1 : 2) : 3, tree 1: a single leaf with value 10
+        feature = np.array([0, 1, 0, 0, 0, 0], dtype=np.intp)
+        threshold = np.array([0.5, 0.0, 0.0, 0.0, 0.0, 0.0])
+        left = np.array([1, 3, 2, 3, 4, 5], dtype=np.intp)
+        right = np.array([2, 4, 2, 3, 4, 5], dtype=np.intp)
+        value = np.array([[0.0], [0.0], [3.0], [1.0], [2.0], [10.0]])
+        X = np.array([[0.0, -1.0], [0.5, 1.0], [0.7, -1.0]])
+        out = self.kernels.tree_ensemble(X, feature, threshold, left, right, value, np.array([0, 5], dtype=np.intp),
+                                         np.empty((3, 1)))
+        np.testing.assert_array_equal([[11.0], [12.0], [13.0]], out)
+
+
+class CompiledKernelsTest(PythonKernelsTest):
+
+    kernels = compiled_kernels
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+import unittest
+from types import SimpleNamespace
+
+import numpy as np
+
+from memosim import lowering_v2
+from memosim.simulation_v1 import SurrogateModelSimulator
+from tests.functional.simulation_v1_tests import LinearMetaModel, battery_structure, metamodels
+
+
+class Test(unittest.TestCase):
+
+    def test_lowered_matches_v1(self):
+        init_vals = [{'capacity': 2.0, 'init_SoC': 0.5}, {'capacity': 1.0, 'init_SoC': 0.1}]
+        for models in [metamodels(), LinearMetaModel(['P_el_set', 'soc'], ['P_el', 'SoC'], [[1, 0], [0.1, 1]])]:
+            lowered = lowering_v2.lower_surrogate(battery_structure(), models)
+            entities = []
+            for vals in init_vals:
+                lowered.add_entities(1, vals)
+                entity = SurrogateModelSimulator(battery_structure(), models)
+                entity.init(**vals)
+                entities.append(entity)
+
+            rnd = np.random.RandomState(0)
+            for t in range(4):
+                p_set = rnd.uniform(-1, 1, len(entities))
+                lowered.population.external_inputs[:, lowered.input_columns['P_el_set']] = p_set
+                lowered.population.step()
+                for row, entity in enumerate(entities):
+                    entity['P_el_set'] = p_set[row]
+                    entity.step()
+                    for attr in ['P_el', 'SoC', 'P_el_set', 'soc', 'capacity', 'init_SoC']:
+                        self.assertAlmostEqual(entity[attr], lowered.get_value(row, attr))
+
+    def test_outputs_read_directly(self):
+        # v1 metamodels read the outputs of the previous step, which are None (NaN as float) in the first step
+        class FloatMetaModel(LinearMetaModel):
+            def predict(self, X):
+                return LinearMetaModel.predict(self, np.array(X, dtype=float))
+
+        models = [FloatMetaModel(['P_el_set'], ['P_el'], [[1.0]]),
+                  FloatMetaModel(['P_el_set', 'P_el'], ['SoC'], [[0.1, 0.2]])]
+        lowered = lowering_v2.lower_surrogate(battery_structure(), models)
+        lowered.add_entities(1, {'capacity': 1.0, 'init_SoC': 0.5})
+        entity = SurrogateModelSimulator(battery_structure(), models)
+        entity.init(capacity=1.0, init_SoC=0.5)
+        for t, p_set in enumerate([1.0, -2.0, 0.5, 3.0]):
+            lowered.population.external_inputs[:, lowered.input_columns['P_el_set']] = p_set
+            lowered.population.step()
+            entity['P_el_set'] = p_set
+            entity.step()
+            self.assertEqual(t == 0, np.isnan(entity['SoC']))
+            for attr in ['P_el', 'SoC', 'soc']:
+                np.testing.assert_allclose(entity[attr], lowered.get_value(0, attr))
+
+    def test_bulk_parameters(self):
+        lowered = lowering_v2.lower_surrogate(battery_structure(), metamodels())
+        self.assertEqual({'capacity': 1}, lowered.parameter_columns)
+        rows = lowered.add_entities(3, {'capacity': [1.0, 2.0, 3.0], 'init_SoC': 0.0})
+        self.assertEqual([1.0, 2.0, 3.0], [lowered.get_value(row, 'capacity') for row in rows])
+        # parameters, that are not read by metamodels, and virtual states before the first step
+        self.assertEqual([0.0, 0.0, 0.0], [lowered.get_value(row, 'init_SoC') for row in rows])
+        self.assertTrue(np.isnan(lowered.get_value(0, 'soc')))
+        with self.assertRaises(Exception):
+            lowered.add_entities(1, {'capacity': 1.0})
+        with self.assertRaises(Exception):
+            lowered.add_entities(1, {'capacity': 1.0, 'init_SoC': 0.0, 'eta': 0.9})
+
+    def test_validation(self):
+        with self.assertRaises(Exception):
+            lowering_v2.lower_surrogate(battery_structure(), metamodels()[:1])
+        with self.assertRaises(Exception):
+            lowering_v2.lower_surrogate(battery_structure(), [LinearMetaModel(['Q_el'], ['P_el'], [[1]]),
+                                                              metamodels()[1]])
+        structure = battery_structure()
+        structure.virtual_states.append(SimpleNamespace(name='p', init_attribute='capacity', update_attribute='P_el'))
+        lowered = lowering_v2.lower_surrogate(structure, [LinearMetaModel(['p'], ['P_el'], [[0.5]]),
+                                                          metamodels()[1]])
+        lowered.add_entities(1, {'capacity': 4.0, 'init_SoC': 0.0})
+        lowered.population.step()
+        self.assertEqual(2.0, lowered.get_value(0, 'P_el'))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+from types import SimpleNamespace
+
+import numpy as np
+
+from memosim.model_cache import ModelDescriptionCache, estimate_size
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.files = []
+        for i in range(3):
+            path = os.path.join(self.directory.name, 'model%d.h5' % (i))
+            open(path, 'w').close()
+            self.files.append(path)
+        self.loads = []
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def load(self, surrogate_model_file, surrogate_name):
+        self.loads.append((surrogate_model_file, surrogate_name))
+        time.sleep(0.01)
+        return SimpleNamespace(name=surrogate_name, X_fit=np.zeros((100, 10)))
+
+    def test_hits_and_modified_files(self):
+        cache = ModelDescriptionCache(self.load)
+        first = cache.get(self.files[0], 'battery')
+        self.assertIs(first, cache.get(self.files[0], 'battery'))
+        self.assertIsNot(first, cache.get(self.files[0], 'chp'))
+        self.assertEqual((1, 2), (cache.hits, cache.misses))
+
+        stat = os.stat(self.files[0])
+        os.utime(self.files[0], ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        self.assertIsNot(first, cache.get(self.files[0], 'battery'))
+        self.assertEqual(3, len(self.loads))
+
+    def test_eviction_and_invalidation(self):
+        size = estimate_size(self.load(self.files[0], 'battery'))
+        self.assertGreater(size, 8000)
+        cache = ModelDescriptionCache(self.load, max_bytes=int(2.5 * size))
+        for path in self.files:
+            cache.get(path, 'battery')
+        self.assertLessEqual(cache.size, cache.max_bytes)
+        cache.get(self.files[2], 'battery')
+        cache.get(self.files[0], 'battery')  # evicted
+        self.assertEqual(5, len(self.loads))
+
+        cache.invalidate(self.files[0])
+        cache.get(self.files[0], 'battery')
+        cache.invalidate()
+        self.assertEqual(0, cache.size)
+
+    def test_concurrent_loading(self):
+        cache = ModelDescriptionCache(self.load)
+        descriptions = cache.preload([(path, 'battery') for path in self.files] * 2, max_workers=6)
+        self.assertEqual(3, len(self.loads))
+        self.assertIs(descriptions[0], descriptions[3])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import memosim.simulation_v2 as sim
+from memosim import mosaik_v2
+from memosim.mosaik_v2 import GetDataPlan
+from memosim.population_v2 import PopulationSimulator
+from tests.functional.population_v2_tests import battery_structure, ols_description
+
+
+class Test(unittest.TestCase):
+
+    def test_get_data_plan(self):
+        population = PopulationSimulator(sim.OLSModel(ols_description()), battery_structure())
+        population.add_entities(3, {'init_SoC': [0.1, 0.2, 0.3], 'P_el': 5.0})
+        entity_rows = {'memo_0': 0, 'memo_1': 1, 'memo_2': 2}
+        outputs = {'memo_2': ['SoC', 'P_el'], 'memo_0': ['SoC']}
+        plan = GetDataPlan(outputs, entity_rows, population.output_indices)
+        self.assertTrue(plan.matches({'memo_2': ['SoC', 'P_el'], 'memo_0': ['SoC']}))
+        self.assertFalse(plan.matches({'memo_2': ['SoC'], 'memo_0': ['SoC']}))
+
+        self.assertEqual({'memo_2': {'SoC': 0.3, 'P_el': 5.0}, 'memo_0': {'SoC': 0.1}}, plan.fill(population))
+        previous = plan.fill(population)
+        expected = {eid: dict(values) for eid, values in previous.items()}
+        population.step()
+        data = plan.fill(population)
+        self.assertEqual(population.state[0, 1], data['memo_0']['SoC'])
+        self.assertEqual(population.state[2, 0], data['memo_2']['P_el'])
+        # responses may be kept by mosaik, so they are not modified by later requests
+        self.assertIsNot(previous, data)
+        self.assertIsNot(previous['memo_0'], data['memo_0'])
+        self.assertEqual(expected, previous)
+
+    def test_shared_model_description_caches(self):
+        self.assertIs(mosaik_v2.shared_model_description_cache, mosaik_v2.get_shared_model_description_cache())
+        with tempfile.TemporaryDirectory() as directory:
+            model_file = os.path.join(directory, 'model.h5')
+            open(model_file, 'w').close()
+            root = os.path.join(directory, 'exports')
+            cache = mosaik_v2.get_shared_model_description_cache(root)
+            self.assertIs(cache, mosaik_v2.get_shared_model_description_cache(os.path.relpath(root)))
+            with mock.patch('memosim.mosaik_v2.load_model_description', return_value={'name': 'battery'}):
+                self.assertEqual({'name': 'battery'}, cache.get(model_file, 'battery'))
+            self.assertEqual(1, len(os.listdir(root)))
+            del mosaik_v2.shared_model_description_caches[os.path.abspath(root)]
+
+
+if __name__ == "__main__":
+    unittest.main()
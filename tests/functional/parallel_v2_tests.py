@@ -0,0 +1,111 @@
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+import numpy as np
+
+import memosim.simulation_v2 as sim
+from memosim.parallel_v2 import WorkerPool, partition
+from memosim.population_v2 import PopulationSimulator
+from memosim.prediction_cache import PredictionCache
+
+from tests.functional.population_v2_tests import battery_structure, ols_description, krr_description
+
+
+class Test(unittest.TestCase):
+
+    def test_partition_balances_costs(self):
+        assignments = partition([(100, 1.0), (10, 30.0)], 4)
+        self.assertEqual(4, len(assignments))
+        loads = [sum((stop - start) * [1.0, 30.0][idx] for idx, start, stop in assignment)
+                 for assignment in assignments]
+        self.assertLessEqual(max(loads) - min(loads), 30.0)
+        for idx, num in enumerate([100, 10]):
+            rows = [row for assignment in assignments for i, start, stop in assignment if i == idx
+                    for row in range(start, stop)]
+            self.assertEqual(list(range(num)), rows)
+
+    def test_pool_matches_serial_step(self):
+        models = [lambda: sim.OLSModel(ols_description()),
+                  lambda: sim.KernelRidgeRegressionSimulator(krr_description('rbf'))]
+        parallel, serial = [], []
+        for create_model in models:
+            for populations in [parallel, serial]:
+                population = PopulationSimulator(create_model(), battery_structure())
+                population.add_entities(25, {'init_SoC': 0.5})
+                populations.append(population)
+
+        pool = WorkerPool(parallel, 3)
+        pool.start()
+        try:
+            rnd = np.random.RandomState(0)
+            for t in range(3):
+                for parallel_population, serial_population in zip(parallel, serial):
+                    p_set = rnd.uniform(-1, 1, (25, 1))
+                    parallel_population.external_inputs[:] = p_set
+                    serial_population.external_inputs[:] = p_set
+                    serial_population.step()
+                pool.step()
+                for parallel_population, serial_population in zip(parallel, serial):
+                    np.testing.assert_allclose(serial_population.state, parallel_population.state)
+        finally:
+            pool.stop()
+        self.assertFalse(pool.running)
+        np.testing.assert_allclose(serial[0].state, parallel[0].state)
+
+    def test_pool_shares_inputs_and_counters(self):
+        # without feedback, entities with constant inputs are skipped
+        structure = battery_structure()
+        structure.virtual_states = []
+        description = SimpleNamespace(intercept=np.array([1.0, 2.0]), coefs=np.array([[2.0], [3.0]]))
+        parallel, serial = [PopulationSimulator(sim.OLSModel(description), structure, skip_tolerance=1e-12)
+                            for _ in range(2)]
+        for population in [parallel, serial]:
+            population.add_entities(20, {'init_SoC': 0.5})
+        pool = WorkerPool([parallel], 2)
+        pool.start()
+        try:
+            for t in range(4):
+                # half of the entities keep their inputs after the first step
+                p_set = np.where(np.arange(20) < 10, 1.0, float(t))
+                for population in [parallel, serial]:
+                    population.external_inputs[:, 0] = p_set
+                pool.step()
+                serial.step()
+                np.testing.assert_allclose(serial.internal_inputs, parallel.internal_inputs)
+                self.assertEqual((serial.evaluations, serial.skips), (parallel.evaluations, parallel.skips))
+        finally:
+            pool.stop()
+        self.assertGreater(parallel.skips, 0)
+        # the skip bookkeeping of the workers is kept by the main process
+        parallel.step()
+        serial.step()
+        self.assertEqual((serial.evaluations, serial.skips), (parallel.evaluations, parallel.skips))
+        np.testing.assert_allclose(serial.state, parallel.state)
+
+    def test_pool_requires_fork(self):
+        with mock.patch('multiprocessing.get_all_start_methods', return_value=['spawn']):
+            with self.assertRaises(Exception):
+                WorkerPool([], 2)
+
+    def test_pool_merges_prediction_caches(self):
+        model = sim.KernelRidgeRegressionSimulator(krr_description('rbf'))
+        model.prediction_cache = PredictionCache(resolution=1e-12)
+        model.prediction_cache.batch_responses(np.zeros((1, 2)), model.compute_batch_responses)
+        population = PopulationSimulator(model, battery_structure())
+        population.add_entities(20, {'init_SoC': 0.5})
+        pool = WorkerPool([population], 2)
+        pool.start()
+        try:
+            for t in range(3):
+                population.external_inputs[:, 0] = np.arange(20) + 100 * t
+                pool.step()
+        finally:
+            pool.stop()
+        # one entry and miss from before the fork, and one per entity and step
+        self.assertEqual(61, len(model.prediction_cache))
+        self.assertEqual((0, 61), (model.prediction_cache.hits, model.prediction_cache.misses))
+
+
+if __name__ == "__main__":
+    unittest.main()
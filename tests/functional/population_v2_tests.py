@@ -0,0 +1,157 @@
+import unittest
+from types import SimpleNamespace
+
+import numpy as np
+
+import memosim.simulation_v2 as sim
+from memosim.population_v2 import PopulationSimulator
+
+
+def battery_structure():
+    return SimpleNamespace(
+        model_parameters=['capacity', 'init_SoC'],
+        model_inputs=['P_el_set'],
+        model_outputs=['P_el', 'SoC'],
+        virtual_states=[SimpleNamespace(name='soc', init_attribute='init_SoC', update_attribute='SoC')])
+
+
+def ols_description():
+    return SimpleNamespace(
+        intercept=np.array([-15.4571, 4.666e-05]),
+        coefs=np.array([[0.987169, 34.1625], [-4.94224e-05, 0.998272]]))
+
+
+def krr_description(kernel):
+    rnd = np.random.RandomState(0)
+    return SimpleNamespace(kernel=kernel, gamma=0.1, degree=2, coef0=1.0,
+                           X_fit=rnd.uniform(-1, 1, (50, 2)), dual_coef=rnd.normal(size=(50, 2)))
+
+
+def create_entity(simulator, structure, init_vals):
+    sim.RegressionModelFactory.create_structure(simulator, structure)
+    sim.RegressionModelFactory.setup_initial_state(simulator, structure, init_vals)
+    return simulator
+
+
+class Test(unittest.TestCase):
+
+    def assert_population_matches_entities(self, model_factory, num_steps=5):
+        structure = battery_structure()
+        init_vals = [{'init_SoC': 0.5}, {'init_SoC': 0.2}, {'init_SoC': 0.9}]
+        population = PopulationSimulator(model_factory(), structure)
+        entities = []
+        for vals in init_vals:
+            population.add_entities(1, vals)
+            entities.append(create_entity(model_factory(), structure, vals))
+
+        rnd = np.random.RandomState(1)
+        for t in range(num_steps):
+            p_set = rnd.uniform(-1, 1, len(entities))
+            population.external_inputs[:, 0] = p_set
+            population.step()
+            for row, entity in enumerate(entities):
+                entity.external_inputs[0] = p_set[row]
+                entity.step()
+                np.testing.assert_allclose(population.state[row], entity.state)
+
+    def test_ols(self):
+        self.assert_population_matches_entities(lambda: sim.OLSModel(ols_description()))
+
+    def test_krr(self):
+        for kernel in ['linear', 'polynomial', 'sigmoid', 'rbf']:
+            description = krr_description(kernel)
+            self.assert_population_matches_entities(lambda: sim.KernelRidgeRegressionSimulator(description))
+
+    def test_generic(self):
+        from sklearn.linear_model import LinearRegression
+        rnd = np.random.RandomState(2)
+        estimator = LinearRegression().fit(rnd.normal(size=(20, 2)), rnd.normal(size=(20, 2)))
+        description = SimpleNamespace(sklearn_estimator=estimator)
+        self.assert_population_matches_entities(lambda: sim.GenericModelSimulator(description))
+
+    def test_rollout(self):
+        from sklearn.linear_model import LinearRegression
+        rnd = np.random.RandomState(3)
+        estimator = LinearRegression().fit(rnd.normal(size=(20, 2)), rnd.normal(size=(20, 2)))
+        models = [sim.OLSModel(ols_description()), sim.KernelRidgeRegressionSimulator(krr_description('rbf')),
+                  sim.GenericModelSimulator(SimpleNamespace(sklearn_estimator=estimator))]
+        schedule = rnd.uniform(-1, 1, (6, 3, 1))
+        for model in models:
+            population = PopulationSimulator(model, battery_structure())
+            population.add_entities(3, {'init_SoC': 0.5})
+            outputs = population.rollout(schedule)
+            single = model.rollout(schedule[:, 1, :], population.state[1])
+            for t in range(len(schedule)):
+                population.external_inputs[:] = schedule[t]
+                population.step()
+                np.testing.assert_allclose(population.state, outputs[t])
+                np.testing.assert_allclose(population.state[1], single[t])
+
+    def test_rollout_without_feedback(self):
+        structure = battery_structure()
+        structure.virtual_states = []
+        description = SimpleNamespace(intercept=np.array([1.0, 2.0]), coefs=np.array([[2.0], [3.0]]))
+        model = sim.OLSModel(description)
+        sim.RegressionModelFactory.create_structure(model, structure)
+        outputs = model.rollout(np.array([[1.0], [2.0]]), np.zeros(2))
+        np.testing.assert_allclose([[3.0, 5.0], [5.0, 8.0]], outputs)
+
+    def test_initial_state(self):
+        population = PopulationSimulator(sim.OLSModel(ols_description()), battery_structure())
+        rows = population.add_entities(2, {'init_SoC': 0.3})
+        self.assertEqual(range(0, 2), rows)
+        self.assertEqual(0.3, population.get_value(1, 'SoC'))
+        self.assertTrue(np.isnan(population.get_value(0, 'P_el')))
+
+    def test_bulk_creation(self):
+        population = PopulationSimulator(sim.OLSModel(ols_description()), battery_structure())
+        population.add_entities(1, {'init_SoC': 0.1})
+        rows = population.add_entities(3, {'init_SoC': [0.2, 0.3, 0.4], 'P_el': 1.0})
+        self.assertEqual(range(1, 4), rows)
+        np.testing.assert_allclose([0.1, 0.2, 0.3, 0.4], population.state[:, 1])
+        np.testing.assert_allclose([1.0, 1.0, 1.0], population.state[1:, 0])
+
+        # the arrays grow geometrically and keep their contents
+        population.external_inputs[:, 0] = 1.0
+        for _ in range(10):
+            population.add_entities(1, {'init_SoC': 0.5})
+        self.assertEqual(14, population.num_entities)
+        self.assertEqual(16, population.capacity)
+        np.testing.assert_allclose([1.0] * 4 + [0.0] * 10, population.external_inputs[:, 0])
+
+        # arrays, that have been replaced, are copied into new buffers
+        population.state = np.array(population.state)
+        population.add_entities(1, {'init_SoC': 0.6})
+        np.testing.assert_allclose([0.1, 0.2, 0.3, 0.4] + [0.5] * 10 + [0.6], population.state[:, 1])
+
+    def test_steady_state_skipping(self):
+        # the state of charge converges to 0.2 for constant set points
+        description = SimpleNamespace(intercept=np.array([0.0, 0.1]), coefs=np.array([[1.0, 0.0], [0.01, 0.5]]))
+        reference = PopulationSimulator(sim.OLSModel(description), battery_structure())
+        population = PopulationSimulator(sim.OLSModel(description), battery_structure(), skip_tolerance=1e-12)
+        entity = create_entity(sim.OLSModel(description), battery_structure(), {'init_SoC': 0.5})
+        entity.skip_tolerance = 1e-12
+        for p in [reference, population]:
+            p.add_entities(3, {'init_SoC': 0.5})
+        # the first entity receives a constant set point, the others a changing one
+        for t in range(60):
+            for p in [reference, population]:
+                p.external_inputs[:, 0] = [0.0, np.sin(t), np.cos(t)]
+                p.step()
+            entity.external_inputs[0] = 0.0
+            entity.step()
+            np.testing.assert_allclose(reference.state, population.state)
+            np.testing.assert_allclose(reference.state[0], entity.state)
+        self.assertEqual(180, population.evaluations + population.skips)
+        self.assertGreater(population.skips, 10)
+        self.assertEqual(population.skips, entity.skips)
+
+        # modified states are recomputed
+        population.state[0] = reference.state[0] = 0.1
+        for p in [reference, population]:
+            p.step()
+        np.testing.assert_allclose(reference.state, population.state)
+
+
+if __name__ == "__main__":
+    unittest.main()
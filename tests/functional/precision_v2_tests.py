@@ -0,0 +1,54 @@
+import unittest
+from types import SimpleNamespace
+
+import numpy as np
+
+import memosim.simulation_v2 as sim
+from memosim.population_v2 import PopulationSimulator
+from memosim.precision_v2 import precision_deviation
+from tests.functional.population_v2_tests import battery_structure, krr_description, ols_description
+
+
+def generic_description(estimator):
+    rnd = np.random.RandomState(2)
+    X = rnd.uniform(-1, 1, (40, 2))
+    return SimpleNamespace(sklearn_estimator=estimator.fit(X, np.column_stack([X[:, 0], 0.5 * X[:, 1]])))
+
+
+class Test(unittest.TestCase):
+
+    def test_single_precision_population(self):
+        from sklearn.ensemble import RandomForestRegressor
+        from sklearn.neural_network import MLPRegressor
+        factories = [lambda: sim.OLSModel(ols_description()),
+                     lambda: sim.KernelRidgeRegressionSimulator(krr_description('rbf')),
+                     lambda: sim.GenericModelSimulator(generic_description(MLPRegressor(hidden_layer_sizes=(8,), max_iter=20, random_state=0))),
+                     lambda: sim.GenericModelSimulator(generic_description(RandomForestRegressor(n_estimators=5, random_state=0)))]
+        schedule = np.random.RandomState(3).uniform(-1, 1, (5, 3, 1))
+        for factory in factories:
+            populations = []
+            for dtype in [np.float64, np.float32]:
+                model = factory()
+                model.set_dtype(dtype)
+                population = PopulationSimulator(model, battery_structure())
+                population.add_entities(3, {'init_SoC': 0.5})
+                for t in range(len(schedule)):
+                    population.external_inputs[:] = schedule[t]
+                    population.step()
+                self.assertEqual(dtype, population.state.dtype)
+                populations.append(population)
+            np.testing.assert_allclose(populations[0].state, populations[1].state, rtol=1e-3, atol=1e-3)
+
+    def test_precision_deviation(self):
+        schedule = np.random.RandomState(4).uniform(-1, 1, (20, 1))
+        report = precision_deviation(krr_description('rbf'), battery_structure(), schedule, {'init_SoC': 0.5},
+                                     create_simulator=sim.KernelRidgeRegressionSimulator)
+        self.assertEqual({'P_el', 'SoC'}, set(report))
+        for deviation in report.values():
+            self.assertGreater(deviation['max_abs'], 0.0)
+            self.assertLess(deviation['max_rel'], 1e-3)
+            self.assertLessEqual(deviation['mean_abs'], deviation['max_abs'])
+
+
+if __name__ == "__main__":
+    unittest.main()
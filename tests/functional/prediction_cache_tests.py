@@ -0,0 +1,59 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+import memosim.simulation_v2 as sim
+from memosim.population_v2 import PopulationSimulator
+from memosim.prediction_cache import PredictionCache
+from tests.functional.population_v2_tests import battery_structure, create_entity, krr_description
+
+
+class Test(unittest.TestCase):
+
+    def test_population(self):
+        description = krr_description('rbf')
+        reference = PopulationSimulator(sim.KernelRidgeRegressionSimulator(description), battery_structure())
+        model = sim.KernelRidgeRegressionSimulator(description)
+        model.prediction_cache = PredictionCache(resolution=1e-12)
+        population = PopulationSimulator(model, battery_structure())
+        for p in [reference, population]:
+            p.add_entities(4, {'init_SoC': 0.5})
+        for t in range(10):
+            for p in [reference, population]:
+                p.external_inputs[:, 0] = t % 2
+                p.step()
+            np.testing.assert_allclose(reference.state, population.state)
+        # all entities share the same inputs, and the model oscillates between two states
+        self.assertEqual(40, model.prediction_cache.hits + model.prediction_cache.misses)
+        self.assertGreater(model.prediction_cache.hits, 30)
+
+    def test_entity(self):
+        model = create_entity(sim.KernelRidgeRegressionSimulator(krr_description('rbf')), battery_structure(),
+                              {'init_SoC': 0.5})
+        model.prediction_cache = PredictionCache(max_entries=2)
+        inputs = [np.array([1.0, 0.5]), np.array([2.0, 0.5]), np.array([1.0, 0.5]), np.array([3.0, 0.5]),
+                  np.array([2.0, 0.5])]
+        for x in inputs:
+            np.testing.assert_allclose(model.compute_responses(x),
+                                       model.prediction_cache.responses(x, model.compute_responses))
+        self.assertEqual(1, model.prediction_cache.hits)
+        self.assertEqual(2, len(model.prediction_cache))
+
+    def test_persistence(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'predictions.npz')
+            cache = PredictionCache(path=path)
+            cache.batch_responses(np.array([[1.0, 2.0], [3.0, 4.0], [1.0, 2.0]]), lambda x: 2 * x)
+            self.assertEqual((1, 2), (cache.hits, cache.misses))
+            cache.save()
+
+            cache = PredictionCache(path=path)
+            responses = cache.batch_responses(np.array([[3.0, 4.0], [1.0, 2.0]]), lambda x: 0 * x)
+            np.testing.assert_allclose([[6.0, 8.0], [2.0, 4.0]], responses)
+            self.assertEqual(0, len(PredictionCache(resolution=0.1, path=path)))
+
+
+if __name__ == "__main__":
+    unittest.main()
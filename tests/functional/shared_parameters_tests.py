@@ -0,0 +1,74 @@
+import os
+import tempfile
+import unittest
+from types import SimpleNamespace
+
+import numpy as np
+
+import memosim.simulation_v2 as sim
+from memosim import shared_parameters
+from tests.functional.population_v2_tests import battery_structure
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.model_file = os.path.join(self.directory.name, 'model.h5')
+        open(self.model_file, 'w').close()
+        self.loads = 0
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def load(self, surrogate_model_file, surrogate_name):
+        self.loads += 1
+        rnd = np.random.RandomState(0)
+        return SimpleNamespace(kernel='rbf', gamma=0.1, degree=2, coef0=1.0, small=np.arange(3),
+                               X_fit=rnd.uniform(-1, 1, (5000, 2)), dual_coef=rnd.normal(size=(5000, 2)))
+
+    def test_load_shared(self):
+        first = shared_parameters.load_shared(self.model_file, 'krr', self.load)
+        second = shared_parameters.load_shared(self.model_file, 'krr', self.load)
+        self.assertEqual(1, self.loads)
+        self.assertIsInstance(second.X_fit, np.memmap)
+        self.assertNotIsInstance(second.small, np.memmap)
+        self.assertFalse(second.X_fit.flags.writeable)
+        np.testing.assert_array_equal(self.load(None, None).dual_coef, second.dual_coef)
+
+        # the regression model evaluates directly on the memory maps
+        model = sim.KernelRidgeRegressionSimulator(first)
+        self.assertTrue(np.shares_memory(first.X_fit, model.X_fit))
+        expected = sim.KernelRidgeRegressionSimulator(self.load(None, None))
+        sim.RegressionModelFactory.create_structure(model, battery_structure())
+        sim.RegressionModelFactory.create_structure(expected, battery_structure())
+        inputs = np.random.RandomState(1).uniform(-1, 1, (4, 2))
+        np.testing.assert_allclose(expected.compute_batch_responses(inputs), model.compute_batch_responses(inputs))
+
+    def test_modified_file(self):
+        shared_parameters.load_shared(self.model_file, 'krr', self.load)
+        stat = os.stat(self.model_file)
+        os.utime(self.model_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        shared_parameters.load_shared(self.model_file, 'krr', self.load)
+        self.assertEqual(2, self.loads)
+        # the export for the old modification time is removed
+        directory = shared_parameters.export_directory(self.model_file, 'krr')
+        self.assertEqual([os.path.basename(directory)], os.listdir(os.path.dirname(directory)))
+
+    def test_export_root(self):
+        root = os.path.join(self.directory.name, 'exports')
+        shared_parameters.load_shared(self.model_file, 'krr', self.load, root)
+        shared_parameters.load_shared(self.model_file, 'krr-2', self.load, root)
+        os.makedirs(os.path.join(root, 'krr-1.tmp-1'))
+        self.assertFalse(os.path.exists(self.model_file + '.shared'))
+        stat = os.stat(self.model_file)
+        os.utime(self.model_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        shared_parameters.load_shared(self.model_file, 'krr', self.load, root)
+        # exports of other surrogates and exports in progress are kept
+        expected = [os.path.basename(shared_parameters.export_directory(self.model_file, 'krr', root)), 'krr-1.tmp-1',
+                    'krr-2-%d' % stat.st_mtime_ns]
+        self.assertEqual(sorted(expected), sorted(os.listdir(root)))
+
+
+if __name__ == "__main__":
+    unittest.main()
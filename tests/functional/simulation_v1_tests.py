@@ -0,0 +1,127 @@
+import unittest
+from types import SimpleNamespace
+
+import numpy as np
+
+from memosim import simulation_v1
+from memosim.simulation_v1 import CombinedMetaModelSimulator, SurrogateModelSimulator, \
+    TrustedSurrogateModelSimulator, step_surrogates
+
+
+def battery_structure():
+    return SimpleNamespace(
+        model_parameters=['capacity', 'init_SoC'],
+        model_inputs=['P_el_set'],
+        model_outputs=['P_el', 'SoC'],
+        virtual_states=[SimpleNamespace(name='soc', init_attribute='init_SoC', update_attribute='SoC')])
+
+
+class LinearMetaModel(object):
+    """
+    A metamodel with the interface of memotrainer.metamodels.MetaModel.
+    """
+
+    def __init__(self, input_names, response_names, coefs):
+        self.input_names = input_names
+        self.response_names = response_names
+        self.coefs = np.array(coefs)
+
+    def predict(self, X):
+        y = np.dot(X, self.coefs.T)
+        return {name: y[:, idx] for idx, name in enumerate(self.response_names)}
+
+
+def metamodels():
+    return [LinearMetaModel(['P_el_set'], ['P_el'], [[0.9]]),
+            LinearMetaModel(['P_el_set', 'soc', 'capacity'], ['SoC'], [[0.1, 1.0, 0.01]])]
+
+
+class Test(unittest.TestCase):
+
+    def test_trusted_matches_strict(self):
+        init_vals = {'capacity': 2.0, 'init_SoC': 0.5}
+        for models in [metamodels(), LinearMetaModel(['P_el_set', 'soc'], ['P_el', 'SoC'], [[1, 0], [0.1, 1]])]:
+            strict = SurrogateModelSimulator(battery_structure(), models)
+            trusted = TrustedSurrogateModelSimulator(battery_structure(), models)
+            strict.init(**init_vals)
+            trusted.init(**init_vals)
+            for p_set in [1.0, -2.0, 0.5]:
+                strict['P_el_set'] = p_set
+                trusted['P_el_set'] = p_set
+                strict.step()
+                trusted.step()
+                for attr in ['P_el', 'SoC', 'soc', 'capacity', 'init_SoC', 'P_el_set']:
+                    self.assertEqual(strict[attr], trusted[attr])
+
+    def test_trusted_inputs_persist(self):
+        simulator = TrustedSurrogateModelSimulator(battery_structure(), metamodels())
+        simulator.init(capacity=1.0, init_SoC=0.0)
+        with self.assertRaises(Exception):
+            simulator.step()
+        simulator['P_el_set'] = 1.0
+        simulator.step()
+        simulator.step()
+        self.assertAlmostEqual(0.9, simulator['P_el'])
+        self.assertAlmostEqual(0.22, simulator['SoC'])
+        with self.assertRaises(Exception):
+            simulator['SoC'] = 1.0
+        with self.assertRaises(ValueError):
+            simulator['unknown']
+
+    def test_trusted_validation(self):
+        with self.assertRaises(Exception):
+            # SoC is not predicted
+            TrustedSurrogateModelSimulator(battery_structure(), metamodels()[:1])
+        with self.assertRaises(Exception):
+            # P_el is predicted twice
+            TrustedSurrogateModelSimulator(battery_structure(), metamodels() + metamodels()[:1])
+        with self.assertRaises(Exception):
+            TrustedSurrogateModelSimulator(battery_structure(), [LinearMetaModel(['Q_el_set'], ['P_el'], [[1]]),
+                                                                 metamodels()[1]])
+
+        simulator = TrustedSurrogateModelSimulator(battery_structure(), metamodels())
+        with self.assertRaises(Exception):
+            simulator.init(capacity=1.0)
+        with self.assertRaises(Exception):
+            simulator.init(capacity=1.0, init_SoC=0.0, eta=0.9)
+
+    def test_combined_collisions(self):
+        combined = CombinedMetaModelSimulator(metamodels())
+        self.assertEqual({'P_el': 0, 'SoC': 1}, combined.response_owners)
+        with self.assertRaises(Exception):
+            CombinedMetaModelSimulator(metamodels() + [LinearMetaModel(['P_el_set'], ['SoC'], [[1.0]])])
+
+    def test_batched_steps(self):
+        rnd = np.random.RandomState(0)
+        states = [{'P_el_set': p_set, 'soc': soc, 'capacity': 1.0} for p_set, soc in rnd.uniform(-1, 1, (100, 2))]
+        combined = CombinedMetaModelSimulator(metamodels(), min_concurrent_states=1)
+        expected = [combined.step(state) for state in states]
+        for concurrent in [True, False, True]:
+            combined.concurrent = concurrent
+            if not concurrent:
+                # the pool is created again by the next concurrent batch
+                simulation_v1.shutdown_thread_pool()
+                self.assertIsNone(simulation_v1._thread_pool)
+            for responses, expected_responses in zip(combined.step_batch(states), expected):
+                self.assertEqual(expected_responses.keys(), responses.keys())
+                for name, value in responses.items():
+                    self.assertAlmostEqual(expected_responses[name], value)
+
+        for simulator_class in [SurrogateModelSimulator, TrustedSurrogateModelSimulator]:
+            entities = [simulator_class(battery_structure(), metamodels()) for _ in range(3)]
+            batched = [simulator_class(battery_structure(), metamodels()) for _ in range(3)]
+            for idx, entity in enumerate(entities + batched):
+                entity.init(capacity=1.0 + idx % 3, init_SoC=0.1 * (idx % 3))
+            for p_set in [1.0, -2.0, 0.5]:
+                for entity, other in zip(entities, batched):
+                    entity['P_el_set'] = p_set
+                    other['P_el_set'] = p_set
+                    entity.step()
+                step_surrogates(batched)
+                for entity, other in zip(entities, batched):
+                    for attr in ['P_el', 'SoC', 'soc']:
+                        self.assertAlmostEqual(entity[attr], other[attr])
+
+
+if __name__ == "__main__":
+    unittest.main()
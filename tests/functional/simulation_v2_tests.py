@@ -0,0 +1,67 @@
+import unittest
+from types import SimpleNamespace
+
+import numpy as np
+
+import memosim.simulation_v2 as sim
+
+
+class DoubledInputAccessor(sim.ExternalInputAccessor):
+
+    def run(self):
+        return 2 * self.simulator.external_inputs[self.idx]
+
+
+class Test(unittest.TestCase):
+
+    def test_input_plan_matches_accessors(self):
+        simulator = sim.RegressionModelSimulator()
+        accessors = [sim.FeedbackInputAccessor(simulator, 2), sim.ExternalInputAccessor(simulator, 1),
+                     sim.ConstantInputAccessor(7.0), sim.ExternalInputAccessor(simulator, 0),
+                     DoubledInputAccessor(simulator, 1), sim.FeedbackInputAccessor(simulator, 0)]
+        simulator.init(2, 3, accessors, {})
+        simulator.external_inputs[:] = [1.0, 2.0]
+        simulator.state[:] = [10.0, 20.0, 30.0]
+
+        expected = [accessor.run() for accessor in accessors]
+        gathered = simulator.input_plan.gather(simulator.external_inputs, simulator.state, np.zeros(len(accessors)))
+        np.testing.assert_array_equal(expected, gathered)
+        self.assertEqual(1, len(simulator.input_plan.dynamic_accessors))
+
+    def test_input_plan_gathers_rows(self):
+        simulator = sim.RegressionModelSimulator()
+        accessors = [sim.ExternalInputAccessor(simulator, 0), sim.FeedbackInputAccessor(simulator, 1)]
+        plan = sim.InputPlan(accessors)
+        self.assertIsInstance(plan.external_positions, slice)
+
+        external_inputs = np.array([[1.0], [2.0]])
+        state = np.array([[0.0, 0.5], [0.0, 0.7]])
+        gathered = plan.gather(external_inputs, state, np.zeros((2, 2)))
+        np.testing.assert_array_equal([[1.0, 0.5], [2.0, 0.7]], gathered)
+
+    def test_krr_precomputed_kernels(self):
+        rnd = np.random.RandomState(0)
+        X_fit = rnd.uniform(-1, 1, (40, 3))
+        dual_coef = rnd.normal(size=(40, 2))
+        inputs = rnd.uniform(-1, 1, (7, 3))
+        for kernel in ['linear', 'polynomial', 'sigmoid', 'rbf']:
+            description = SimpleNamespace(kernel=kernel, gamma=0.3, degree=2, coef0=0.5, X_fit=X_fit,
+                                          dual_coef=dual_coef)
+            simulator = sim.KernelRidgeRegressionSimulator(description)
+            simulator.max_kernel_block = 3 * len(X_fit)  # forces evaluation in blocks of 3 rows
+            function = getattr(sim.KernelRidgeRegressionSimulator, kernel + '_kernel')
+            expected = [np.dot(function(x, X_fit, degree=2, gamma=0.3, coef0=0.5), dual_coef) for x in inputs]
+            np.testing.assert_allclose(expected, simulator.compute_batch_responses(inputs), rtol=1e-10)
+            np.testing.assert_allclose(expected[0], simulator.compute_responses(inputs[0]), rtol=1e-10)
+
+    def test_krr_single_output(self):
+        rnd = np.random.RandomState(1)
+        description = SimpleNamespace(kernel='rbf', gamma=None, degree=None, coef0=None,
+                                      X_fit=rnd.normal(size=(10, 2)), dual_coef=rnd.normal(size=10))
+        simulator = sim.KernelRidgeRegressionSimulator(description)
+        self.assertEqual((4, 1), simulator.compute_batch_responses(rnd.normal(size=(4, 2))).shape)
+        self.assertEqual((1,), simulator.compute_responses(rnd.normal(size=2)).shape)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,126 @@
+import unittest
+from types import SimpleNamespace
+
+import numpy as np
+
+import memosim.simulation_v2 as sim
+
+
+def training_data(num_outputs=2):
+    rnd = np.random.RandomState(0)
+    X = rnd.uniform(-1, 1, (60, 3))
+    y = np.column_stack([np.sin(X[:, 0]) + X[:, 1] * X[:, 2], np.cos(X[:, 1]) - X[:, 0]])[:, :num_outputs]
+    return X, y if num_outputs > 1 else y[:, 0]
+
+
+class Test(unittest.TestCase):
+
+    def assert_translated(self, estimator, backend, num_outputs=2, shift=0.0):
+        X, y = training_data(num_outputs)
+        estimator.fit(X + shift, y + shift)
+        simulator = sim.GenericModelSimulator(SimpleNamespace(sklearn_estimator=estimator))
+        self.assertEqual(backend, simulator.backend)
+        inputs = np.random.RandomState(1).uniform(-1, 1, (7, 3)) + shift
+        expected = np.reshape(estimator.predict(inputs), (len(inputs), -1))
+        np.testing.assert_allclose(expected, simulator.compute_batch_responses(inputs), rtol=1e-7, atol=1e-9)
+        np.testing.assert_allclose(expected[3], simulator.compute_responses(inputs[3]), rtol=1e-7, atol=1e-9)
+
+    def test_linear(self):
+        from sklearn.linear_model import Lasso, LinearRegression, Ridge
+        for estimator in [LinearRegression(), Ridge(alpha=0.5), Lasso(alpha=0.01)]:
+            self.assert_translated(estimator, 'linear')
+            self.assert_translated(estimator, 'linear', num_outputs=1)
+
+    def test_kernel_ridge(self):
+        from sklearn.kernel_ridge import KernelRidge
+        for kernel in ['linear', 'poly', 'rbf', 'sigmoid']:
+            self.assert_translated(KernelRidge(kernel=kernel, alpha=0.1), 'kernel')
+        self.assert_translated(KernelRidge(kernel='laplacian'), 'predict')
+
+    def test_svr(self):
+        from sklearn.svm import SVR
+        for kernel in ['linear', 'poly', 'rbf', 'sigmoid']:
+            self.assert_translated(SVR(kernel=kernel, gamma='scale'), 'kernel', num_outputs=1)
+
+    def test_gaussian_process(self):
+        from sklearn.gaussian_process import GaussianProcessRegressor
+        from sklearn.gaussian_process.kernels import RBF, ConstantKernel, Matern, WhiteKernel
+        for normalize_y in [False, True]:
+            kernel = ConstantKernel(2.0) * RBF(length_scale=[1.0, 2.0, 0.5]) + WhiteKernel(0.01)
+            self.assert_translated(GaussianProcessRegressor(kernel, normalize_y=normalize_y), 'kernel')
+            self.assert_translated(GaussianProcessRegressor(RBF(), normalize_y=normalize_y), 'kernel', num_outputs=1)
+        self.assert_translated(GaussianProcessRegressor(Matern()), 'predict')
+
+    def test_mlp(self):
+        from sklearn.neural_network import MLPRegressor
+        for activation in ['relu', 'tanh', 'logistic', 'identity']:
+            estimator = MLPRegressor(hidden_layer_sizes=(8, 5), activation=activation, max_iter=50, random_state=0)
+            self.assert_translated(estimator, 'mlp')
+
+    def test_folded_scalers(self):
+        from sklearn.compose import TransformedTargetRegressor
+        from sklearn.linear_model import Ridge
+        from sklearn.neural_network import MLPRegressor
+        from sklearn.pipeline import make_pipeline
+        from sklearn.preprocessing import MaxAbsScaler, MinMaxScaler, Normalizer, StandardScaler
+        mlp = MLPRegressor(hidden_layer_sizes=(8,), max_iter=50, random_state=0)
+        self.assert_translated(make_pipeline(StandardScaler(), MinMaxScaler(), mlp), 'mlp')
+        self.assert_translated(make_pipeline(MaxAbsScaler(), Ridge()), 'linear')
+        for regressor in [mlp, make_pipeline(StandardScaler(), mlp)]:
+            for num_outputs in [1, 2]:
+                estimator = TransformedTargetRegressor(regressor, transformer=StandardScaler())
+                self.assert_translated(estimator, 'mlp', num_outputs=num_outputs)
+        self.assert_translated(make_pipeline(Normalizer(), mlp), 'predict')
+
+    def test_folded_scalers_without_mean_or_std(self):
+        from sklearn.compose import TransformedTargetRegressor
+        from sklearn.linear_model import Ridge
+        from sklearn.pipeline import make_pipeline
+        from sklearn.preprocessing import StandardScaler
+        # the shift makes offsets, that sklearn does not apply, visible
+        for with_mean, with_std in [(False, True), (True, False), (False, False)]:
+            scaler = StandardScaler(with_mean=with_mean, with_std=with_std)
+            self.assert_translated(make_pipeline(scaler, Ridge()), 'linear', shift=20.0)
+            estimator = TransformedTargetRegressor(Ridge(), transformer=scaler)
+            self.assert_translated(estimator, 'linear', num_outputs=1, shift=20.0)
+            self.assert_translated(estimator, 'linear', shift=20.0)
+
+    def test_tree_ensembles(self):
+        from sklearn.ensemble import ExtraTreesRegressor, GradientBoostingRegressor, RandomForestRegressor
+        from sklearn.tree import DecisionTreeRegressor
+        self.assert_translated(DecisionTreeRegressor(max_depth=5), 'tree_ensemble')
+        for estimator in [RandomForestRegressor(n_estimators=10, random_state=0),
+                          ExtraTreesRegressor(n_estimators=10, random_state=0)]:
+            self.assert_translated(estimator, 'tree_ensemble')
+            self.assert_translated(estimator, 'tree_ensemble', num_outputs=1)
+        self.assert_translated(GradientBoostingRegressor(n_estimators=20, random_state=0), 'tree_ensemble',
+                               num_outputs=1)
+        self.assert_translated(GradientBoostingRegressor(n_estimators=20, init='zero'), 'tree_ensemble',
+                               num_outputs=1)
+
+    def test_output_buffers(self):
+        from sklearn.linear_model import LinearRegression
+        X, y = training_data()
+        estimator = LinearRegression().fit(X, y)
+        simulator = sim.GenericModelSimulator(SimpleNamespace(sklearn_estimator=estimator))
+        inputs = np.random.RandomState(1).uniform(-1, 1, (7, 3))
+        first = simulator.compute_batch_responses(inputs)
+        np.testing.assert_allclose(estimator.predict(inputs), first)
+        # smaller batches and single input vectors are evaluated without allocating new buffers
+        second = simulator.compute_batch_responses(inputs[:3])
+        self.assertTrue(np.shares_memory(first, second))
+        np.testing.assert_allclose(estimator.predict(inputs[:3]), second)
+        single = simulator.compute_responses(inputs[5])
+        self.assertIs(single.base, simulator.compute_responses(inputs[4]).base)
+        self.assertFalse(np.shares_memory(single, first))
+        # inputs of other types are copied into the input buffer
+        integers = np.array([[1, 0, -1], [0, 1, 1]])
+        np.testing.assert_allclose(estimator.predict(integers), simulator.compute_batch_responses(integers))
+
+    def test_fallback(self):
+        from sklearn.neighbors import KNeighborsRegressor
+        self.assert_translated(KNeighborsRegressor(n_neighbors=3), 'predict')
+
+
+if __name__ == "__main__":
+    unittest.main()